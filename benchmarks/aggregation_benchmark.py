@@ -0,0 +1,142 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Throughput and reduction of the edge aggregation component on synthetic high rate data.
+
+Generates --tags signals (sine with noise, random walk, steps) sampled at --rate Hz
+for --seconds, then feeds them in batches of --batch-points the way the component
+reads StreamManager, for every --window:
+
+- windowed aggregates (numpy, WindowAggregator)
+- swinging door compression (SwingingDoor), with the largest reconstruction error
+- the whole Processor path from JSON property value entries, as the component runs it
+
+and prints points per second processed and the ratio of points in to points out.
+Needs numpy, no Greengrass or StreamManager.
+
+    python3 aggregation_benchmark.py --tags 1000 --rate 10 --seconds 120 --deviation 0.5
+"""
+
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "iot-factory-cdk" / "iot_factory_cdk" / "stacks" / "edge_aggregation" / "assets"))
+from aggregator import WindowAggregator, SwingingDoor, Processor, DEFAULT_CONFIGURATION  # noqa: E402
+
+
+def synthetic(tags: int, rate: float, seconds: float, seed: int):
+    """Points of all tags in time order as (series, timestamps, values) arrays"""
+    rng = np.random.default_rng(seed)
+    steps = int(rate * seconds)
+    t = np.arange(steps) / rate
+    kinds = rng.integers(0, 3, tags)
+    signals = np.empty((tags, steps))
+    # Sine with noise, random walk and steps
+    for kind in range(3):
+        rows = np.flatnonzero(kinds == kind)
+        if kind == 0:
+            periods = rng.uniform(10, 600, (len(rows), 1))
+            signals[rows] = 50 * np.sin(2 * np.pi * t / periods) + rng.normal(0, 0.1, (len(rows), steps))
+        elif kind == 1:
+            signals[rows] = np.cumsum(rng.normal(0, 0.2, (len(rows), steps)), axis=1)
+        else:
+            signals[rows] = 10 * (np.floor(t / rng.uniform(5, 60, (len(rows), 1))) % 2)
+    # Column major flattening gives time order, all tags at t0, then all tags at t1 ...
+    series = np.tile(np.arange(tags), steps)
+    timestamps = np.repeat(t, tags) + 1.7e9
+    return series, timestamps, signals.T.ravel()
+
+
+def batches(n: int, size: int):
+    for start in range(0, n, size):
+        yield slice(start, start + size)
+
+
+def bench_aggregates(series, timestamps, values, window: float, batch: int) -> dict:
+    aggregates = DEFAULT_CONFIGURATION["Aggregates"]
+    aggregator = WindowAggregator(window, aggregates)
+    out = 0
+    started = time.perf_counter()
+    for s in batches(len(values), batch):
+        aggregator.add(series[s], timestamps[s], values[s])
+        out += len(aggregator.flush()) * len(aggregates)
+    out += len(aggregator.flush(force=True)) * len(aggregates)
+    elapsed = time.perf_counter() - started
+    return {"points_per_second": len(values) / elapsed, "reduction": len(values) / max(out, 1)}
+
+
+def bench_compression(series, timestamps, values, deviation: float, batch: int) -> dict:
+    compressor = SwingingDoor(deviation)
+    archived = []
+    started = time.perf_counter()
+    for s in batches(len(values), batch):
+        archived += compressor.add(series[s], timestamps[s], values[s])
+    elapsed = time.perf_counter() - started
+    archived += [(s, state[4], state[5]) for s, state in compressor.state.items() if state[4] is not None]
+
+    # Largest error of the linear reconstruction from the archived points, on a sample of series
+    error = 0.0
+    kept = {}
+    for s, t, v in archived:
+        kept.setdefault(s, []).append((t, v))
+    for s in list(kept)[:50]:
+        mask = series == s
+        points = sorted(kept[s])
+        reconstructed = np.interp(timestamps[mask], [p[0] for p in points], [p[1] for p in points])
+        error = max(error, float(np.max(np.abs(reconstructed - values[mask]))))
+    return {"points_per_second": len(values) / elapsed, "reduction": len(values) / max(len(archived), 1), "max_error": error}
+
+
+def bench_processor(series, timestamps, values, window: float, deviation: float, batch: int, tags: int) -> dict:
+    """Half the tags aggregated and half compressed, from JSON entries of one value like the collector writes"""
+    aliases = [f"/bench/{'agg' if s % 2 else 'sdt'}/Tag{s}" for s in range(tags)]
+    payloads = [
+        json.dumps({
+            "entryId": str(i), "propertyAlias": aliases[s],
+            "propertyValues": [{"value": {"doubleValue": v}, "quality": "GOOD",
+                                "timestamp": {"timeInSeconds": int(t), "offsetInNanos": int(t % 1 * 1e9)}}],
+        }).encode()
+        for i, (s, t, v) in enumerate(zip(series.tolist(), timestamps.tolist(), values.tolist()))
+    ]
+    processor = Processor({
+        "WindowSeconds": window, "AggregatePrefixes": ["/bench/agg/"], "CompressPrefixes": ["/bench/sdt/"],
+        "CompressionDeviation": deviation, "CompressionMaxSeconds": None,
+    })
+    started = time.perf_counter()
+    for s in batches(len(payloads), batch):
+        processor.process([json.loads(payload) for payload in payloads[s]], now=0)
+    elapsed = time.perf_counter() - started
+    return {"points_per_second": len(payloads) / elapsed, "reduction": processor.points_in / max(processor.points_out, 1)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Edge aggregation throughput on synthetic high rate data")
+    parser.add_argument("--tags", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=10, help="Samples per second per tag")
+    parser.add_argument("--seconds", type=float, default=120, help="Seconds of data generated")
+    parser.add_argument("--window", default="10,60", help="Comma separated aggregation windows in seconds")
+    parser.add_argument("--deviation", type=float, default=0.5, help="Swinging door compression deviation")
+    parser.add_argument("--batch-points", type=int, default=10000, help="Points per batch, as read from StreamManager")
+    parser.add_argument("--processor-points", type=int, default=200000, help="Points for the JSON entry path, 0 to skip")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    series, timestamps, values = synthetic(args.tags, args.rate, args.seconds, args.seed)
+    print(f"{len(values):,} points, {args.tags} tags at {args.rate} Hz for {args.seconds:.0f}s")
+    print(f"\n{'stage':<28} {'points/s':>12} {'in / out':>10} {'max error':>10}")
+    for window in [float(w) for w in args.window.split(",")]:
+        result = bench_aggregates(series, timestamps, values, window, args.batch_points)
+        print(f"{f'aggregates {window:g}s':<28} {result['points_per_second']:>12,.0f} {result['reduction']:>10.1f} {'-':>10}")
+    result = bench_compression(series, timestamps, values, args.deviation, args.batch_points)
+    print(f"{f'swinging door {args.deviation:g}':<28} {result['points_per_second']:>12,.0f} {result['reduction']:>10.1f} {result['max_error']:>10.3f}")
+    if args.processor_points:
+        n = min(args.processor_points, len(values))
+        window = float(args.window.split(",")[0])
+        result = bench_processor(series[:n], timestamps[:n], values[:n], window, args.deviation, args.batch_points, args.tags)
+        print(f"{'processor from JSON':<28} {result['points_per_second']:>12,.0f} {result['reduction']:>10.1f} {'-':>10}")
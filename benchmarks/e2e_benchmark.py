@@ -0,0 +1,233 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+End to end throughput and latency benchmark, OPC UA source to SiteWise sink.
+
+For every combination of --tags and --gateways the benchmark
+
+1. starts the OPC UA simulator (opcua-simulator/) with that many tags
+2. starts the first N gateway directories rendered by config_docker.py from
+   docker-compose.yml.template, attached to the benchmark network
+3. waits for the gateways to be healthy and for --warmup seconds
+4. measures for --duration seconds: points per second and p50/p99 source to
+   sink latency from the SiteWise stand-in (sitewise-standin/), CPU and memory
+   of every gateway container from docker stats
+5. stops the gateways and the simulator
+
+The stand-in runs on the benchmark network with the SiteWise data endpoint
+host name as network alias and a certificate from a CA generated here, which
+the gateways trust through EXTRA_CA_FILE. So the publisher sends to the
+stand-in, not to SiteWise, while the nucleus still connects to AWS IoT Core.
+
+Prerequisites: each gateway directory belongs to a SiteWise gateway whose OPC
+UA source is opc.tcp://opcua-simulator:4840 (OPCUAIP=opcua-simulator and
+OPCUAPort=4840 in iot-factory-cdk/env.sh), and openssl and docker-compose are
+installed.
+
+    python3 e2e_benchmark.py --gateway-dir ../greengrassv2-installation/docker --tags 1000,10000 --gateways 1
+"""
+
+import ssl
+import sys
+import json
+import time
+import argparse
+import subprocess
+import urllib.request
+from pathlib import Path
+
+import yaml
+
+HERE = Path(__file__).resolve().parent
+REPO = HERE.parent
+WORK_DIR = HERE / "work"
+NETWORK = "sitewise-bench"
+SIMULATOR = "opcua-simulator"
+STANDIN = "sitewise-standin"
+STANDIN_HOST_PORT = 8443
+OVERRIDE_FILE = "docker-compose.benchmark.yml"
+TAGS_PER_MACHINE = 100
+MACHINES_PER_LINE = 10
+
+
+def docker(*args, check: bool = True) -> str:
+    return subprocess.run(["docker", *args], capture_output=True, text=True, check=check).stdout
+
+
+def create_tls(region: str) -> Path:
+    """CA and server certificate for the SiteWise data endpoint host name"""
+    tls = WORK_DIR / "tls"
+    tls.mkdir(parents=True, exist_ok=True)
+    host = f"data.iotsitewise.{region}.amazonaws.com"
+    if (tls / "server.pem").exists():
+        return tls
+    openssl = lambda *args: subprocess.run(["openssl", *args], cwd=tls, check=True, capture_output=True)
+    openssl("req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "30", "-subj", "/CN=sitewise-standin-ca",
+            "-keyout", "ca.key", "-out", "ca.pem")
+    openssl("req", "-newkey", "rsa:2048", "-nodes", "-subj", f"/CN={host}", "-keyout", "server.key", "-out", "server.csr")
+    (tls / "san.cnf").write_text(f"subjectAltName=DNS:{host}\n")
+    openssl("x509", "-req", "-in", "server.csr", "-CA", "ca.pem", "-CAkey", "ca.key", "-CAcreateserial",
+            "-days", "30", "-extfile", "san.cnf", "-out", "server.pem")
+    return tls
+
+
+def start_standin(tls: Path, region: str):
+    docker("rm", "-f", STANDIN, check=False)
+    docker(
+        "run", "-d", "--name", STANDIN, "--network", NETWORK,
+        "--network-alias", f"data.iotsitewise.{region}.amazonaws.com",
+        "-p", f"{STANDIN_HOST_PORT}:443",
+        "-v", f"{REPO / 'sitewise-standin'}:/standin:ro", "-v", f"{tls}:/tls:ro",
+        "python:3.11-slim", "python3", "/standin/standin.py", "--cert", "/tls/server.pem", "--key", "/tls/server.key",
+    )
+
+
+def standin(path: str, tls: Path, method: str = "GET") -> dict:
+    context = ssl.create_default_context(cafile=str(tls / "ca.pem"))
+    context.check_hostname = False
+    request = urllib.request.Request(f"https://localhost:{STANDIN_HOST_PORT}{path}", method=method, data=b"" if method == "POST" else None)
+    with urllib.request.urlopen(request, context=context, timeout=30) as response:
+        return json.loads(response.read())
+
+
+def start_simulator(tags: int, rates: str):
+    machines = max(1, tags // TAGS_PER_MACHINE)
+    lines = max(1, machines // MACHINES_PER_LINE)
+    docker("rm", "-f", SIMULATOR, check=False)
+    docker(
+        "run", "-d", "--name", SIMULATOR, "--network", NETWORK, "--network-alias", SIMULATOR,
+        "-v", f"{REPO / 'opcua-simulator' / 'certs'}:/simulator/certs",
+        "opcua-simulator:latest",
+        "--lines", str(lines), "--machines", str(max(1, machines // lines)), "--tags", str(TAGS_PER_MACHINE),
+        "--rates", rates,
+    )
+
+
+def write_override(gateway_dir: Path, tls: Path) -> str:
+    """Compose override attaching a gateway to the benchmark network and trusting the stand-in CA"""
+    with open(gateway_dir / "docker-compose.yml") as f:
+        compose = yaml.safe_load(f)
+    name, service = next(iter(compose["services"].items()))
+    override = {
+        "version": compose.get("version", "3.7"),
+        "services": {name: {
+            "networks": [NETWORK],
+            "volumes": [f"{tls}:/tmp/benchmark:ro"],
+            "environment": {"EXTRA_CA_FILE": "/tmp/benchmark/ca.pem"},
+        }},
+        "networks": {NETWORK: {"external": True}},
+    }
+    with open(gateway_dir / OVERRIDE_FILE, "w") as f:
+        yaml.safe_dump(override, f)
+    return service["container_name"]
+
+
+def compose(gateway_dir: Path, *args):
+    subprocess.run(
+        ["docker-compose", "-f", "docker-compose.yml", "-f", OVERRIDE_FILE, *args],
+        cwd=gateway_dir, check=True, capture_output=True,
+    )
+
+
+def wait_healthy(containers: list, timeout: float):
+    deadline = time.monotonic() + timeout
+    pending = set(containers)
+    while pending and time.monotonic() < deadline:
+        for container in list(pending):
+            if docker("inspect", "--format", "{{.State.Health.Status}}", container, check=False).strip() == "healthy":
+                pending.discard(container)
+        time.sleep(5)
+    if pending:
+        raise RuntimeError(f"Gateways not healthy after {timeout:.0f}s: {sorted(pending)}")
+
+
+def sample_stats(containers: list) -> dict:
+    """CPU percent and memory bytes of each container from one docker stats sample"""
+    output = docker("stats", "--no-stream", "--format", "{{.Name}} {{.CPUPerc}} {{.MemUsage}}", *containers)
+    units = {"B": 1, "KiB": 1 << 10, "MiB": 1 << 20, "GiB": 1 << 30}
+    samples = {}
+    for line in output.strip().splitlines():
+        name, cpu, memory = line.split(" ", 2)
+        used = memory.split("/")[0].strip()
+        number = used.rstrip("BKMGi")
+        samples[name] = (float(cpu.rstrip("%")), float(number) * units[used[len(number):]])
+    return samples
+
+
+def run_cell(tags: int, gateway_dirs: list, args, tls: Path) -> dict:
+    print(f"Benchmark {tags} tags on {len(gateway_dirs)} gateways", flush=True)
+    start_simulator(tags, args.rates)
+    containers = [write_override(gateway_dir, tls) for gateway_dir in gateway_dirs]
+    try:
+        for gateway_dir in gateway_dirs:
+            compose(gateway_dir, "--compatibility", "up", "-d", "--no-build")
+        wait_healthy(containers, args.start_timeout)
+        time.sleep(args.warmup)
+
+        since = time.time()
+        samples = {container: [] for container in containers}
+        while time.time() - since < args.duration:
+            for name, sample in sample_stats(containers).items():
+                samples.setdefault(name, []).append(sample)
+            time.sleep(args.sample_interval)
+        stats = standin(f"/stats?since={since}", tls)
+    finally:
+        for gateway_dir in gateway_dirs:
+            compose(gateway_dir, "down")
+        docker("rm", "-f", SIMULATOR, check=False)
+
+    resources = {
+        name: {
+            "cpu_percent_avg": sum(c for c, _ in values) / len(values),
+            "memory_bytes_peak": max(m for _, m in values),
+        }
+        for name, values in samples.items() if values
+    }
+    return {"tags": tags, "gateways": len(gateway_dirs), **stats, "containers": resources}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and latency from the OPC UA simulator to a SiteWise stand-in")
+    parser.add_argument("--gateway-dir", action="append", required=True, help="Rendered gateway directory, repeatable")
+    parser.add_argument("--tags", default="1000,10000", help="Comma separated total tag counts")
+    parser.add_argument("--gateways", default="1", help="Comma separated gateway counts, at most the number of --gateway-dir")
+    parser.add_argument("--rates", default="1:1", help="Simulator update rate tiers")
+    parser.add_argument("--region", required=True, help="Region of the gateways, for the SiteWise endpoint name")
+    parser.add_argument("--warmup", type=float, default=120, help="Seconds after healthy before measuring")
+    parser.add_argument("--duration", type=float, default=300, help="Seconds measured per cell")
+    parser.add_argument("--sample-interval", type=float, default=10, help="Seconds between docker stats samples")
+    parser.add_argument("--start-timeout", type=float, default=900, help="Seconds for gateways to become healthy")
+    parser.add_argument("--output", default=str(WORK_DIR / "e2e-results.json"))
+    args = parser.parse_args()
+
+    gateway_dirs = [Path(d).resolve() for d in args.gateway_dir]
+    tag_counts = [int(t) for t in args.tags.split(",")]
+    gateway_counts = [int(g) for g in args.gateways.split(",")]
+    if max(gateway_counts) > len(gateway_dirs):
+        print(f"--gateways {max(gateway_counts)} needs as many --gateway-dir, got {len(gateway_dirs)}")
+        sys.exit(1)
+
+    docker("network", "create", NETWORK, check=False)
+    docker("build", "-t", "opcua-simulator:latest", str(REPO / "opcua-simulator"))
+    tls = create_tls(args.region)
+    start_standin(tls, args.region)
+
+    results = []
+    try:
+        for tags in tag_counts:
+            for count in gateway_counts:
+                results.append(run_cell(tags, gateway_dirs[:count], args, tls))
+                with open(args.output, "w") as f:
+                    json.dump(results, f, indent=2)
+    finally:
+        docker("rm", "-f", STANDIN, check=False)
+
+    print(f"\n{'tags':>9} {'gateways':>9} {'points/s':>10} {'p50 s':>8} {'p99 s':>8} {'cpu % avg':>10} {'mem MiB peak':>13}")
+    for r in results:
+        cpu = max((c["cpu_percent_avg"] for c in r["containers"].values()), default=0)
+        memory = max((c["memory_bytes_peak"] for c in r["containers"].values()), default=0) / (1 << 20)
+        p50 = f"{r['latency_p50_s']:.2f}" if r["latency_p50_s"] is not None else "-"
+        p99 = f"{r['latency_p99_s']:.2f}" if r["latency_p99_s"] is not None else "-"
+        print(f"{r['tags']:>9} {r['gateways']:>9} {r['points_per_second']:>10.0f} {p50:>8} {p99:>8} {cpu:>10.1f} {memory:>13.0f}")
+    print(f"Results written to {args.output}")
@@ -0,0 +1,230 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Disk footprint of an outage backlog, default path against the columnar outage buffer.
+
+Generates the property values --tags tags sampled at --rate Hz produce during an outage of
+--seconds (doubles with noise, integer counters and booleans with millisecond source
+timestamps), as the collector writes them to StreamManager, one JSON entry of
+--values-per-message values per message. Then compares:
+
+- default: the JSON messages StreamManager keeps on disk in the publisher stream (payload
+  bytes only, its own framing comes on top)
+- columnar: the segments of the outage buffer component (Segment.encode), and the CPU the
+  component spends decoding them into entries of 10 values (drain_entries, serialized to JSON)
+
+and prints bytes per point, points per second encoded and decoded by the component, and the
+messages of the backlog the publisher reads from its stream after reconnect.
+
+With --sitewise-endpoint both backlogs are also drained into the SiteWise stand-in
+(sitewise-standin/standin.py), pre-filled as they are when the connection comes back. The
+publisher is emulated: it reads the messages in order and sends up to 10 entries per
+BatchPutAssetPropertyValue request on one connection, retrying throttled or failed requests and
+error entries. On the columnar path the messages are handed over no faster than
+--drain-points-per-second, as the component drains its segments. The drain time ends when the
+stand-in has stored every point, and throttling set on the stand-in (--max-requests-per-second,
+--latency-ms) applies to both paths alike. The real publisher batches and retries on its own
+terms, so the absolute times are those of this emulation, the ratio between the paths is the
+result. Needs only the python standard library.
+
+    python3 outage_buffer_benchmark.py --tags 1000 --rate 1 --seconds 600
+    python3 ../sitewise-standin/standin.py --port 8080 --max-requests-per-second 20 &
+    python3 outage_buffer_benchmark.py --tags 100 --rate 1 --seconds 600 --sitewise-endpoint http://localhost:8080
+"""
+
+import ssl
+import sys
+import json
+import time
+import random
+import argparse
+import http.client
+import urllib.parse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "iot-factory-cdk" / "iot_factory_cdk" / "stacks" / "outage_buffer" / "assets"))
+from outage_buffer import Segment, drain_entries, DEFAULT_CONFIGURATION  # noqa: E402
+
+MAX_ENTRIES_PER_REQUEST = 10
+
+
+def synthetic(tags: int, rate: float, seconds: float, values_per_message: int, seed: int) -> list:
+    """JSON payloads of PutAssetPropertyValueEntry in arrival order"""
+    rng = random.Random(seed)
+    kinds = [rng.choice(["double", "double", "integer", "boolean"]) for _ in range(tags)]
+    state = [rng.uniform(0, 100) if kind == "double" else 0 for kind in kinds]
+    start = 1.7e9
+    steps = int(rate * seconds)
+    payloads, pending = [], [[] for _ in range(tags)]
+    for step in range(steps):
+        for tag in range(tags):
+            # Millisecond source timestamps with a little jitter around the sampling interval
+            t = round(start + step / rate + rng.uniform(0, 0.02), 3)
+            kind = kinds[tag]
+            if kind == "double":
+                state[tag] += rng.gauss(0, 0.5)
+                value = {"doubleValue": round(state[tag], 4)}
+            elif kind == "integer":
+                state[tag] += rng.randint(0, 3)
+                value = {"integerValue": state[tag]}
+            else:
+                value = {"booleanValue": rng.random() < 0.1}
+            pending[tag].append({
+                "value": value, "quality": "GOOD",
+                "timestamp": {"timeInSeconds": int(t), "offsetInNanos": int(round(t % 1, 3) * 1e9)},
+            })
+            if len(pending[tag]) == values_per_message:
+                payloads.append(json.dumps({
+                    "entryId": str(len(payloads)), "propertyAlias": f"/Simulation/Line{tag % 10}/Machine{tag}/Tag",
+                    "propertyValues": pending[tag],
+                }).encode())
+                pending[tag] = []
+    return payloads
+
+
+def bench_default(payloads: list, points: int) -> dict:
+    return {
+        "bytes": sum(len(payload) for payload in payloads),
+        "write_seconds": None,
+        "decode_seconds": None,
+        "messages": len(payloads),
+    }
+
+
+def bench_columnar(payloads: list, points: int, segment_points: int, level: int) -> dict:
+    started = time.perf_counter()
+    segments, segment = [], Segment()
+    for payload in payloads:
+        segment.add([json.loads(payload)])
+        if segment.points >= segment_points:
+            segments.append(segment.encode(level))
+            segment = Segment()
+    if segment.points:
+        segments.append(segment.encode(level))
+    write_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    entries, drained = 0, 0
+    for data in segments:
+        for n, entry in drain_entries(data):
+            json.dumps(entry).encode()
+            entries += 1
+            drained += n
+    decode_seconds = time.perf_counter() - started
+    if drained != points:
+        raise RuntimeError(f"Drained {drained} of {points} points")
+    return {
+        "bytes": sum(len(data) for data in segments),
+        "write_seconds": write_seconds,
+        "decode_seconds": decode_seconds,
+        "messages": entries,
+        "segments": segments,
+    }
+
+
+class Standin:
+    """Client of the SiteWise stand-in on one kept alive connection"""
+
+    def __init__(self, endpoint: str):
+        url = urllib.parse.urlsplit(endpoint)
+        if url.scheme == "https":
+            # The stand-in certificate is made for the SiteWise data endpoint name, not this host
+            self.connection = http.client.HTTPSConnection(url.netloc, timeout=30, context=ssl._create_unverified_context())
+        else:
+            self.connection = http.client.HTTPConnection(url.netloc, timeout=30)
+
+    def request(self, method: str, path: str, body: dict = None) -> tuple:
+        self.connection.request(method, path, body=json.dumps(body).encode() if body is not None else None,
+                                headers={"Content-Type": "application/json"})
+        response = self.connection.getresponse()
+        return response.status, json.loads(response.read() or b"{}")
+
+
+def paced(entries, points_per_second: float):
+    """Yields the (points, entry) of entries no faster than points_per_second, 0 for no limit"""
+    started, handed = time.perf_counter(), 0
+    for n, entry in entries:
+        if points_per_second:
+            ahead = handed / points_per_second - (time.perf_counter() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+        handed += n
+        yield n, entry
+
+
+def bench_drain(endpoint: str, entries, points: int) -> dict:
+    """Sends (points, entry) in order to the stand-in the way the publisher drains its stream"""
+    standin = Standin(endpoint)
+    standin.request("POST", "/reset", {})
+    started = time.perf_counter()
+    entries = iter(entries)
+    pending, requests, retries, backoff = [], 0, 0, 0
+    while True:
+        while len(pending) < MAX_ENTRIES_PER_REQUEST:
+            item = next(entries, None)
+            if item is None:
+                break
+            pending.append(item[1])
+        if not pending:
+            break
+        batch, pending = pending[:MAX_ENTRIES_PER_REQUEST], pending[MAX_ENTRIES_PER_REQUEST:]
+        for i, entry in enumerate(batch):
+            entry["entryId"] = str(i)
+        status, response = standin.request("POST", "/properties", {"entries": batch})
+        requests += 1
+        if status != 200:
+            # Throttled or failed, the whole batch goes again after a backoff
+            retries += 1
+            pending = batch + pending
+            time.sleep(min(0.05 * 2 ** backoff, 2))
+            backoff += 1
+            continue
+        backoff = 0
+        failed = {error["entryId"] for error in response.get("errorEntries", [])}
+        retries += len(failed)
+        pending = [entry for entry in batch if entry["entryId"] in failed] + pending
+    seconds = time.perf_counter() - started
+    _, stats = standin.request("GET", "/stats")
+    if stats["points"] != points:
+        raise RuntimeError(f"The stand-in stored {stats['points']} of {points} points")
+    return {"drain_seconds": seconds, "requests": requests, "retries": retries}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Outage backlog footprint, default path against columnar segments")
+    parser.add_argument("--tags", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=1, help="Samples per second per tag")
+    parser.add_argument("--seconds", type=float, default=600, help="Outage length in seconds")
+    parser.add_argument("--values-per-message", type=int, default=1, help="Values per collector entry")
+    parser.add_argument("--segment-points", type=int, default=DEFAULT_CONFIGURATION["SegmentMaxPoints"])
+    parser.add_argument("--compression-level", type=int, default=DEFAULT_CONFIGURATION["CompressionLevel"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sitewise-endpoint", help="URL of the SiteWise stand-in to measure the drain against, e.g. http://localhost:8080")
+    parser.add_argument("--drain-points-per-second", type=float, default=DEFAULT_CONFIGURATION["DrainPointsPerSecond"],
+                        help="DrainPointsPerSecond of the component, 0 for no limit")
+    args = parser.parse_args()
+
+    payloads = synthetic(args.tags, args.rate, args.seconds, args.values_per_message, args.seed)
+    points = len(payloads) * args.values_per_message
+    print(f"{points:,} points in {len(payloads):,} messages, {args.tags} tags at {args.rate} Hz for {args.seconds:.0f}s")
+    default = bench_default(payloads, points)
+    columnar = bench_columnar(payloads, points, args.segment_points, args.compression_level)
+    if args.sitewise_endpoint:
+        default.update(bench_drain(args.sitewise_endpoint, ((args.values_per_message, json.loads(payload)) for payload in payloads), points))
+        columnar.update(bench_drain(args.sitewise_endpoint, paced(
+            (item for data in columnar["segments"] for item in drain_entries(data)), args.drain_points_per_second
+        ), points))
+
+    print(f"\n{'path':<10} {'MB':>9} {'bytes/pt':>9} {'encode pts/s':>13} {'decode pts/s':>13} {'messages':>10}"
+          f" {'drain s':>9} {'drain pts/s':>12} {'requests':>10} {'retries':>8}")
+    for name, result in [("default", default), ("columnar", columnar)]:
+        encode = f"{points / result['write_seconds']:,.0f}" if result["write_seconds"] else "-"
+        decode = f"{points / result['decode_seconds']:,.0f}" if result["decode_seconds"] else "-"
+        if "drain_seconds" in result:
+            drain = (f"{result['drain_seconds']:>9.1f} {points / result['drain_seconds']:>12,.0f}"
+                     f" {result['requests']:>10,} {result['retries']:>8,}")
+        else:
+            drain = f"{'-':>9} {'-':>12} {'-':>10} {'-':>8}"
+        print(f"{name:<10} {result['bytes'] / 2 ** 20:>9.2f} {result['bytes'] / points:>9.1f} {encode:>13} "
+              f"{decode:>13} {result['messages']:>10,} {drain}")
@@ -0,0 +1,345 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Backfill the history of gateways into SiteWise with bulk import jobs, next to live publishing.
+
+Replaying days of outage backlog through the SiteWise publisher competes with
+fresh data for the publisher and the BatchPutAssetPropertyValue quota. This
+tool takes the history out of that path:
+
+1. claims the sealed segments of the outage buffer component of each
+   --gateway-dir (volumes/gg_root/work/com.iotfactory.SiteWiseOutageBuffer/segments),
+   except the one the component is draining
+   by moving them to volumes/backfill/claimed/, and reads --entries files of
+   PutAssetPropertyValueEntry JSON lines, one entry per line
+2. maps each property alias, renamed by --alias-map, to its SiteWise time series
+   with DescribeTimeSeries, e.g. line1/stampingpress1/temperature of the
+   SiteWiseAsset stack, and converts the values to its data type. Values of
+   unknown aliases or of another type are counted and skipped
+3. writes CSV chunks (or Parquet with pyarrow) of --chunk-rows values and
+   uploads them to the bucket under <prefix><run id>/
+4. submits bulk import jobs of --files-per-job files, at most
+   --max-active-jobs at a time, and waits for them
+5. deletes the claimed segments once every job has completed, otherwise keeps
+   them for the next run, which picks them up again
+
+The bucket and the role SiteWise reads it with are the BackfillBucketName and
+BackfillRoleArn outputs of the stack (Backfill in iot-factory-cdk/env.sh), or
+--bucket and --job-role-arn. Set "Drain": false in the outage buffer
+configuration to leave the whole backlog to this tool. --s3-endpoint and
+--sitewise-endpoint point it at the stand-ins in sitewise-standin/ for tests.
+
+    sudo python3 backfill.py --gateway-dir . --gateway-dir gateways/line1
+    python3 backfill.py --entries history.jsonl --region us-east-1 --bucket backfill \\
+        --job-role-arn arn:aws:iam::000000000000:role/standin \\
+        --s3-endpoint http://localhost:9000 --sitewise-endpoint http://localhost:8080
+"""
+
+import os
+import re
+import sys
+import csv
+import json
+import time
+import shutil
+import argparse
+from pathlib import Path
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent / "iot-factory-cdk" / "iot_factory_cdk" / "stacks" / "outage_buffer" / "assets"))
+from outage_buffer import decode, QUALITIES, SEGMENT_SUFFIX  # noqa: E402
+
+BUFFER_COMPONENT = "com.iotfactory.SiteWiseOutageBuffer"
+DEFAULT_STACK_NAME = "IotFactoryCdkStack"
+# Bulk import files have no header row, the job names the columns
+COLUMNS = ["ALIAS", "DATA_TYPE", "TIMESTAMP_SECONDS", "TIMESTAMP_NANO_OFFSET", "QUALITY", "VALUE"]
+TERMINAL_STATUSES = {"COMPLETED", "COMPLETED_WITH_FAILURES", "FAILED", "CANCELLED"}
+
+
+def claim_segments(gateway_dir: str, move: bool = True) -> list:
+    """Move the sealed outage buffer segments of a gateway out of the component's reach, or only list them"""
+    gateway = Path(gateway_dir)
+    segments = gateway / "volumes" / "gg_root" / "work" / BUFFER_COMPONENT / "segments"
+    claimed = gateway / "volumes" / "backfill" / "claimed"
+    pending = sorted(segments.glob(f"*{SEGMENT_SUFFIX}")) if segments.is_dir() else []
+    if not move:
+        return sorted(claimed.glob(f"*{SEGMENT_SUFFIX}")) + pending
+    claimed.mkdir(parents=True, exist_ok=True)
+    for path in pending:
+        # A rename on the same file system. The component renames the segment it drains to .draining
+        # first, whichever rename comes second fails, so a segment is either drained or claimed
+        try:
+            os.replace(path, claimed / path.name)
+        except FileNotFoundError:
+            pass
+    return sorted(claimed.glob(f"*{SEGMENT_SUFFIX}"))
+
+
+def read_segments(paths: list):
+    """Yields (alias, variant, timestamp in nanoseconds, value, quality) of outage buffer segments"""
+    for path in paths:
+        for alias, variant, timestamps, values, qualities in decode(path.read_bytes()):
+            for timestamp, value, quality in zip(timestamps, values, qualities):
+                yield alias, variant, timestamp, value, QUALITIES[quality]
+
+
+def read_entries(file: str):
+    """Yields (alias, variant, timestamp in nanoseconds, value, quality) of PutAssetPropertyValueEntry JSON lines"""
+    with open(file) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            for v in entry["propertyValues"]:
+                variant, value = next(iter(v["value"].items()))
+                timestamp = v["timestamp"]["timeInSeconds"] * 1000000000 + v["timestamp"].get("offsetInNanos", 0)
+                yield entry["propertyAlias"], variant, timestamp, value, v.get("quality", "GOOD")
+
+
+def convert(variant: str, value, data_type: str) -> str:
+    """VALUE column of a value for a time series of data_type, None when it does not fit"""
+    if data_type == "STRING":
+        return str(value).lower() if variant == "booleanValue" else str(value)
+    if variant == "stringValue":
+        return None
+    if data_type == "DOUBLE":
+        return None if variant == "booleanValue" else repr(float(value))
+    if data_type == "INTEGER":
+        if variant == "doubleValue" and not float(value).is_integer():
+            return None
+        return str(int(value))
+    if data_type == "BOOLEAN":
+        return str(bool(value)).lower() if variant == "booleanValue" or value in (0, 1) else None
+    return None
+
+
+class AliasMapper:
+    """Alias to (SiteWise alias, data type) through --alias-map and DescribeTimeSeries, cached"""
+
+    def __init__(self, sitewise, alias_map: dict = None):
+        self.sitewise = sitewise
+        self.alias_map = alias_map or {}
+        self.resolved = {}
+        self.skipped = {}
+
+    def resolve(self, alias: str) -> tuple:
+        if alias not in self.resolved:
+            target = self.alias_map.get(alias, alias)
+            try:
+                time_series = self.sitewise.describe_time_series(alias=target)
+                self.resolved[alias] = (target, time_series["dataType"])
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ResourceNotFoundException":
+                    raise
+                self.resolved[alias] = None
+        return self.resolved[alias]
+
+    def skip(self, alias: str, reason: str):
+        key = (alias, reason)
+        self.skipped[key] = self.skipped.get(key, 0) + 1
+
+
+class ChunkWriter:
+    """Bulk import files of at most chunk_rows values in a staging directory"""
+
+    def __init__(self, directory: Path, file_format: str, chunk_rows: int):
+        self.directory = directory
+        self.file_format = file_format
+        self.chunk_rows = chunk_rows
+        self.files = []
+        self.rows = []
+        self.values = 0
+        directory.mkdir(parents=True, exist_ok=True)
+
+    def add(self, row: list):
+        self.rows.append(row)
+        self.values += 1
+        if len(self.rows) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        path = self.directory / f"chunk-{len(self.files) + 1:06d}.{self.file_format}"
+        if self.file_format == "csv":
+            with open(path, "w", newline="") as f:
+                csv.writer(f).writerows(self.rows)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            # Timestamps as int64, the other columns as strings like in the CSV files
+            columns = dict(zip(COLUMNS, (list(column) for column in zip(*self.rows))))
+            pq.write_table(pa.table(columns), path)
+        self.files.append(path)
+        self.rows = []
+
+
+def write_chunks(history, mapper: AliasMapper, writer: ChunkWriter):
+    for alias, variant, timestamp, value, quality in history:
+        resolved = mapper.resolve(alias)
+        if resolved is None:
+            mapper.skip(alias, "no time series")
+            continue
+        target, data_type = resolved
+        converted = convert(variant, value, data_type)
+        if converted is None:
+            mapper.skip(alias, f"{variant} for {data_type}")
+            continue
+        writer.add([target, data_type, timestamp // 1000000000, timestamp % 1000000000, quality, converted])
+    writer.flush()
+
+
+def upload(s3, bucket: str, prefix: str, files: list, workers: int) -> list:
+    keys = [f"{prefix}{path.name}" for path in files]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda pair: s3.upload_file(str(pair[0]), bucket, pair[1]), zip(files, keys)))
+    return keys
+
+
+def unsupported_options(sitewise, args) -> list:
+    """Options the installed botocore does not know, 1.28 predates Parquet, adaptive ingestion and file deletion"""
+    model = sitewise.meta.service_model
+    members = model.operation_model("CreateBulkImportJob").input_shape.members
+    unsupported = [option for option, member in (("--adaptive-ingestion", "adaptiveIngestion"), ("--delete-files", "deleteFilesAfterImport"))
+                   if getattr(args, option[2:].replace("-", "_")) and member not in members]
+    if args.format == "parquet" and "parquet" not in model.shape_for("FileFormat").members:
+        unsupported.append("--format parquet")
+    return unsupported
+
+
+def run_jobs(sitewise, bucket: str, prefix: str, keys: list, args, run_id: str) -> dict:
+    """Submit the files in jobs of args.files_per_job, keeping args.max_active_jobs running, returns {job id: status}"""
+    if args.format == "csv":
+        file_format = {"csv": {"columnNames": COLUMNS}}
+    else:
+        file_format = {"parquet": {}}
+    groups = [keys[i:i + args.files_per_job] for i in range(0, len(keys), args.files_per_job)]
+    active, statuses = {}, {}
+    while groups or active:
+        while groups and len(active) < args.max_active_jobs:
+            group = groups.pop(0)
+            options = {}
+            # Only sent when set, so that older botocore releases without them can run jobs
+            if args.adaptive_ingestion:
+                options["adaptiveIngestion"] = True
+            if args.delete_files:
+                options["deleteFilesAfterImport"] = True
+            job = sitewise.create_bulk_import_job(
+                jobName=f"backfill-{run_id}-{len(statuses) + len(active) + 1}",
+                jobRoleArn=args.job_role_arn,
+                files=[{"bucket": bucket, "key": key} for key in group],
+                errorReportLocation={"bucket": bucket, "prefix": f"{prefix}errors/"},
+                jobConfiguration={"fileFormat": file_format},
+                **options,
+            )
+            active[job["jobId"]] = len(group)
+            print(f"Job {job['jobName']} ({job['jobId']}) submitted with {len(group)} files")
+        time.sleep(args.poll_seconds)
+        for job_id in list(active):
+            status = sitewise.describe_bulk_import_job(jobId=job_id)["jobStatus"]
+            if status in TERMINAL_STATUSES:
+                statuses[job_id] = status
+                print(f"Job {job_id} {status}")
+                del active[job_id]
+    return statuses
+
+
+def gateway_region(gateway_dir: str) -> str:
+    config = (Path(gateway_dir) / "volumes" / "config" / "config.yaml").read_text()
+    return re.search(r'awsRegion: "(.*)"', config).group(1)
+
+
+def stack_outputs(session, stack_name: str) -> dict:
+    stack = session.resource("cloudformation").Stack(stack_name)
+    return {output["OutputKey"]: output["OutputValue"] for output in stack.outputs or []}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill gateway history into SiteWise with bulk import jobs")
+    parser.add_argument("--gateway-dir", action="append", default=[], help="Gateway directory whose outage buffer segments to import, repeatable")
+    parser.add_argument("--entries", action="append", default=[], help="File of PutAssetPropertyValueEntry JSON lines, repeatable")
+    parser.add_argument("--alias-map", help="JSON file of {gateway alias: SiteWise alias}")
+    parser.add_argument("--region", help="AWS region, from the first gateway's config.yaml by default")
+    parser.add_argument("--stack-name", default=DEFAULT_STACK_NAME, help="Stack whose outputs name the bucket and the job role")
+    parser.add_argument("--bucket", help="Bucket for the import files, BackfillBucketName of the stack by default")
+    parser.add_argument("--prefix", default="backfill/", help="Key prefix of the import files")
+    parser.add_argument("--job-role-arn", help="Role SiteWise reads the bucket with, BackfillRoleArn of the stack by default")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="Parquet needs pyarrow")
+    parser.add_argument("--chunk-rows", type=int, default=1000000, help="Values per import file")
+    parser.add_argument("--files-per-job", type=int, default=10)
+    parser.add_argument("--max-active-jobs", type=int, default=5, help="Jobs running at once, SiteWise allows 10 per account")
+    parser.add_argument("--adaptive-ingestion", action="store_true", help="Compute metrics and transforms for the imported data")
+    parser.add_argument("--delete-files", action="store_true", help="Let SiteWise delete the import files after the import")
+    parser.add_argument("--workers", type=int, default=8, help="Parallel uploads")
+    parser.add_argument("--poll-seconds", type=float, default=30)
+    parser.add_argument("--work-dir", default="volumes/backfill", help="Staging directory of the import files")
+    parser.add_argument("--dry-run", action="store_true", help="Map and write the import files, but leave the segments and do not upload or import")
+    parser.add_argument("--s3-endpoint", help="S3 endpoint URL, e.g. the S3 stand-in http://localhost:9000")
+    parser.add_argument("--sitewise-endpoint", help="SiteWise endpoint URL, e.g. the SiteWise stand-in http://localhost:8080")
+    args = parser.parse_args()
+
+    if not args.gateway_dir and not args.entries:
+        print("Nothing to backfill, pass --gateway-dir or --entries")
+        sys.exit(1)
+    region = args.region or (gateway_region(args.gateway_dir[0]) if args.gateway_dir else None)
+    session = boto3.Session(region_name=region)
+    s3 = session.client("s3", endpoint_url=args.s3_endpoint)
+    sitewise = session.client(
+        "iotsitewise", endpoint_url=args.sitewise_endpoint,
+        # A custom endpoint serves both the api. and data. operations
+        config=Config(inject_host_prefix=False) if args.sitewise_endpoint else None,
+    )
+    unsupported = unsupported_options(sitewise, args)
+    if unsupported:
+        print(f"boto3 {boto3.__version__} does not support {', '.join(unsupported)}, upgrade boto3 or leave them out")
+        sys.exit(1)
+    if not args.dry_run and (not args.bucket or not args.job_role_arn):
+        outputs = stack_outputs(session, args.stack_name)
+        args.bucket = args.bucket or outputs.get("BackfillBucketName")
+        args.job_role_arn = args.job_role_arn or outputs.get("BackfillRoleArn")
+        if not args.bucket or not args.job_role_arn:
+            print(f"Stack {args.stack_name} has no backfill bucket, set Backfill in env.sh or pass --bucket and --job-role-arn")
+            sys.exit(1)
+    alias_map = None
+    if args.alias_map:
+        with open(args.alias_map) as f:
+            alias_map = json.load(f)
+
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    claimed = [path for gateway_dir in args.gateway_dir for path in claim_segments(gateway_dir, move=not args.dry_run)]
+    print(f"Run {run_id}: {len(claimed)} outage buffer segments and {len(args.entries)} entry files")
+
+    def history():
+        yield from read_segments(claimed)
+        for file in args.entries:
+            yield from read_entries(file)
+
+    mapper = AliasMapper(sitewise, alias_map)
+    writer = ChunkWriter(Path(args.work_dir) / run_id, args.format, args.chunk_rows)
+    write_chunks(history(), mapper, writer)
+    print(f"{writer.values:,} values of {sum(1 for r in mapper.resolved.values() if r)} time series in {len(writer.files)} files")
+    for (alias, reason), count in sorted(mapper.skipped.items()):
+        print(f"  skipped {count:,} values of {alias}: {reason}")
+    if args.dry_run or not writer.files:
+        print(f"Import files in {writer.directory}" if writer.files else "Nothing to import")
+        sys.exit(0)
+
+    prefix = f"{args.prefix}{run_id}/"
+    keys = upload(s3, args.bucket, prefix, writer.files, args.workers)
+    print(f"Uploaded {len(keys)} files to s3://{args.bucket}/{prefix}")
+    statuses = run_jobs(sitewise, args.bucket, prefix, keys, args, run_id)
+    if all(status == "COMPLETED" for status in statuses.values()):
+        for path in claimed:
+            path.unlink()
+        shutil.rmtree(writer.directory)
+        print(f"Backfill complete, {writer.values:,} values imported")
+    else:
+        print(f"Some jobs did not complete, see s3://{args.bucket}/{prefix}errors/. "
+              f"Claimed segments are kept and imported again by the next run")
+        sys.exit(1)
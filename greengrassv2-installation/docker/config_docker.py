@@ -9,10 +9,15 @@ import glob
 import json
 import urllib
 import re
+import tempfile
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import boto3
 from botocore.config import Config
 from botocore.exceptions import ClientError, ProfileNotFound
+import shared_store
+from staged_writer import StagedWriter
+from render_journal import RenderJournal, COMPLETE, inputs_hash
 
 parser = argparse.ArgumentParser()
 group = parser.add_mutually_exclusive_group(required=False)
@@ -28,6 +33,68 @@ group.add_argument(
     required=False,
     help="Clear all docker configuration files from volumes directories",
 )
+parser.add_argument(
+    "--clean-gateway",
+    action="append",
+    required=False,
+    help="Only clean this gateway, 'default' for the docker/ directory or a name under ./gateways/, repeatable",
+)
+parser.add_argument(
+    "--clean-only",
+    action="append",
+    choices=["certs", "config", "logs", "deployments", "gg_root"],
+    required=False,
+    help="Only clean this artifact class, repeatable. The shared artifact store is never cleaned",
+)
+parser.add_argument(
+    "--resource-profile",
+    default="medium",
+    required=False,
+    help="Resource profile from templates/profiles.json for heap, GC, CPU and memory limits",
+)
+parser.add_argument(
+    "--exporter-port",
+    default="9110",
+    required=False,
+    help="Host port for the gateway readiness and metrics endpoint, unique per gateway on a host",
+)
+parser.add_argument(
+    "--recent-values-port",
+    default="9120",
+    required=False,
+    help="Host port for the recent values query API of the gateway, unique per gateway on a host",
+)
+parser.add_argument(
+    "--shared-store",
+    required=False,
+    help="Host directory of the shared Greengrass artifact store to link into volumes/gg_root, e.g. ./volumes/shared",
+)
+parser.add_argument(
+    "--csr",
+    action="store_true",
+    required=False,
+    help="Generate the private key locally and issue the certificate from a CSR instead of reading it from Parameter Store, "
+    "implied for a stack deployed with CertificateFromCsr",
+)
+parser.add_argument(
+    "--fleet",
+    required=False,
+    help="JSON file listing additional gateways to render under ./gateways/<name>/, implies --csr",
+)
+parser.add_argument(
+    "--batch-size",
+    type=int,
+    default=50,
+    required=False,
+    help="Gateways issued, written and recorded in the render journal together",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=os.cpu_count(),
+    required=False,
+    help="Processes generating private keys and threads registering certificates",
+)
 
 FILE_PATH_WARNING = """
 *************************************************************************
@@ -45,6 +112,33 @@ GITIGNORE_CONTENT = """*
 !.gitignore
 """
 
+PROFILES_FILE = "./templates/profiles.json"
+# AppCDS archive built into the image by PREBAKE_INSTALL=true
+CDS_ARCHIVE_PATH = "/opt/greengrassv2/greengrass.jsa"
+# -Xlog:cds output of the nucleus JVM, holds a "UseSharedSpaces:" line when it runs without the archive
+CDS_LOG_PATH = "/greengrass/v2/logs/cds.log"
+SIZE_UNITS = {"k": 1 << 10, "m": 1 << 20, "g": 1 << 30}
+FLEET_DIR = "./gateways"
+DEFAULT_GATEWAY = "default"
+# Paths relative to a gateway directory removed for each artifact class,
+# gg_root first as it contains the logs and deployment state paths
+ARTIFACT_CLASSES = {
+    "gg_root": ["volumes/gg_root"],
+    "certs": ["volumes/certs"],
+    "config": ["volumes/config", "docker-compose.yml"],
+    "logs": ["volumes/gg_root/logs"],
+    "deployments": ["volumes/gg_root/deployments", "volumes/gg_root/config"],
+}
+# Classes whose cleaning removes the deployed components from the nucleus
+REDEPLOY_CLASSES = ["gg_root", "deployments"]
+REDEPLOY_NOTICE = (
+    "The cleaned gateways start without their components, a deployment that already succeeded is not sent again. "
+    "Revise the deployment of the thing group to redeploy them, from the AWS IoT Greengrass console or by "
+    "running 'cdk deploy' after a component version change in env.sh"
+)
+TEMPLATE_FILES = ["./templates/config.yaml.template", "./templates/docker-compose.yml.template"]
+KEY_SIZE = 2048
+
 
 def replace(data: dict, match: str, repl):
     """Replace variable with replacement text"""
@@ -87,25 +181,67 @@ def verify_cwd():
         )
 
 
-def clean_config(dirs_to_clean: list):
-    """remove all docker volume files, restore to unconfigured state, which
-    is empty directories with a `.gitignore` file to not include any content
-    when committing code changes
-
-    :param dirs_to_clean: directories to clean out
-    :type dirs_to_clean: list
+def clean_config(gateway_dirs: list, artifact_classes: list = list(ARTIFACT_CLASSES), workers: int = None):
+    """remove docker volume files of gateways, restore to unconfigured state,
+    which is empty directories with a `.gitignore` file to not include any
+    content when committing code changes
+
+    Each directory is renamed aside and recreated empty first, so the gateway
+    can be configured again right away, then all renamed directories are
+    deleted in parallel. Cleaning deployments keeps the installed nucleus and
+    component artifacts, the nucleus starts again from volumes/config/config.yaml
+    without components. AWS IoT Jobs does not deliver a deployment again that
+    already succeeded on the thing, so the components come back with the next
+    revision of the deployment, not on their own (REDEPLOY_NOTICE).
+
+    :param gateway_dirs: gateway directories to clean
+    :type gateway_dirs: list
+    :param artifact_classes: keys of ARTIFACT_CLASSES to clean
+    :type artifact_classes: list
+    :param workers: threads deleting directories
+    :type workers: int
     """
 
     print("Cleaning Docker volumes...")
-    for dir in dirs_to_clean:
-        path = Path(dir)
-        if path.exists():
-            print(f"Deleting files in {path}")
-            shutil.rmtree(path)
-        os.mkdir(path)
-        with open(path / ".gitignore", "w") as f:
-            f.write(GITIGNORE_CONTENT)
-        print(f"Directory '{dir} cleaned")
+    trash = []
+    for gateway_dir in gateway_dirs:
+        for artifact_class in [c for c in ARTIFACT_CLASSES if c in artifact_classes]:
+            for relative in ARTIFACT_CLASSES[artifact_class]:
+                path = Path(gateway_dir, relative)
+                if path.is_file():
+                    path.unlink()
+                    continue
+                if path.is_dir():
+                    aside = tempfile.mkdtemp(dir=path.parent, prefix=f".{path.name}.deleting-")
+                    os.rename(path, Path(aside, path.name))
+                    trash.append(aside)
+                    print(f"Deleting files in {path}")
+                elif path.parent.name != "volumes":
+                    continue
+                path.mkdir(parents=True)
+                if path.parent.name == "volumes":
+                    with open(path / ".gitignore", "w") as f:
+                        f.write(GITIGNORE_CONTENT)
+        init_config = Path(gateway_dir, "volumes/config/config.yaml")
+        if "deployments" in artifact_classes and init_config.is_file():
+            # gg_root/config does not exist yet on a gateway that never started or whose gg_root was cleaned
+            restart_config = Path(gateway_dir, "volumes/gg_root/config/config.yaml")
+            restart_config.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy(init_config, restart_config)
+        print(f"Gateway '{gateway_dir}' cleaned: {', '.join(artifact_classes)}")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(shutil.rmtree, trash))
+    if any(c in artifact_classes for c in REDEPLOY_CLASSES):
+        print(REDEPLOY_NOTICE)
+
+
+def gateway_directories(names: list = None) -> list:
+    """Directories of the named gateways, all configured gateways when names is empty"""
+    if not names:
+        fleet_dirs = sorted(p for p in Path(FLEET_DIR).glob("[!.]*") if p.is_dir())
+        return [Path("."), *fleet_dirs]
+    return [Path(".") if name == DEFAULT_GATEWAY else Path(FLEET_DIR, name) for name in names]
 
 
 def check_for_config(dirs_to_check: list, config_files: list):
@@ -183,6 +319,149 @@ def read_parameter(
     return response["Parameter"]["Value"]
 
 
+def parse_size(size: str) -> int:
+    """Convert a docker/JVM style size such as '512m' or '2g' to bytes"""
+    size = str(size).strip().lower()
+    if size and size[-1] in SIZE_UNITS:
+        return int(float(size[:-1]) * SIZE_UNITS[size[-1]])
+    return int(size)
+
+
+def jvm_options(profile: dict) -> str:
+    """Build the nucleus JVM flags for a resource profile"""
+    options = [f"-Xmx{profile['heap']}", f"-Xms{profile['heap']}", f"-XX:+Use{profile['gc']}"]
+    if profile.get("cds"):
+        # -Xshare:auto falls back when the image has no archive or the nucleus jar is not
+        # the one it was dumped for, -Xlog:cds records why without writing to the console
+        options += [f"-XX:SharedArchiveFile={CDS_ARCHIVE_PATH}", "-Xshare:auto", f"-Xlog:cds=info:file={CDS_LOG_PATH}"]
+    return " ".join(options)
+
+
+def read_profile(name: str, profiles_file: str = PROFILES_FILE) -> dict:
+    """
+    Read a resource profile and return the template values for the
+    docker-compose.yml and config.yaml templates
+    """
+
+    with open(Path(profiles_file)) as f:
+        profiles = json.load(f)
+    if name not in profiles:
+        print(f"Profile '{name}' not found in {profiles_file}, available profiles: {list(profiles)}")
+        sys.exit(1)
+    profile = profiles[name]
+    if parse_size(profile["heap"]) >= parse_size(profile["memory_limit"]):
+        print(
+            f"Profile '{name}' heap {profile['heap']} does not fit the container memory limit {profile['memory_limit']}"
+        )
+        sys.exit(1)
+    return {
+        "PROFILE_NAME": name,
+        "JVM_OPTIONS": jvm_options(profile),
+        "CPU_LIMIT": str(profile["cpus"]),
+        "CPU_SHARES": str(profile["cpu_shares"]),
+        "MEMORY_LIMIT": profile["memory_limit"],
+        "MEMORY_RESERVATION": profile["memory_reservation"],
+    }
+
+
+def read_fleet(fleet_file: str) -> list:
+    """
+    Read the fleet file, a JSON object with a list of gateways:
+
+        {"gateways": [{"name": "line1", "exporter_port": "9111", "resource_profile": "small"}]}
+
+    exporter_port must be unique per host, resource_profile defaults to --resource-profile,
+    recent_values_port defaults to exporter_port + 10
+    """
+
+    with open(Path(fleet_file)) as f:
+        gateways = json.load(f)["gateways"]
+    for g in gateways:
+        g.setdefault("recent_values_port", str(int(g["exporter_port"]) + 10))
+    names = [g["name"] for g in gateways]
+    ports = [str(g["exporter_port"]) for g in gateways] + [str(g["recent_values_port"]) for g in gateways]
+    if len(set(names)) != len(names) or len(set(ports)) != len(ports):
+        print(f"Gateway names, exporter ports and recent values ports in {fleet_file} must be unique")
+        sys.exit(1)
+    for name in names:
+        if not re.fullmatch(r"[A-Za-z0-9_-]+", name):
+            print(f"Gateway name '{name}' may only contain letters, digits, '_' and '-'")
+            sys.exit(1)
+    return gateways
+
+
+def generate_key_and_csr(thing_name: str) -> tuple:
+    """
+    Generate an RSA private key and a certificate signing request for it,
+    runs in a worker process as key generation is CPU bound
+    """
+
+    # Only needed for --csr, so the default flow works with boto3 alone
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=KEY_SIZE)
+    csr = (
+        x509.CertificateSigningRequestBuilder()
+        .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, thing_name)]))
+        .sign(key, hashes.SHA256())
+    )
+    private_key_pem = key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.TraditionalOpenSSL,
+        encryption_algorithm=serialization.NoEncryption(),
+    ).decode("utf-8")
+    return private_key_pem, csr.public_bytes(serialization.Encoding.PEM).decode("utf-8")
+
+
+def register_certificate(
+    session: boto3.Session, thing_name: str, csr_pem: str, policy_name: str, thing_group_name: str
+) -> str:
+    """
+    Create the thing if needed, add it to the deployment thing group and
+    issue an active certificate for the CSR with the stack IoT policy attached.
+    Returns the certificate PEM
+    """
+
+    iot = session.client("iot")
+    try:
+        iot.create_thing(thingName=thing_name)
+        iot.add_thing_to_thing_group(thingGroupName=thing_group_name, thingName=thing_name)
+        response = iot.create_certificate_from_csr(certificateSigningRequest=csr_pem, setAsActive=True)
+        iot.attach_policy(policyName=policy_name, target=response["certificateArn"])
+        iot.attach_thing_principal(thingName=thing_name, principal=response["certificateArn"])
+    except ClientError as e:
+        print(f"Error registering certificate for thing {thing_name}, {e}")
+        sys.exit(1)
+    return response["certificatePem"]
+
+
+def issue_certificates(
+    session: boto3.Session, thing_names: list, policy_name: str, thing_group_name: str, workers: int
+) -> tuple:
+    """
+    Generate keys in a process pool and register their CSRs concurrently,
+    private keys never leave this host. Returns {thing_name: (certificate_pem,
+    private_key_pem)} of the issued certificates and the thing names that
+    failed, so certificates issued before a failure are not lost
+    """
+
+    print(f"Generating {len(thing_names)} private keys with {workers} workers")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        keys = dict(zip(thing_names, executor.map(generate_key_and_csr, thing_names)))
+    print(f"Issuing {len(thing_names)} certificates from CSRs")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            name: executor.submit(register_certificate, session, name, keys[name][1], policy_name, thing_group_name)
+            for name in thing_names
+        }
+    # register_certificate exits on errors, the future holds the SystemExit
+    issued = {name: (future.result(), keys[name][0]) for name, future in futures.items() if future.exception() is None}
+    return issued, [name for name in thing_names if name not in issued]
+
+
 def replace_variables(file: str, map: dict):
     """
     Replace ${TOKEN} from file with key/values in map
@@ -195,6 +474,50 @@ def replace_variables(file: str, map: dict):
     return template
 
 
+def render_gateway(
+    writer: StagedWriter, gateway_dir: Path, values: dict, certificate_pem: str, private_key_pem: str, root_ca_pem: str
+):
+    """
+    Stage the certificates, config.yaml and docker-compose.yml of one gateway
+    directory, written when the writer is committed
+
+    A new fleet gateway directory is moved into place as a whole. Existing
+    gateway directories, including the default gateway which is the docker/
+    directory itself, keep their gg_root/: the files of the certs/ and config/
+    volumes are replaced inside the mounted directories and docker-compose.yml,
+    staged last, marks the configuration complete.
+    """
+
+    if len(str((gateway_dir / "volumes/gg_root/ipc.socket").absolute())) > 103:
+        print(FILE_PATH_WARNING)
+
+    # process template files
+    config_template = replace_variables(
+        file="./templates/config.yaml.template", map=values
+    )
+    docker_compose_template = replace_variables(
+        file="./templates/docker-compose.yml.template", map=values
+    )
+    certs = {
+        "device.pem.crt": certificate_pem,
+        "private.pem.key": (private_key_pem, 0o600),
+        "AmazonRootCA1.pem": root_ca_pem,
+    }
+
+    if not gateway_dir.exists():
+        files = {f"volumes/certs/{name}": content for name, content in certs.items()}
+        files["volumes/config/config.yaml"] = config_template
+        files["docker-compose.yml"] = docker_compose_template
+        writer.stage_directory(gateway_dir, files, directories=["volumes/gg_root"])
+        return
+
+    writer.stage_directory(gateway_dir / "volumes/certs", dict(certs, **{".gitignore": GITIGNORE_CONTENT}))
+    writer.stage_directory(
+        gateway_dir / "volumes/config", {"config.yaml": config_template, ".gitignore": GITIGNORE_CONTENT}
+    )
+    writer.stage_file(gateway_dir / "docker-compose.yml", docker_compose_template)
+
+
 if __name__ == "__main__":
     # Confirm profile given as parameters
     args = parser.parse_args()
@@ -210,14 +533,36 @@ if __name__ == "__main__":
     config_values = {}
 
     verify_cwd()
-    # if --clean, clear all directories and exit
-    if args.clean:
-        clean_config(docker_config_directories)
+    fleet = read_fleet(args.fleet) if args.fleet else []
+    journal = RenderJournal()
+    # if --clean, clear all or the selected directories and exit
+    if args.clean or args.clean_gateway or args.clean_only:
+        clean_dirs = gateway_directories(args.clean_gateway)
+        for gateway_dir in clean_dirs:
+            if not gateway_dir.is_dir():
+                print(f"Gateway directory {gateway_dir} not found")
+                sys.exit(1)
+        artifact_classes = args.clean_only or list(ARTIFACT_CLASSES)
+        clean_config(clean_dirs, artifact_classes, args.workers)
+        # A fully cleaned gateway is rendered from scratch on the next run,
+        # partially cleaned ones are found stale and regenerated
+        if not args.clean_only:
+            for gateway_dir in clean_dirs:
+                journal.forget(gateway_dir)
+            journal.save()
         sys.exit(0)
 
-    # check for contents in certs/ config and /gg_root/, alert and exit
+    # check for contents in certs/ config and /gg_root/ of gateways not
+    # rendered or held by a previous run, alert and exit
+    journaled = journal.directories()
+    gateway_dirs = [str(Path(".")), *[str(Path(FLEET_DIR, g["name"])) for g in fleet]]
     check_for_config(
-        dirs_to_check=docker_config_directories, config_files=template_files
+        dirs_to_check=[
+            str(Path(gateway_dir, d))
+            for gateway_dir in gateway_dirs if gateway_dir not in journaled
+            for d in docker_config_directories
+        ],
+        config_files=template_files,
     )
 
     # read cdk.out for stack details or use --region and --stackname
@@ -241,27 +586,49 @@ if __name__ == "__main__":
         sys.exit(1)
     # Set values for template
     # stackEnvironment = [d["OutputValue"] for d in stack.outputs if d['OutputKey'] == 'StackEnv'][0]
-    for output in stack.outputs:
+    outputs = {output["OutputKey"]: output["OutputValue"] for output in stack.outputs}
+    for key, value in outputs.items():
         # print(output["OutputKey"])
-        if output["OutputKey"] == f'StackEnv':
-            print(output["OutputValue"])
-        elif output["OutputKey"] == "CredentialProviderEndpointAddress":
-            config_values["CREDENTIAL_PROVIDER_ENDPOINT"] = output["OutputValue"]
-        elif output["OutputKey"] == "DataAtsEndpointAddress":
-            config_values["DATA_ATS_ENDPOINT"] = output["OutputValue"]
-        elif output["OutputKey"] == 'IotRoleAliasName':
-            config_values["IOT_ROLE_ALIAS"] = output["OutputValue"]
-        elif output["OutputKey"] ==  'ThingArn':
-            config_values["THING_NAME"] = output["OutputValue"].split("/")[-1]
-        elif output["OutputKey"] == f'CertificatePemParameter':
-            certificate_pem = read_parameter(
-                parameter=output["OutputValue"], session=session
-            )
-        elif output["OutputKey"] == f'PrivateKeySecretParameter':
-            private_key_pem = read_parameter(
-                parameter=output["OutputValue"], session=session, with_decryption=True
-            )
+        if key == f'StackEnv':
+            print(value)
+        elif key == "CredentialProviderEndpointAddress":
+            config_values["CREDENTIAL_PROVIDER_ENDPOINT"] = value
+        elif key == "DataAtsEndpointAddress":
+            config_values["DATA_ATS_ENDPOINT"] = value
+        elif key == 'IotRoleAliasName':
+            config_values["IOT_ROLE_ALIAS"] = value
+        elif key ==  'ThingArn':
+            config_values["THING_NAME"] = value.split("/")[-1]
     config_values["AWS_REGION"] = region
+    config_values["GATEWAY_ID"] = config_values["ACCOUNT_NUMBER"]
+    config_values["BUILD_CONTEXT"] = "."
+    config_values.update(read_profile(args.resource_profile))
+    config_values["EXPORTER_HOST_PORT"] = args.exporter_port
+    config_values["RECENT_VALUES_HOST_PORT"] = args.recent_values_port
+
+    # One entry per gateway directory: (directory, template values)
+    gateways = [(Path("."), config_values)]
+    for gateway in fleet:
+        values = dict(config_values)
+        values["THING_NAME"] = f"{stackname}-{gateway['name']}"
+        values["GATEWAY_ID"] = gateway["name"]
+        values["BUILD_CONTEXT"] = "../.."
+        values.update(read_profile(gateway.get("resource_profile", args.resource_profile)))
+        values["EXPORTER_HOST_PORT"] = str(gateway["exporter_port"])
+        values["RECENT_VALUES_HOST_PORT"] = str(gateway["recent_values_port"])
+        gateways.append((Path(FLEET_DIR, gateway["name"]), values))
+
+    # Skip gateways a previous run completed, regenerate missing or stale ones
+    pending = []
+    for gateway_dir, values in gateways:
+        inputs = inputs_hash(values, TEMPLATE_FILES)
+        if journal.status(values["THING_NAME"], gateway_dir, inputs) == COMPLETE:
+            print(f"Gateway {values['THING_NAME']} in {gateway_dir} is complete, skipping")
+        else:
+            pending.append((gateway_dir, values, inputs))
+    print(f"{len(pending)} of {len(gateways)} gateways to configure")
+    if not pending:
+        sys.exit(0)
 
     # Read root CA
     with urllib.request.urlopen(
@@ -269,22 +636,73 @@ if __name__ == "__main__":
     ) as response:
         root_ca_pem = response.read().decode("utf-8")
 
-    # process template files
-    config_template = replace_variables(
-        file="./templates/config.yaml.template", map=config_values
-    )
-    docker_compose_template = replace_variables(
-        file="./templates/docker-compose.yml.template", map=config_values
-    )
+    # A stack deployed with CertificateFromCsr has no certificate in Parameter Store to read
+    csr = args.csr or bool(fleet) or "CertificatePemParameter" not in outputs
+    if args.csr and "CertificatePemParameter" in outputs and any(gateway_dir == Path(".") for gateway_dir, _, _ in pending):
+        print(
+            f"Warning: certificate {outputs.get('CertificateArn')} issued by the stack stays active, with its private key in "
+            f"Parameter Store. Deploy the stack with CertificateFromCsr=\"true\" in env.sh to not issue it"
+        )
+
+    Path(FLEET_DIR).mkdir(exist_ok=True)
+    for start in range(0, len(pending), args.batch_size):
+        batch = pending[start:start + args.batch_size]
+
+        # Keep the certificate of gateways that were written or held before,
+        # so a rerun does not issue and orphan certificates
+        certificates = {}
+        for gateway_dir, values, _ in batch:
+            reusable = journal.reusable_certificate(values["THING_NAME"], gateway_dir)
+            if reusable:
+                certificates[values["THING_NAME"]] = reusable
+        missing = [values["THING_NAME"] for _, values, _ in batch if values["THING_NAME"] not in certificates]
+        failed = []
+        if missing and csr:
+            # Private keys are generated here and only the CSR is sent to AWS IoT
+            issued, failed = issue_certificates(
+                session,
+                missing,
+                policy_name=outputs["IotPolicyArn"].split("/")[-1],
+                thing_group_name=outputs["ThingGroupName"],
+                workers=args.workers,
+            )
+            certificates.update(issued)
+        elif missing:
+            certificates[config_values["THING_NAME"]] = (
+                read_parameter(parameter=outputs["CertificatePemParameter"], session=session),
+                read_parameter(parameter=outputs["PrivateKeySecretParameter"], session=session, with_decryption=True),
+            )
+
+        # Hold the certificates and directories of the batch before anything is
+        # written, a rerun after a failure reuses them and resumes the directories
+        for gateway_dir, values, _ in batch:
+            if values["THING_NAME"] in certificates:
+                journal.hold(values["THING_NAME"], gateway_dir, *certificates[values["THING_NAME"]])
+        journal.save()
+        if failed:
+            print(f"No certificate issued for {', '.join(failed)}, the {len(issued)} issued are kept for the next run")
+            sys.exit(1)
 
-    # Write the files!
-    with open(Path("./volumes/certs/device.pem.crt"), "w") as f:
-        f.write(certificate_pem)
-    with open(Path("./volumes/certs/private.pem.key"), "w") as f:
-        f.write(private_key_pem)
-    with open(Path("./volumes/certs/AmazonRootCA1.pem"), "w") as f:
-        f.write(root_ca_pem)
-    with open(Path("./volumes/config/config.yaml"), "w") as f:
-        f.write(config_template)
-    with open(Path("./docker-compose.yml"), "w") as f:
-        f.write(docker_compose_template)
+        # Stage the whole batch before anything is moved into place, so a
+        # failure part way through leaves no half written gateway behind
+        writer = StagedWriter()
+        try:
+            for gateway_dir, values, _ in batch:
+                certificate_pem, private_key_pem = certificates[values["THING_NAME"]]
+                render_gateway(writer, gateway_dir, values, certificate_pem, private_key_pem, root_ca_pem)
+            writer.commit()
+        except BaseException:
+            writer.abort()
+            raise
+        for gateway_dir, values, inputs in batch:
+            journal.record(values["THING_NAME"], gateway_dir, inputs)
+        journal.save()
+
+    for gateway_dir, values, _ in pending:
+        print(f"Configured gateway {values['THING_NAME']} in {gateway_dir}")
+
+        # Link immutable component artifacts from the host store so this gateway
+        # does not download and keep its own copy
+        if args.shared_store:
+            counts = shared_store.seed(Path(args.shared_store), gateway_dir / "volumes/gg_root")
+            print(f"Linked shared artifacts from {args.shared_store}: {counts}")
@@ -0,0 +1,277 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Plan how many gateway containers fit on each host from measured footprints.
+
+The inventory file lists the hosts with their capacity and the gateways with
+the docker-compose.yml rendered by config_docker.py, their resource profile
+and their expected collector throughput:
+
+    {
+        "hosts": [
+            {"name": "edge-1", "cpus": 8, "memory": "16g", "disk": "200g", "points_per_second": 20000}
+        ],
+        "gateways": [
+            {"name": "account-a", "compose": "../account-a/docker-compose.yml",
+             "profile": "small", "points_per_second": 400}
+        ]
+    }
+
+Footprints come, in order of preference, from the running containers
+(--measure, docker stats and the size of the mounted Greengrass root), from
+profiles-results.json written by profile_gateway.py, or from the profile
+memory reservation and CPU limit. Gateways are placed first fit decreasing by
+their largest share of any host resource. The plan and one compose file per
+host, with all paths made absolute, are written to the output directory.
+
+    python3 density_planner.py inventory.json --measure --output plan/
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+from pathlib import Path
+
+import yaml
+
+from config_docker import read_profile, parse_size
+from profile_gateway import read_rss, RESULTS_FILE
+
+RESOURCES = ["cpus", "memory", "disk", "points_per_second"]
+DEFAULT_HEADROOM = 0.2
+
+
+def read_compose(compose_file: Path) -> dict:
+    with open(compose_file) as f:
+        return yaml.safe_load(f)
+
+
+def container_names(compose: dict) -> list:
+    return [service.get("container_name", name) for name, service in compose["services"].items()]
+
+
+def directory_size(path: str) -> tuple:
+    """Bytes of the files under path with one link, and {"device:inode": bytes} of the hard linked ones"""
+    total, shared = 0, {}
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                stat = os.lstat(os.path.join(dirpath, name))
+            except OSError:
+                continue
+            # Hard linked shared artifacts take disk once per host, charged when placed, not per gateway
+            if stat.st_nlink > 1:
+                shared[f"{stat.st_dev}:{stat.st_ino}"] = stat.st_size
+            else:
+                total += stat.st_size
+    return total, shared
+
+
+def measure_containers(names: list, samples: int) -> dict:
+    """Sample docker stats for running containers, keeping mean CPU and peak
+    resident memory from the container cgroup"""
+
+    measured = {}
+    for _ in range(samples):
+        output = subprocess.run(
+            ["docker", "stats", "--no-stream", "--format", "{{.Name}}\t{{.CPUPerc}}", *names],
+            capture_output=True, text=True,
+        ).stdout
+        for line in output.splitlines():
+            name, cpu = line.split("\t")
+            entry = measured.setdefault(name, {"cpu_samples": [], "memory": 0})
+            entry["cpu_samples"].append(float(cpu.rstrip("%")) / 100)
+            entry["memory"] = max(entry["memory"], read_rss(name))
+    for name, entry in measured.items():
+        inspect = subprocess.run(
+            ["docker", "inspect", "--format", "{{range .Mounts}}{{.Destination}}={{.Source}}\n{{end}}", name],
+            capture_output=True, text=True,
+        ).stdout
+        mounts = dict(line.split("=", 1) for line in inspect.splitlines() if "=" in line)
+        entry["disk"], entry["shared"] = directory_size(mounts["/greengrass/v2"]) if "/greengrass/v2" in mounts else (0, {})
+        entry["cpus"] = sum(entry.pop("cpu_samples")) / samples
+    return measured
+
+
+def gateway_footprint(gateway: dict, measured: dict, profile_results: dict) -> tuple:
+    """Resolve the footprint of one gateway from measurements, recorded
+    profile results, or the profile reservation, in that order. Returns the
+    footprint, whose disk leaves out hard linked files, and those files as
+    {"device:inode": bytes}, known only from measurements"""
+
+    footprint = {"points_per_second": float(gateway.get("points_per_second", 0))}
+    shared = {}
+    names = gateway["containers"]
+    profile = gateway.get("profile", "medium")
+    if names and all(name in measured for name in names):
+        for n in names:
+            shared.update(measured[n]["shared"])
+        footprint.update(
+            cpus=sum(measured[n]["cpus"] for n in names),
+            memory=sum(measured[n]["memory"] for n in names),
+            disk=sum(measured[n]["disk"] for n in names),
+            shared_disk=sum(shared.values()),
+            source="measured",
+        )
+    elif profile in profile_results:
+        result = profile_results[profile]
+        footprint.update(
+            cpus=result["cpus"], memory=result["rss_peak_bytes"], disk=result["disk_bytes"], source="profile-results"
+        )
+    else:
+        values = read_profile(profile)
+        footprint.update(
+            cpus=float(values["CPU_LIMIT"]),
+            memory=parse_size(values["MEMORY_RESERVATION"]),
+            disk=parse_size(gateway.get("disk", "2g")),
+            source="profile-reservation",
+        )
+    return footprint, shared
+
+
+def host_capacity(host: dict, headroom: float) -> dict:
+    usable = 1 - headroom
+    return {
+        "cpus": float(host["cpus"]) * usable,
+        "memory": parse_size(host["memory"]) * usable,
+        "disk": parse_size(host["disk"]) * usable,
+        "points_per_second": float(host.get("points_per_second", float("inf"))) * usable,
+    }
+
+
+def plan(gateways: list, hosts: list, headroom: float) -> dict:
+    """First fit decreasing placement of gateways onto hosts. The hard linked
+    files of a gateway ("shared") take disk on a host only if no gateway placed
+    there before links them"""
+
+    capacities = {host["name"]: host_capacity(host, headroom) for host in hosts}
+    free = {name: dict(capacity) for name, capacity in capacities.items()}
+    linked = {name: set() for name in capacities}
+    largest = {r: max(c[r] for c in capacities.values()) for r in RESOURCES}
+
+    def needed(gateway, host):
+        shared = gateway.get("shared", {})
+        added = sum(size for inode, size in shared.items() if inode not in linked[host])
+        return dict(gateway["footprint"], disk=gateway["footprint"]["disk"] + added)
+
+    def dominant_share(gateway):
+        footprint = dict(gateway["footprint"], disk=gateway["footprint"]["disk"] + sum(gateway.get("shared", {}).values()))
+        return max((footprint[r] / largest[r] for r in RESOURCES if largest[r]), default=0)
+
+    placement = {name: [] for name in capacities}
+    unplaced = []
+    for gateway in sorted(gateways, key=dominant_share, reverse=True):
+        for name in placement:
+            footprint = needed(gateway, name)
+            if all(footprint[r] <= free[name][r] for r in RESOURCES):
+                for r in RESOURCES:
+                    free[name][r] -= footprint[r]
+                linked[name].update(gateway.get("shared", {}))
+                placement[name].append(gateway["name"])
+                break
+        else:
+            unplaced.append(gateway["name"])
+
+    # How many gateways of the average footprint each host could hold, with
+    # the hard linked files of all gateways on it once
+    shared_total = sum({inode: size for g in gateways for inode, size in g.get("shared", {}).items()}.values())
+    average = {r: sum(g["footprint"][r] for g in gateways) / len(gateways) for r in RESOURCES}
+    recommended = {}
+    for name, capacity in capacities.items():
+        available = dict(capacity, disk=max(capacity["disk"] - shared_total, 0))
+        ratios = [available[r] / average[r] for r in RESOURCES if average[r]]
+        # No resource used on average, any number fits
+        recommended[name] = int(min(ratios)) if ratios else None
+    return {
+        "placement": placement,
+        "unplaced": unplaced,
+        "recommended_gateways_per_host": recommended,
+        "free_capacity": free,
+        "footprints": {g["name"]: g["footprint"] for g in gateways},
+    }
+
+
+def absolute_paths(service: dict, base: Path) -> dict:
+    """Make the build context and bind mount sources of a service absolute so
+    services from different gateway directories can share one compose file"""
+
+    service = dict(service)
+    if isinstance(service.get("build"), dict) and "context" in service["build"]:
+        service["build"] = dict(service["build"], context=str((base / service["build"]["context"]).resolve()))
+    volumes = []
+    for volume in service.get("volumes", []):
+        source, _, rest = volume.partition(":")
+        if source.startswith("."):
+            source = str((base / source).resolve())
+        volumes.append(f"{source}:{rest}" if rest else source)
+    if volumes:
+        service["volumes"] = volumes
+    return service
+
+
+def sharded_compose(placement: dict, gateways: list) -> dict:
+    by_name = {g["name"]: g for g in gateways}
+    shards = {}
+    for host, names in placement.items():
+        services = {}
+        for name in names:
+            gateway = by_name[name]
+            base = gateway["compose_file"].parent
+            for service_name, service in gateway["compose"]["services"].items():
+                services[service_name] = absolute_paths(service, base)
+        if services:
+            shards[host] = {"version": "3.7", "services": services}
+    return shards
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plan gateway containers per host from measured footprints")
+    parser.add_argument("inventory", help="JSON file with hosts and gateways")
+    parser.add_argument("--measure", action="store_true", help="Measure running containers with docker stats")
+    parser.add_argument("--samples", type=int, default=5, help="docker stats samples when measuring")
+    parser.add_argument("--profile-results", default=RESULTS_FILE, help="Results written by profile_gateway.py")
+    parser.add_argument("--headroom", type=float, default=DEFAULT_HEADROOM, help="Fraction of each host kept free")
+    parser.add_argument("--output", default="plan", help="Directory for the plan and per host compose files")
+    args = parser.parse_args()
+
+    inventory_file = Path(args.inventory).resolve()
+    results_file = Path(args.profile_results).resolve()
+    output = Path(args.output).resolve()
+    with open(inventory_file) as f:
+        inventory = json.load(f)
+    # Profiles are read relative to the docker/ directory
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    gateways = []
+    for gateway in inventory["gateways"]:
+        compose_file = (inventory_file.parent / gateway["compose"]).resolve()
+        if not compose_file.is_file():
+            print(f"Compose file {compose_file} for gateway {gateway['name']} not found")
+            sys.exit(1)
+        compose = read_compose(compose_file)
+        gateways.append(dict(gateway, compose_file=compose_file, compose=compose, containers=container_names(compose)))
+    if not gateways:
+        print("No gateways in inventory")
+        sys.exit(1)
+
+    measured = measure_containers([n for g in gateways for n in g["containers"]], args.samples) if args.measure else {}
+    profile_results = json.loads(results_file.read_text()) if results_file.is_file() else {}
+    for gateway in gateways:
+        gateway["footprint"], gateway["shared"] = gateway_footprint(gateway, measured, profile_results)
+
+    result = plan(gateways, inventory["hosts"], args.headroom)
+    output.mkdir(parents=True, exist_ok=True)
+    with open(output / "placement.json", "w") as f:
+        json.dump(result, f, indent=2)
+    for host, compose in sharded_compose(result["placement"], gateways).items():
+        with open(output / f"docker-compose.{host}.yml", "w") as f:
+            yaml.safe_dump(compose, f, sort_keys=False)
+
+    for host, names in result["placement"].items():
+        print(f"{host}: {len(names)} gateways {names}, recommended {result['recommended_gateways_per_host'][host]}")
+    if result["unplaced"]:
+        print(f"Gateways that do not fit the available hosts: {result['unplaced']}")
+        sys.exit(2)
@@ -0,0 +1,258 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Start gateway containers through the Docker Engine API instead of the
+docker-compose CLI.
+
+Each start with docker-compose spawns a process that parses the compose file
+and reconciles the whole project. This backend reads the rendered
+docker-compose.yml of a gateway once, converts its service to an Engine API
+container spec and creates and starts the container with two HTTP requests on
+/var/run/docker.sock, for many gateways concurrently. Readiness comes from one
+shared /events stream of health_status events rather than polling each
+container.
+
+A container whose spec differs from the rendered docker-compose.yml, compared
+by a hash of the spec kept in a label, is removed and created again rather
+than started with its old configuration.
+
+Containers are attached to the default bridge network rather than a compose
+project network. The socket is taken from --docker-socket or
+DOCKER_HOST=unix://..., so the backend can be pointed at a stub server that
+answers the same endpoints.
+
+    python3 orchestrate.py --backend engine --fleet fleet.json --skip-configure
+"""
+
+import os
+import re
+import json
+import asyncio
+import hashlib
+import urllib.parse
+from pathlib import Path
+
+import yaml
+
+from config_docker import parse_size
+
+DEFAULT_SOCKET = "/var/run/docker.sock"
+API_VERSION = "v1.41"
+DURATION_UNITS = {"ns": 1, "us": 10**3, "ms": 10**6, "s": 10**9, "m": 60 * 10**9, "h": 3600 * 10**9}
+GATEWAY_LABEL = "com.amazonaws.sitewise.gateway-dir"
+CONFIG_HASH_LABEL = "com.amazonaws.sitewise.config-hash"
+
+
+class EngineError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Docker Engine API returned {status}: {message}")
+        self.status = status
+
+
+def docker_socket(path: str = None) -> str:
+    if path:
+        return path
+    host = os.getenv("DOCKER_HOST", "")
+    return host[len("unix://"):] if host.startswith("unix://") else DEFAULT_SOCKET
+
+
+def parse_duration(duration: str) -> int:
+    """Convert a compose duration such as '30s' or '1m30s' to nanoseconds"""
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ns|us|ms|s|m|h)", str(duration))
+    if not parts:
+        raise ValueError(f"Invalid duration {duration}")
+    return int(sum(float(value) * DURATION_UNITS[unit] for value, unit in parts))
+
+
+class EngineClient:
+    """Minimal asyncio HTTP/1.1 client for the Engine API on a unix socket"""
+
+    def __init__(self, socket_path: str = None):
+        self.socket_path = docker_socket(socket_path)
+
+    async def _open(self, method: str, path: str, body: dict = None):
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        payload = json.dumps(body).encode() if body is not None else b""
+        head = (
+            f"{method} /{API_VERSION}{path} HTTP/1.1\r\n"
+            "Host: docker\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(head.encode() + payload)
+        await writer.drain()
+
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode().strip()
+            if not line:
+                break
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+        return reader, writer, status, headers
+
+    @staticmethod
+    async def _chunks(reader: asyncio.StreamReader, headers: dict):
+        """Yield the body in pieces as they arrive"""
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    return
+                chunk = await reader.readexactly(size)
+                await reader.readline()
+                yield chunk
+        elif "content-length" in headers:
+            yield await reader.readexactly(int(headers["content-length"]))
+        else:
+            yield await reader.read()
+
+    async def request(self, method: str, path: str, body: dict = None):
+        """Send a request and return (status, decoded JSON body or None)"""
+        reader, writer, status, headers = await self._open(method, path, body)
+        try:
+            data = b"".join([chunk async for chunk in self._chunks(reader, headers)])
+        finally:
+            writer.close()
+        result = json.loads(data) if data.strip() else None
+        if status >= 400:
+            message = result.get("message", "") if isinstance(result, dict) else data.decode(errors="replace")
+            raise EngineError(status, message)
+        return status, result
+
+    async def events(self, filters: dict):
+        """Yield events from the /events stream until the connection closes"""
+        query = urllib.parse.urlencode({"filters": json.dumps(filters)})
+        reader, writer, status, headers = await self._open("GET", f"/events?{query}")
+        if status >= 400:
+            writer.close()
+            raise EngineError(status, "events stream refused")
+        buffer = b""
+        try:
+            async for chunk in self._chunks(reader, headers):
+                buffer += chunk
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line)
+        finally:
+            writer.close()
+
+
+def container_spec(service: dict, base: Path) -> dict:
+    """Convert a rendered docker-compose service to an Engine API ContainerCreate body"""
+
+    binds = []
+    for volume in service.get("volumes", []):
+        source, _, rest = volume.partition(":")
+        if source.startswith("."):
+            source = str((base / source).resolve())
+        binds.append(f"{source}:{rest}")
+
+    exposed, bindings = {}, {}
+    for port in service.get("ports", []):
+        host_port, _, container_port = str(port).rpartition(":")
+        exposed[f"{container_port}/tcp"] = {}
+        bindings[f"{container_port}/tcp"] = [{"HostPort": host_port}]
+
+    host_config = {"Binds": binds, "PortBindings": bindings, "Init": bool(service.get("init"))}
+    if "cpu_shares" in service:
+        host_config["CpuShares"] = int(service["cpu_shares"])
+    resources = service.get("deploy", {}).get("resources", {})
+    limits, reservations = resources.get("limits", {}), resources.get("reservations", {})
+    if "cpus" in limits:
+        host_config["NanoCpus"] = int(float(limits["cpus"]) * 10**9)
+    if "memory" in limits:
+        host_config["Memory"] = parse_size(limits["memory"])
+    if "memory" in reservations:
+        host_config["MemoryReservation"] = parse_size(reservations["memory"])
+
+    spec = {
+        "Image": service["image"],
+        "Env": [f"{key}={value}" for key, value in service.get("environment", {}).items()],
+        "ExposedPorts": exposed,
+        "HostConfig": host_config,
+        "Labels": {GATEWAY_LABEL: str(base.resolve())},
+    }
+    healthcheck = service.get("healthcheck")
+    if healthcheck:
+        spec["Healthcheck"] = {
+            "Test": healthcheck["test"],
+            "Interval": parse_duration(healthcheck.get("interval", "30s")),
+            "Timeout": parse_duration(healthcheck.get("timeout", "30s")),
+            "Retries": int(healthcheck.get("retries", 3)),
+            "StartPeriod": parse_duration(healthcheck.get("start_period", "0s")),
+        }
+    spec["Labels"][CONFIG_HASH_LABEL] = hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+    return spec
+
+
+class EngineBackend:
+    """orchestrate.py backend creating and starting containers over the Engine API"""
+
+    def __init__(self, socket_path: str = None):
+        self.client = EngineClient(socket_path)
+        self.waiters = {}
+        self.watcher = None
+
+    @staticmethod
+    def _service(gateway_dir: Path) -> dict:
+        with open(gateway_dir / "docker-compose.yml") as f:
+            compose = yaml.safe_load(f)
+        return next(iter(compose["services"].values()))
+
+    async def start(self, gateway_dir: Path):
+        service = self._service(gateway_dir)
+        name = service["container_name"]
+        spec = container_spec(service, gateway_dir)
+        self._ensure_watcher()
+        try:
+            _, container = await self.client.request("GET", f"/containers/{name}/json")
+        except EngineError as e:
+            if e.status != 404:
+                raise
+            container = None
+        if container is not None and container["Config"].get("Labels", {}).get(CONFIG_HASH_LABEL) != spec["Labels"][CONFIG_HASH_LABEL]:
+            # Rendered with another configuration, a start would run the old one
+            await self.client.request("DELETE", f"/containers/{name}?force=true")
+            container = None
+        if container is None:
+            await self.client.request("POST", f"/containers/create?name={name}", spec)
+        if container is None or not container["State"]["Running"]:
+            # 304 when the container was already started
+            await self.client.request("POST", f"/containers/{name}/start")
+
+    def _ensure_watcher(self):
+        if self.watcher is None or self.watcher.done():
+            self.watcher = asyncio.ensure_future(self._watch())
+
+    async def _watch(self):
+        """Resolve waiters from the shared health_status and die events"""
+        filters = {"type": ["container"], "event": ["health_status", "die"]}
+        async for event in self.client.events(filters):
+            name = event.get("Actor", {}).get("Attributes", {}).get("name")
+            waiter = self.waiters.get(name)
+            if waiter is None or waiter.done():
+                continue
+            status = event.get("status", event.get("Action", ""))
+            if status.endswith(": healthy"):
+                waiter.set_result(None)
+            elif status.endswith(": unhealthy") or status == "die":
+                waiter.set_exception(RuntimeError(f"container {status}"))
+
+    async def wait_healthy(self, gateway_dir: Path, timeout: float):
+        name = self._service(gateway_dir)["container_name"]
+        waiter = self.waiters[name] = asyncio.get_running_loop().create_future()
+        self._ensure_watcher()
+        try:
+            # The container may have become healthy before the waiter existed
+            _, container = await self.client.request("GET", f"/containers/{name}/json")
+            health = container["State"].get("Health", {}).get("Status")
+            if health == "healthy" or (health is None and container["State"]["Running"]):
+                return
+            await asyncio.wait_for(waiter, timeout)
+        finally:
+            self.waiters.pop(name, None)
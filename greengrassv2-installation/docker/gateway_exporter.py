@@ -0,0 +1,233 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Readiness endpoint and Prometheus metrics for one gateway container.
+
+Started by greengrass-entrypoint.sh when EXPORTER_PORT is set. Greengrass and
+component logs are followed incrementally: each file is read from the offset
+reached on the previous poll, and reading restarts at zero when the file is
+rotated or truncated. Only the python standard library is used so nothing has
+to be installed in the image.
+
+    GET /healthz   200 while the exporter is polling
+    GET /ready     200 when the nucleus is connected and collector and publisher are RUNNING, else 503
+    GET /metrics   Prometheus text format
+
+Log patterns differ between component versions. The defaults below can be
+replaced with a JSON file named by EXPORTER_PATTERNS_FILE that has the same
+structure as PATTERNS.
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+GGC_ROOT_PATH = os.getenv("GGC_ROOT_PATH", "/greengrass/v2")
+EXPORTER_PORT = int(os.getenv("EXPORTER_PORT", "9110"))
+POLL_INTERVAL = float(os.getenv("EXPORTER_POLL_INTERVAL", "5"))
+GATEWAY_NAME = os.getenv("GATEWAY_NAME", "")
+
+NUCLEUS_LOG = "greengrass.log"
+COLLECTOR = "aws.iot.SiteWiseEdgeCollectorOpcua"
+PUBLISHER = "aws.iot.SiteWiseEdgePublisher"
+STREAM_MANAGER = "aws.greengrass.StreamManager"
+REQUIRED_SERVICES = [COLLECTOR, PUBLISHER]
+
+# For each log file, "counters" add up the first group of every match and
+# "gauges" keep the first group of the last match
+PATTERNS = {
+    f"{COLLECTOR}.log": {
+        "counters": {"points_collected_total": r"[Cc]ollected (\d+) (?:data )?points"},
+        "gauges": {},
+    },
+    f"{PUBLISHER}.log": {
+        "counters": {"points_published_total": r"[Pp]ublished (\d+) (?:data )?points"},
+        "gauges": {"publisher_backlog_bytes": r"[Bb]acklog(?: size)?[=: ]+(\d+)"},
+    },
+    f"{STREAM_MANAGER}.log": {
+        "counters": {},
+        "gauges": {"stream_manager_backlog_messages": r"[Bb]acklog[=: ]+(\d+)"},
+    },
+}
+
+CONNECTED = re.compile(r"Successfully connected to AWS IoT Core")
+DISCONNECTED = re.compile(r"[Cc]onnection interrupted")
+SERVICE_STATE = re.compile(r"service-set-state.*?serviceName=([^,}\s]+).*?newState=(\w+)")
+LOG_LEVEL = re.compile(r"\[(ERROR|WARN)\]")
+
+
+class LogFollower:
+    """Read lines appended to a file since the previous call"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.inode = None
+        self.offset = 0
+        self.partial = ""
+
+    def read_lines(self) -> list:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            # Rotated or truncated, start over from the beginning
+            self.inode, self.offset, self.partial = stat.st_ino, 0, ""
+        if stat.st_size == self.offset:
+            return []
+        with open(self.path, "r", errors="replace") as f:
+            f.seek(self.offset)
+            data = f.read()
+            self.offset = f.tell()
+        lines = (self.partial + data).split("\n")
+        self.partial = lines.pop()
+        return lines
+
+
+class GatewayState:
+    def __init__(self, logs_dir: str, patterns: dict):
+        self.lock = threading.Lock()
+        self.logs_dir = logs_dir
+        self.patterns = {
+            name: {kind: {metric: re.compile(regex) for metric, regex in group.items()} for kind, group in spec.items()}
+            for name, spec in patterns.items()
+        }
+        self.followers = {name: LogFollower(os.path.join(logs_dir, name)) for name in [NUCLEUS_LOG, *patterns]}
+        self.connected = False
+        self.services = {}
+        self.counters = {metric: 0 for spec in patterns.values() for metric in spec.get("counters", {})}
+        self.gauges = {metric: 0 for spec in patterns.values() for metric in spec.get("gauges", {})}
+        self.log_lines = {}
+        self.log_levels = {}
+        self.last_poll = 0.0
+
+    def poll(self):
+        for name, follower in self.followers.items():
+            lines = follower.read_lines()
+            with self.lock:
+                self.log_lines[name] = self.log_lines.get(name, 0) + len(lines)
+                for line in lines:
+                    self._parse(name, line)
+        self.last_poll = time.time()
+
+    def _parse(self, name: str, line: str):
+        level = LOG_LEVEL.search(line)
+        if level:
+            key = (name, level.group(1))
+            self.log_levels[key] = self.log_levels.get(key, 0) + 1
+        if name == NUCLEUS_LOG:
+            if CONNECTED.search(line):
+                self.connected = True
+            elif DISCONNECTED.search(line):
+                self.connected = False
+            state = SERVICE_STATE.search(line)
+            if state:
+                self.services[state.group(1)] = state.group(2)
+            return
+        spec = self.patterns.get(name, {})
+        for metric, regex in spec.get("counters", {}).items():
+            match = regex.search(line)
+            if match:
+                self.counters[metric] += int(match.group(1))
+        for metric, regex in spec.get("gauges", {}).items():
+            match = regex.search(line)
+            if match:
+                self.gauges[metric] = int(match.group(1))
+
+    def ready(self) -> bool:
+        with self.lock:
+            return self.connected and all(self.services.get(s) == "RUNNING" for s in REQUIRED_SERVICES)
+
+    def metrics(self) -> str:
+        label = f'gateway="{GATEWAY_NAME}"'
+        lines = [
+            "# TYPE sitewise_gateway_ready gauge",
+            f"sitewise_gateway_ready{{{label}}} {int(self.ready())}",
+        ]
+        with self.lock:
+            lines += [
+                "# TYPE sitewise_gateway_nucleus_connected gauge",
+                f"sitewise_gateway_nucleus_connected{{{label}}} {int(self.connected)}",
+                "# TYPE sitewise_gateway_service_running gauge",
+            ]
+            for service, state in sorted(self.services.items()):
+                lines.append(
+                    f'sitewise_gateway_service_running{{{label},service="{service}",state="{state}"}} {int(state == "RUNNING")}'
+                )
+            for metric, value in sorted(self.counters.items()):
+                lines += [f"# TYPE sitewise_gateway_{metric} counter", f"sitewise_gateway_{metric}{{{label}}} {value}"]
+            for metric, value in sorted(self.gauges.items()):
+                lines += [f"# TYPE sitewise_gateway_{metric} gauge", f"sitewise_gateway_{metric}{{{label}}} {value}"]
+            lines.append("# TYPE sitewise_gateway_log_lines_total counter")
+            for name, value in sorted(self.log_lines.items()):
+                lines.append(f'sitewise_gateway_log_lines_total{{{label},log="{name}"}} {value}')
+            lines.append("# TYPE sitewise_gateway_log_messages_total counter")
+            for (name, level), value in sorted(self.log_levels.items()):
+                lines.append(f'sitewise_gateway_log_messages_total{{{label},log="{name}",level="{level}"}} {value}')
+        lines += [
+            "# TYPE sitewise_gateway_exporter_last_poll_timestamp_seconds gauge",
+            f"sitewise_gateway_exporter_last_poll_timestamp_seconds{{{label}}} {self.last_poll:.3f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_handler(state: GatewayState):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                self._reply(200, state.metrics(), "text/plain; version=0.0.4")
+            elif self.path == "/ready":
+                ready = state.ready()
+                self._reply(200 if ready else 503, "ready\n" if ready else "not ready\n")
+            elif self.path == "/healthz":
+                alive = time.time() - state.last_poll < POLL_INTERVAL * 3
+                self._reply(200 if alive else 503, "ok\n" if alive else "stalled\n")
+            else:
+                self._reply(404, "not found\n")
+
+        def _reply(self, status: int, body: str, content_type: str = "text/plain"):
+            payload = body.encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def load_patterns() -> dict:
+    patterns_file = os.getenv("EXPORTER_PATTERNS_FILE")
+    if patterns_file and os.path.isfile(patterns_file):
+        with open(patterns_file) as f:
+            return json.load(f)
+    return PATTERNS
+
+
+def poll_forever(state: GatewayState):
+    while True:
+        try:
+            state.poll()
+        except Exception as e:
+            print(f"gateway_exporter: error reading logs, {e}")
+        time.sleep(POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    gateway_state = GatewayState(os.path.join(GGC_ROOT_PATH, "logs"), load_patterns())
+    gateway_state.poll()
+    threading.Thread(target=poll_forever, args=(gateway_state,), daemon=True).start()
+    print(f"gateway_exporter: serving /ready and /metrics on port {EXPORTER_PORT}")
+    ThreadingHTTPServer(("", EXPORTER_PORT), make_handler(gateway_state)).serve_forever()
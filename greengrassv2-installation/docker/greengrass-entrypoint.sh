@@ -10,6 +10,14 @@ set +m
 
 # Path that initial installation files are copied to
 INIT_JAR_PATH=/opt/greengrassv2
+# Greengrass root installed at image build time (PREBAKE_INSTALL=true), if any
+TEMPLATE_ROOT_PATH=/opt/greengrassv2-template
+# Startup phase timings, one "<phase> <milliseconds>" line per phase
+TIMINGS_FILE=${GGC_ROOT_PATH}/logs/startup-timings.log
+# Log line written by the nucleus once its MQTT connection to AWS IoT Core is up
+CONNECTED_MARKER="Successfully connected to AWS IoT Core"
+# -Xlog:cds output of resource profiles with "cds": true (config_docker.py)
+CDS_LOG=${GGC_ROOT_PATH}/logs/cds.log
 #Default options
 OPTIONS="-Droot=${GGC_ROOT_PATH} -Dlog.store=FILE -Dlog.level=${LOG_LEVEL} -jar ${INIT_JAR_PATH}/lib/Greengrass.jar --provision ${PROVISION} --deploy-dev-tools ${DEPLOY_DEV_TOOLS} --aws-region ${AWS_REGION} --start false"
 
@@ -80,21 +88,117 @@ parse_options() {
 	echo "Running Greengrass with the following options: ${OPTIONS}"
 }
 
+now_ms() {
+	date +%s%3N
+}
+
+# Append the duration of a startup phase to the timings file
+record_phase() {
+	mkdir -p $(dirname ${TIMINGS_FILE})
+	echo "$(date -u +%Y-%m-%dT%H:%M:%SZ) $1 $(( $(now_ms) - $2 ))" >> ${TIMINGS_FILE}
+}
+
+# Copy the pre-baked root and apply the per gateway configuration. The nucleus
+# reads config/config.yaml on first boot when no config.tlog exists.
+install_from_template() {
+	# Replace files seeded from the shared store instead of writing through their hard links
+	cp -a --remove-destination ${TEMPLATE_ROOT_PATH}/. $GGC_ROOT_PATH/
+	mkdir -p $GGC_ROOT_PATH/config
+	if [ ${INIT_CONFIG} != default_init_config ] && [ -f ${INIT_CONFIG} ]; then
+		echo "Using specified init config file at ${INIT_CONFIG}"
+		cp ${INIT_CONFIG} $GGC_ROOT_PATH/config/config.yaml
+	fi
+	# The loader reads JVM options for the nucleus from launch.params
+	if [ -n "${JVM_OPTIONS}" ]; then
+		echo "${JVM_OPTIONS}" > $GGC_ROOT_PATH/alts/current/launch.params
+	fi
+}
+
+# Wait in the background for the nucleus to connect and record the time since container start.
+# Gives up after CONNECT_TIMEOUT seconds, or when the loader that replaces this shell exits
+watch_connected() {
+	(
+		DEADLINE=$(( $(date +%s) + ${CONNECT_TIMEOUT} ))
+		until grep -qs "${CONNECTED_MARKER}" $GGC_ROOT_PATH/logs/greengrass.log; do
+			if ! kill -0 ${MAIN_PID} 2>/dev/null; then
+				exit 0
+			fi
+			if [ $(date +%s) -ge ${DEADLINE} ]; then
+				echo "Nucleus not connected after ${CONNECT_TIMEOUT}s, not recording nucleus_connected"
+				exit 0
+			fi
+			sleep 1
+		done
+		record_phase nucleus_connected ${CONTAINER_START_MS}
+		report_cds
+	) &
+}
+
+# -Xshare:auto falls back without a word, report whether the nucleus mapped the AppCDS archive
+report_cds() {
+	if [ -f ${CDS_LOG} ]; then
+		if grep -qs "UseSharedSpaces:" ${CDS_LOG}; then
+			echo "Nucleus runs without the AppCDS archive: $(grep -h "UseSharedSpaces:" ${CDS_LOG} | tail -n 1)"
+		else
+			echo "Nucleus mapped the AppCDS archive"
+		fi
+	fi
+}
+
+CONTAINER_START_MS=$(now_ms)
+# exec keeps the PID, so this is the PID of the loader once it runs
+MAIN_PID=$$
+: ${CONNECT_TIMEOUT:=600}
+# The JVM does not start when the directory of its -Xlog file is missing
+mkdir -p $GGC_ROOT_PATH/logs
+: ${INIT_CONFIG:=default_init_config}
+
 # If we have not already installed Greengrass
 if [ ! -d $GGC_ROOT_PATH/alts/current/distro ]; then
-	# Install Greengrass via the main installer, but do not start running
-	echo "Installing Greengrass for the first time..."
-	parse_options
-	java ${OPTIONS}
+	PHASE_START_MS=$(now_ms)
+	# The template was installed without provisioning or dev tools, only the installer applies them
+	if [ -d ${TEMPLATE_ROOT_PATH} ] && [ ${PROVISION} != "true" ] && [ ${DEPLOY_DEV_TOOLS} != "true" ]; then
+		echo "Installing Greengrass from the pre-baked template..."
+		install_from_template
+		record_phase install_from_template ${PHASE_START_MS}
+	else
+		if [ -d ${TEMPLATE_ROOT_PATH} ]; then
+			echo "PROVISION or DEPLOY_DEV_TOOLS is true, running the installer instead of the pre-baked template"
+		fi
+		# Install Greengrass via the main installer, but do not start running
+		echo "Installing Greengrass for the first time..."
+		parse_options
+		java ${JVM_OPTIONS} ${OPTIONS}
+		record_phase install_with_installer ${PHASE_START_MS}
+	fi
 else
 	echo "Reusing existing Greengrass installation..."
 fi
 
 #Make loader script executable
 echo "Making loader script executable..."
-chmod +x $GGC_ROOT_PATH/alts/current/distro/bin/loader
+# Only when needed, the loader may be a hard link shared with other gateways
+[ -x $GGC_ROOT_PATH/alts/current/distro/bin/loader ] || chmod +x $GGC_ROOT_PATH/alts/current/distro/bin/loader
+
+# Trust an additional CA in the JVM, e.g. the local SiteWise stand-in of the benchmarks
+if [ -n "${EXTRA_CA_FILE}" ] && [ -f "${EXTRA_CA_FILE}" ]; then
+	echo "Adding ${EXTRA_CA_FILE} to the Java trust store..."
+	keytool -delete -cacerts -storepass changeit -alias extra-ca >/dev/null 2>&1 || true
+	keytool -importcert -noprompt -cacerts -storepass changeit -alias extra-ca -file ${EXTRA_CA_FILE}
+fi
 
 echo "Starting Greengrass..."
+# A restarted container appends to the existing log, so only watch fresh starts
+if ! grep -qs "${CONNECTED_MARKER}" $GGC_ROOT_PATH/logs/greengrass.log; then
+	watch_connected
+fi
+record_phase loader_start ${CONTAINER_START_MS}
+
+# Start the readiness and metrics exporter next to the nucleus
+if [ -n "${EXPORTER_PORT}" ]; then
+	echo "Starting gateway exporter on port ${EXPORTER_PORT}..."
+	python3.8 /gateway_exporter.py &
+fi
 
 # Start greengrass kernel via the loader script and register container as a thing
 exec $GGC_ROOT_PATH/alts/current/distro/bin/loader
@@ -0,0 +1,373 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Host level log pipeline for all gateway containers on a host.
+
+'follow' watches the Greengrass and component logs of every gateway directory
+(the directory holding docker-compose.yml and volumes/) with inotify, falling
+back to polling where inotify is unavailable. Offsets are stored so a restart
+resumes where it stopped, and a rotated log is read to its end before the new
+file is opened. Each line is tagged with gateway, component, level and time and
+appended to the active segment. Full segments are gzip compressed and
+registered in an SQLite index; the oldest segments are deleted once the store
+exceeds its size cap.
+
+'query' uses the index to decompress only the segments that can contain
+matching lines.
+
+    python3 log_aggregator.py follow --gateway-dir . --gateway-dir ../account-b --store /var/log/sitewise
+    python3 log_aggregator.py query --store /var/log/sitewise --gateway account-b --level ERROR --since 2023-06-01T00:00
+"""
+
+import os
+import re
+import sys
+import gzip
+import json
+import time
+import ctypes
+import select
+import signal
+import sqlite3
+import argparse
+from pathlib import Path
+from datetime import datetime, timezone
+
+DEFAULT_STORE = "./volumes/logs"
+SEGMENT_BYTES = 16 << 20
+MAX_STORE_BYTES = 1 << 30
+POLL_INTERVAL = 2.0
+STATE_SAVE_INTERVAL = 10.0
+
+TIMESTAMP = re.compile(r"^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})")
+LEVEL = re.compile(r"\[(TRACE|DEBUG|INFO|WARN|ERROR|FATAL)\]")
+THING_NAME = re.compile(r'thingName: "(.*)"')
+NUCLEUS_LOG = "greengrass.log"
+# Greengrass renames full logs to <name>_YYYY_MM_DD_HH_<index>.log, these are
+# finished through the open handle of the original file instead
+ROTATED_LOG = re.compile(r"_\d{4}_\d{2}_\d{2}_\d{2}_\d+\.log$")
+
+IN_MODIFY = 0x00000002
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+EVENT_HEADER = ctypes.sizeof(ctypes.c_int) + 3 * ctypes.sizeof(ctypes.c_uint32)
+
+
+def gateway_name(gateway_dir: Path) -> str:
+    """Thing name from the rendered config.yaml, or the directory name"""
+    config = gateway_dir / "volumes" / "config" / "config.yaml"
+    if config.is_file():
+        match = THING_NAME.search(config.read_text())
+        if match:
+            return match.group(1)
+    return gateway_dir.resolve().name
+
+
+def epoch(value: str) -> float:
+    """Seconds since the epoch for an ISO 8601 time, UTC unless an offset is given"""
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class Inotify:
+    """Minimal inotify wrapper over libc, raises OSError where inotify is unavailable"""
+
+    def __init__(self):
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.libc = libc
+        self.watches = {}
+
+    def add_watch(self, path: Path):
+        wd = self.libc.inotify_add_watch(self.fd, str(path).encode(), IN_MODIFY | IN_CREATE | IN_MOVED_TO)
+        if wd >= 0:
+            self.watches[wd] = path
+
+    def wait(self, timeout: float) -> set:
+        """Return the directories with changes, or an empty set on timeout"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        changed = set()
+        if not readable:
+            return changed
+        data = os.read(self.fd, 64 * 1024)
+        position = 0
+        while position + EVENT_HEADER <= len(data):
+            # struct inotify_event: int wd, uint32 mask, uint32 cookie, uint32 len, char name[len]
+            wd = int.from_bytes(data[position:position + 4], sys.byteorder, signed=True)
+            length = int.from_bytes(data[position + 12:position + 16], sys.byteorder)
+            if wd in self.watches:
+                changed.add(self.watches[wd])
+            position += EVENT_HEADER + length
+        return changed
+
+
+class FollowedFile:
+    """An open log file that survives rename rotation"""
+
+    def __init__(self, path: Path, gateway: str, inode: int = None, offset: int = 0):
+        self.path = path
+        self.gateway = gateway
+        self.component = "nucleus" if path.name == NUCLEUS_LOG else path.name[: -len(".log")]
+        self.handle = None
+        self.inode = inode
+        self.offset = offset
+        self.partial = ""
+        self.timestamp = None
+        self.level = "INFO"
+
+    def _open(self):
+        self.handle = open(self.path, "r", errors="replace")
+        inode = os.fstat(self.handle.fileno()).st_ino
+        if inode != self.inode or os.fstat(self.handle.fileno()).st_size < self.offset:
+            self.inode, self.offset = inode, 0
+        self.handle.seek(self.offset)
+
+    def read(self) -> list:
+        """Return tagged records for lines appended since the last read"""
+        records = []
+        if self.handle is None:
+            if not self.path.exists():
+                return records
+            self._open()
+        records += self._drain()
+        try:
+            rotated = os.stat(self.path).st_ino != self.inode
+        except FileNotFoundError:
+            rotated = False
+        if rotated:
+            # The old handle was read to its end above, continue with the new file
+            self.handle.close()
+            self.inode, self.offset = None, 0
+            self._open()
+            records += self._drain()
+        return records
+
+    def _drain(self) -> list:
+        data = self.handle.read()
+        self.offset = self.handle.tell()
+        lines = (self.partial + data).split("\n")
+        self.partial = lines.pop()
+        records = []
+        for line in lines:
+            if not line:
+                continue
+            timestamp = TIMESTAMP.match(line)
+            if timestamp:
+                # Continuation lines such as stack traces inherit time and level
+                self.timestamp = epoch(timestamp.group(1))
+                level = LEVEL.search(line)
+                self.level = level.group(1) if level else "INFO"
+            records.append((self.timestamp or time.time(), self.gateway, self.component, self.level, line))
+        return records
+
+
+class SegmentStore:
+    """Active text segment plus gzip compressed, indexed, size capped segments"""
+
+    def __init__(self, store: Path, segment_bytes: int, max_bytes: int):
+        self.store = store
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        (store / "segments").mkdir(parents=True, exist_ok=True)
+        self.active_path = store / "active.log"
+        self.active = open(self.active_path, "a")
+        self.db = sqlite3.connect(str(store / "index.db"))
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS segments (
+                id INTEGER PRIMARY KEY, path TEXT, min_ts REAL, max_ts REAL, bytes INTEGER);
+            CREATE TABLE IF NOT EXISTS segment_keys (
+                segment_id INTEGER, gateway TEXT, component TEXT, level TEXT, lines INTEGER);
+            CREATE INDEX IF NOT EXISTS keys_lookup ON segment_keys (gateway, component, level);
+            CREATE INDEX IF NOT EXISTS segments_time ON segments (min_ts, max_ts);
+            """
+        )
+
+    def append(self, records: list):
+        for timestamp, gateway, component, level, line in records:
+            self.active.write(f"{timestamp:.3f}\t{gateway}\t{component}\t{level}\t{line}\n")
+        self.active.flush()
+        if self.active.tell() >= self.segment_bytes:
+            self.seal()
+
+    def seal(self):
+        """Compress the active segment and record its time range and keys"""
+        self.active.close()
+        keys, min_ts, max_ts = {}, None, None
+        for timestamp, gateway, component, level, _ in read_records(self.active_path):
+            keys[(gateway, component, level)] = keys.get((gateway, component, level), 0) + 1
+            min_ts = timestamp if min_ts is None else min(min_ts, timestamp)
+            max_ts = timestamp if max_ts is None else max(max_ts, timestamp)
+        if keys:
+            path = self.store / "segments" / f"{int(min_ts)}-{int(time.time() * 1000)}.log.gz"
+            with open(self.active_path, "rb") as source, gzip.open(path, "wb") as target:
+                target.writelines(source)
+            cursor = self.db.execute(
+                "INSERT INTO segments (path, min_ts, max_ts, bytes) VALUES (?, ?, ?, ?)",
+                (path.name, min_ts, max_ts, path.stat().st_size),
+            )
+            self.db.executemany(
+                "INSERT INTO segment_keys VALUES (?, ?, ?, ?, ?)",
+                [(cursor.lastrowid, *key, count) for key, count in keys.items()],
+            )
+            self.db.commit()
+        self.active = open(self.active_path, "w")
+        self.enforce_cap()
+
+    def enforce_cap(self):
+        total = self.db.execute("SELECT COALESCE(SUM(bytes), 0) FROM segments").fetchone()[0]
+        for segment_id, name, size in self.db.execute("SELECT id, path, bytes FROM segments ORDER BY max_ts").fetchall():
+            if total <= self.max_bytes:
+                break
+            (self.store / "segments" / name).unlink(missing_ok=True)
+            self.db.execute("DELETE FROM segments WHERE id = ?", (segment_id,))
+            self.db.execute("DELETE FROM segment_keys WHERE segment_id = ?", (segment_id,))
+            total -= size
+        self.db.commit()
+
+
+def read_records(path: Path):
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", errors="replace") as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t", 4)
+            if len(parts) == 5:
+                yield (float(parts[0]), *parts[1:])
+
+
+def load_state(store: Path) -> dict:
+    state_file = store / "offsets.json"
+    return json.loads(state_file.read_text()) if state_file.is_file() else {}
+
+
+def save_state(store: Path, followed: dict):
+    # An incomplete last line is read again after a restart
+    state = {
+        str(path): {"inode": f.inode, "offset": f.offset - len(f.partial.encode())} for path, f in followed.items()
+    }
+    staging = store / "offsets.json.tmp"
+    staging.write_text(json.dumps(state))
+    os.replace(staging, store / "offsets.json")
+
+
+def follow(gateway_dirs: list, store: Path, segment_bytes: int, max_bytes: int):
+    segments = SegmentStore(store, segment_bytes, max_bytes)
+    state = load_state(store)
+    logs_dirs = {Path(d) / "volumes" / "gg_root" / "logs": gateway_name(Path(d)) for d in gateway_dirs}
+    followed = {}
+    try:
+        inotify = Inotify()
+    except (OSError, AttributeError):
+        print("inotify not available, polling for log changes")
+        inotify = None
+
+    def discover():
+        for logs_dir, gateway in logs_dirs.items():
+            if not logs_dir.is_dir():
+                continue
+            if inotify and logs_dir not in inotify.watches.values():
+                inotify.add_watch(logs_dir)
+            for path in logs_dir.glob("*.log"):
+                if path not in followed and not ROTATED_LOG.search(path.name):
+                    saved = state.get(str(path), {})
+                    followed[path] = FollowedFile(path, gateway, saved.get("inode"), saved.get("offset", 0))
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    print(f"Following logs of {len(logs_dirs)} gateways into {store}")
+    last_save = time.monotonic()
+    changed = set(logs_dirs)
+    try:
+        while True:
+            discover()
+            for path, followed_file in followed.items():
+                if path.parent in changed:
+                    segments.append(followed_file.read())
+            if time.monotonic() - last_save > STATE_SAVE_INTERVAL:
+                save_state(store, followed)
+                last_save = time.monotonic()
+            if inotify:
+                changed = inotify.wait(POLL_INTERVAL * 5) or set(logs_dirs)
+            else:
+                time.sleep(POLL_INTERVAL)
+                changed = set(logs_dirs)
+    except KeyboardInterrupt:
+        print("Stopping, saving offsets")
+    finally:
+        save_state(store, followed)
+
+
+def query(store: Path, gateway: str = None, component: str = None, level: str = None, since: float = None, until: float = None):
+    """Yield matching records from the indexed segments, then the active segment"""
+
+    db = sqlite3.connect(str(store / "index.db"))
+    conditions, params = [], []
+    for column, value in (("k.gateway", gateway), ("k.component", component), ("k.level", level)):
+        if value:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+    if since is not None:
+        conditions.append("s.max_ts >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("s.min_ts <= ?")
+        params.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    names = [row[0] for row in db.execute(
+        f"SELECT DISTINCT s.path FROM segments s JOIN segment_keys k ON k.segment_id = s.id {where} ORDER BY s.min_ts",
+        params,
+    )]
+    paths = [store / "segments" / name for name in names] + [store / "active.log"]
+    for path in paths:
+        if not path.exists():
+            continue
+        for record in read_records(path):
+            timestamp, record_gateway, record_component, record_level, _ = record
+            if gateway and record_gateway != gateway:
+                continue
+            if component and record_component != component:
+                continue
+            if level and record_level != level:
+                continue
+            if since is not None and timestamp < since:
+                continue
+            if until is not None and timestamp > until:
+                continue
+            yield record
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate and query logs of all gateway containers on a host")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    follow_parser = subparsers.add_parser("follow", help="Follow gateway logs into the store")
+    follow_parser.add_argument("--gateway-dir", action="append", default=[], help="Gateway directory, repeatable")
+    follow_parser.add_argument("--store", default=DEFAULT_STORE)
+    follow_parser.add_argument("--segment-mb", type=int, default=SEGMENT_BYTES >> 20, help="Size of one segment")
+    follow_parser.add_argument("--max-store-mb", type=int, default=MAX_STORE_BYTES >> 20, help="Size cap of the store")
+    query_parser = subparsers.add_parser("query", help="Query the store")
+    query_parser.add_argument("--store", default=DEFAULT_STORE)
+    query_parser.add_argument("--gateway")
+    query_parser.add_argument("--component", help="Component name, or 'nucleus' for greengrass.log")
+    query_parser.add_argument("--level", choices=["TRACE", "DEBUG", "INFO", "WARN", "ERROR", "FATAL"])
+    query_parser.add_argument("--since", help="ISO 8601 start time, UTC")
+    query_parser.add_argument("--until", help="ISO 8601 end time, UTC")
+    args = parser.parse_args()
+
+    store_path = Path(args.store)
+    if args.command == "follow":
+        follow(args.gateway_dir or ["."], store_path, args.segment_mb << 20, args.max_store_mb << 20)
+    else:
+        if not (store_path / "index.db").is_file():
+            print(f"No log store found at {store_path}")
+            sys.exit(1)
+        since = epoch(args.since) if args.since else None
+        until = epoch(args.until) if args.until else None
+        for _, gw, comp, lvl, text in query(store_path, args.gateway, args.component, args.level, since, until):
+            print(f"[{gw}] {comp}: {text}")
@@ -0,0 +1,201 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Bring up all gateways of a site with one command.
+
+The steps run as a dependency graph instead of one after another:
+
+    configure (config_docker.py, all gateways) --+
+                                                  +--> start gateway --> wait healthy   (per gateway)
+    build (image, once for all gateways) --------+
+
+configure and build run at the same time. Each gateway starts as soon as both
+are done, at most --max-parallel gateways are starting or booting at once so
+their JVMs do not compete for the host CPUs. Progress is printed as stages
+finish, with a table of per stage timings at the end, and a failed gateway
+does not stop the others.
+
+    python3 orchestrate.py --fleet fleet.json --shared-store ./volumes/shared --max-parallel 4
+"""
+
+import re
+import sys
+import time
+import asyncio
+import argparse
+from pathlib import Path
+
+import yaml
+
+from config_docker import read_fleet, verify_cwd, FLEET_DIR, DEFAULT_GATEWAY
+
+COMPOSE_TEMPLATE = "./templates/docker-compose.yml.template"
+DEFAULT_MAX_PARALLEL = 4
+HEALTH_POLL_INTERVAL = 5
+
+
+class StageFailed(Exception):
+    pass
+
+
+async def run(*cmd, cwd: str = None) -> str:
+    """Run a command without blocking the event loop, returns its output"""
+    process = await asyncio.create_subprocess_exec(
+        *cmd, cwd=cwd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+    )
+    output, _ = await process.communicate()
+    output = output.decode(errors="replace")
+    if process.returncode != 0:
+        tail = "\n".join(output.strip().splitlines()[-5:])
+        raise StageFailed(f"{' '.join(cmd)} exited with {process.returncode}: {tail}")
+    return output
+
+
+def container_name(gateway_dir: Path) -> str:
+    with open(gateway_dir / "docker-compose.yml") as f:
+        compose = yaml.safe_load(f)
+    return next(iter(compose["services"].values()))["container_name"]
+
+
+class ComposeBackend:
+    """Start gateways with docker-compose and read their health with docker inspect"""
+
+    async def start(self, gateway_dir: Path):
+        await run("docker-compose", "--compatibility", "up", "-d", "--no-build", cwd=str(gateway_dir))
+
+    async def health(self, gateway_dir: Path) -> str:
+        output = await run(
+            "docker", "inspect", "--format",
+            "{{if .State.Health}}{{.State.Health.Status}}{{else}}{{.State.Status}}{{end}}",
+            container_name(gateway_dir),
+        )
+        return output.strip()
+
+    async def wait_healthy(self, gateway_dir: Path, timeout: float):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            status = await self.health(gateway_dir)
+            # "running" is reported for containers without a healthcheck
+            if status in ("healthy", "running"):
+                return
+            if status in ("unhealthy", "exited", "dead"):
+                raise StageFailed(f"container is {status}")
+            await asyncio.sleep(HEALTH_POLL_INTERVAL)
+        raise StageFailed(f"not healthy after {timeout:.0f}s")
+
+
+class Orchestrator:
+    def __init__(self, args, gateway_dirs: list, backend):
+        self.args = args
+        self.gateway_dirs = gateway_dirs
+        self.backend = backend
+        self.semaphore = None
+        self.started = time.monotonic()
+        self.timings = {}
+        self.failures = {}
+
+    async def stage(self, name: str, stage: str, coroutine):
+        """Run one stage, record its duration and print progress"""
+        start = time.monotonic()
+        try:
+            result = await coroutine
+        except Exception as e:
+            failure = e if isinstance(e, StageFailed) else StageFailed(f"{type(e).__name__}: {e}")
+            self.failures[name] = f"{stage}: {failure}"
+            print(f"[{time.monotonic() - self.started:7.1f}s] {name:<24} {stage:<12} FAILED {failure}", flush=True)
+            raise failure from e
+        elapsed = time.monotonic() - start
+        self.timings.setdefault(name, {})[stage] = elapsed
+        print(f"[{time.monotonic() - self.started:7.1f}s] {name:<24} {stage:<12} done in {elapsed:.1f}s", flush=True)
+        return result
+
+    async def configure(self):
+        if self.args.skip_configure:
+            return
+        cmd = [sys.executable, "config_docker.py", "--resource-profile", self.args.resource_profile]
+        if self.args.fleet:
+            cmd += ["--fleet", self.args.fleet]
+        if self.args.shared_store:
+            cmd += ["--shared-store", self.args.shared_store]
+        await run(*cmd)
+
+    async def build(self):
+        if self.args.skip_build:
+            return
+        # All gateways share one image, build it once instead of once per compose project
+        with open(COMPOSE_TEMPLATE) as f:
+            image = re.search(r"image: (\S+)", f.read()).group(1)
+        await run(
+            "docker", "build", "-t", image,
+            "--build-arg", f"PREBAKE_INSTALL={str(self.args.prebaked).lower()}", ".",
+        )
+
+    async def bring_up(self, gateway_dir: Path, prerequisites: list):
+        name = gateway_dir.name if gateway_dir != Path(".") else DEFAULT_GATEWAY
+        try:
+            await asyncio.gather(*prerequisites)
+        except StageFailed:
+            self.failures.setdefault(name, "skipped, a site stage failed")
+            return
+        # The semaphore covers the boot as well as the start, that is where the CPU goes
+        async with self.semaphore:
+            try:
+                await self.stage(name, "start", self.backend.start(gateway_dir))
+                await self.stage(name, "healthy", self.backend.wait_healthy(gateway_dir, self.args.timeout))
+            except StageFailed:
+                return
+
+    async def run(self):
+        # Created inside the running loop
+        self.semaphore = asyncio.Semaphore(self.args.max_parallel)
+        configure = asyncio.ensure_future(self.stage("site", "configure", self.configure()))
+        build = asyncio.ensure_future(self.stage("site", "build", self.build()))
+        await asyncio.gather(
+            *[self.bring_up(gateway_dir, [configure, build]) for gateway_dir in self.gateway_dirs],
+            return_exceptions=True,
+        )
+
+    def report(self):
+        stages = ["configure", "build", "start", "healthy"]
+        print(f"\n{'gateway':<24}" + "".join(f"{stage:>12}" for stage in stages))
+        for name, timings in self.timings.items():
+            print(f"{name:<24}" + "".join(f"{timings[s]:>11.1f}s" if s in timings else f"{'-':>12}" for s in stages))
+        for name, reason in self.failures.items():
+            print(f"{name:<24} FAILED {reason}")
+        healthy = sum(1 for timings in self.timings.values() if "healthy" in timings)
+        print(f"Wall time {time.monotonic() - self.started:.1f}s, {healthy} of {len(self.gateway_dirs)} gateways healthy")
+
+
+def make_backend(args):
+    if args.backend == "engine":
+        from docker_engine import EngineBackend
+
+        return EngineBackend(args.docker_socket)
+    return ComposeBackend()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Configure, build, start and wait for all gateways of a site")
+    parser.add_argument("--fleet", help="Fleet file passed to config_docker.py")
+    parser.add_argument("--gateway", action="append", help="Only bring up these gateways, 'default' for the docker/ directory")
+    parser.add_argument("--shared-store", help="Shared artifact store passed to config_docker.py")
+    parser.add_argument("--resource-profile", default="medium", help="Resource profile passed to config_docker.py")
+    parser.add_argument("--prebaked", action="store_true", help="Build the image with PREBAKE_INSTALL=true")
+    parser.add_argument("--skip-configure", action="store_true", help="Use the configuration already rendered")
+    parser.add_argument("--skip-build", action="store_true", help="Use the image already built")
+    parser.add_argument("--max-parallel", type=int, default=DEFAULT_MAX_PARALLEL, help="Gateways starting at once")
+    parser.add_argument("--backend", choices=["compose", "engine"], default="compose", help="Start containers with docker-compose or the Docker Engine API")
+    parser.add_argument("--docker-socket", help="Engine API socket, defaults to DOCKER_HOST or /var/run/docker.sock")
+    parser.add_argument("--timeout", type=float, default=900, help="Seconds for a gateway to become healthy")
+    args = parser.parse_args()
+
+    verify_cwd()
+    names = args.gateway or [DEFAULT_GATEWAY] + [g["name"] for g in (read_fleet(args.fleet) if args.fleet else [])]
+    gateway_dirs = [Path(".") if name == DEFAULT_GATEWAY else Path(FLEET_DIR, name) for name in names]
+
+    orchestrator = Orchestrator(args, gateway_dirs, make_backend(args))
+    asyncio.run(orchestrator.run())
+    orchestrator.report()
+    if orchestrator.failures:
+        sys.exit(1)
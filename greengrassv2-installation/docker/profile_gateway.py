@@ -0,0 +1,190 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Measure startup time and memory footprint of the gateway container for each
+resource profile in templates/profiles.json.
+
+Each profile is started from a scratch Greengrass root using the certificates
+and config.yaml created by config_docker.py, so the gateway must be configured
+and stopped ('make stop') before profiling; the same thing cannot connect twice.
+
+    python3 profile_gateway.py --profiles small medium --settle 300
+
+Results are written to profiles-results.json and can be fed to the density
+planner.
+"""
+
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+from pathlib import Path
+
+from config_docker import read_profile, parse_size, verify_cwd
+
+IMAGE = "x86_64/aws-iot-greengrass:2.10.3"
+PROFILING_DIR = Path("./volumes/profiling")
+CONFIG_FILE = Path("./volumes/config/config.yaml")
+CERTS_DIR = Path("./volumes/certs")
+RESULTS_FILE = "profiles-results.json"
+MEMORY_UNITS = {"B": 1, "KiB": 1 << 10, "MiB": 1 << 20, "GiB": 1 << 30, "kB": 1000, "MB": 1000**2, "GB": 1000**3}
+# memory.stat of the container cgroup as seen inside the container, cgroup v2 then v1
+MEMORY_STAT_FILES = ("/sys/fs/cgroup/memory.stat", "/sys/fs/cgroup/memory/memory.stat")
+
+
+def docker(*args, check: bool = True) -> str:
+    result = subprocess.run(["docker", *args], capture_output=True, text=True)
+    if check and result.returncode != 0:
+        print(f"docker {' '.join(args)} failed: {result.stderr.strip()}")
+        sys.exit(1)
+    return result.stdout.strip()
+
+
+def parse_memory_usage(usage: str) -> int:
+    """Convert the used part of docker stats MemUsage ('312.5MiB / 1GiB') to bytes"""
+    match = re.match(r"\s*([\d.]+)\s*([A-Za-z]+)", usage)
+    if not match:
+        return 0
+    return int(float(match.group(1)) * MEMORY_UNITS.get(match.group(2), 1))
+
+
+def read_rss(container: str) -> int:
+    """Resident memory of a container from its cgroup memory.stat: 'anon' on
+    cgroup v2, 'total_rss' on cgroup v1. Unlike docker stats MemUsage it leaves
+    out the page cache of the files the container read or wrote"""
+    output = docker("exec", container, "cat", *MEMORY_STAT_FILES, check=False)
+    stat = dict(line.split(" ", 1) for line in output.splitlines() if " " in line)
+    for key in ("anon", "total_rss", "rss"):
+        if key in stat:
+            return int(stat[key])
+    return 0
+
+
+def read_timings(gg_root: Path) -> dict:
+    """Read the phase timings written by greengrass-entrypoint.sh"""
+    timings = {}
+    timings_file = gg_root / "logs" / "startup-timings.log"
+    if timings_file.is_file():
+        for line in timings_file.read_text().splitlines():
+            parts = line.split()
+            if len(parts) == 3:
+                timings[parts[1]] = int(parts[2])
+    return timings
+
+
+def read_cds_mapped(gg_root: Path):
+    """Whether the nucleus JVM mapped the AppCDS archive, from its -Xlog:cds
+    output. None when the profile does not use CDS"""
+    cds_log = gg_root / "logs" / "cds.log"
+    if not cds_log.is_file():
+        return None
+    return "UseSharedSpaces:" not in cds_log.read_text()
+
+
+def prepare_scratch(profile_name: str, values: dict) -> Path:
+    """Create an empty Greengrass root and a config.yaml carrying the profile JVM options"""
+    scratch = PROFILING_DIR / profile_name
+    if scratch.exists():
+        shutil.rmtree(scratch)
+    (scratch / "gg_root").mkdir(parents=True)
+    (scratch / "config").mkdir()
+    config = re.sub(
+        r'jvmOptions: ".*"', f'jvmOptions: "{values["JVM_OPTIONS"]}"', CONFIG_FILE.read_text()
+    )
+    (scratch / "config" / "config.yaml").write_text(config)
+    return scratch
+
+
+def profile_run(profile_name: str, region: str, image: str, timeout: int, settle: int, interval: int) -> dict:
+    """Start one container with the profile limits, wait for the nucleus to
+    connect, then sample resident memory until the settle time is over"""
+
+    values = read_profile(profile_name)
+    scratch = prepare_scratch(profile_name, values)
+    container = f"sitewise-profile-{profile_name}"
+    docker("rm", "-f", container, check=False)
+    docker(
+        "run", "-d", "--init", "--name", container,
+        "--cpus", values["CPU_LIMIT"],
+        "--cpu-shares", values["CPU_SHARES"],
+        "--memory", values["MEMORY_LIMIT"],
+        "--memory-reservation", values["MEMORY_RESERVATION"],
+        "-v", f"{(scratch / 'gg_root').absolute()}:/greengrass/v2",
+        "-v", f"{(scratch / 'config').absolute()}:/tmp/config/:ro",
+        "-v", f"{CERTS_DIR.absolute()}:/tmp/certs:ro",
+        "-e", "GGC_ROOT_PATH=/greengrass/v2",
+        "-e", "PROVISION=false",
+        "-e", "COMPONENT_DEFAULT_USER=ggc_user:ggc_group",
+        "-e", "DEPLOY_DEV_TOOLS=false",
+        "-e", "INIT_CONFIG=/tmp/config/config.yaml",
+        "-e", f"AWS_REGION={region}",
+        "-e", "TINI_KILL_PROCESS_GROUP=1",
+        "-e", f"JVM_OPTIONS={values['JVM_OPTIONS']}",
+        image,
+    )
+    print(f"Started {container}, waiting up to {timeout}s for the nucleus to connect")
+
+    samples = []
+    usage_samples = []
+    started = time.monotonic()
+    connected_at = None
+    try:
+        while True:
+            elapsed = time.monotonic() - started
+            samples.append(read_rss(container))
+            usage_samples.append(parse_memory_usage(docker("stats", "--no-stream", "--format", "{{.MemUsage}}", container)))
+            if connected_at is None and "nucleus_connected" in read_timings(scratch / "gg_root"):
+                connected_at = elapsed
+                print(f"Nucleus connected after {elapsed:.0f}s, sampling memory for {settle}s")
+            if connected_at is None and elapsed > timeout:
+                print(f"Profile '{profile_name}' did not connect within {timeout}s")
+                break
+            if connected_at is not None and elapsed - connected_at > settle:
+                break
+            time.sleep(interval)
+    finally:
+        docker("rm", "-f", container, check=False)
+
+    steady = samples[-max(1, len(samples) // 4):]
+    return {
+        "connected": connected_at is not None,
+        "timings_ms": read_timings(scratch / "gg_root"),
+        "cds_mapped": read_cds_mapped(scratch / "gg_root"),
+        "rss_peak_bytes": max(samples, default=0),
+        "rss_steady_bytes": int(sum(steady) / len(steady)) if steady else 0,
+        # docker stats MemUsage, includes the page cache the memory limit also counts
+        "memory_usage_peak_bytes": max(usage_samples, default=0),
+        "disk_bytes": sum(f.stat().st_size for f in (scratch / "gg_root").rglob("*") if f.is_file()),
+        "memory_limit_bytes": parse_size(values["MEMORY_LIMIT"]),
+        "cpus": float(values["CPU_LIMIT"]),
+        "jvm_options": values["JVM_OPTIONS"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure gateway startup and memory per resource profile")
+    parser.add_argument("--profiles", nargs="+", required=True, help="Profile names from templates/profiles.json")
+    parser.add_argument("--image", default=IMAGE, help="Gateway image built with 'make build'")
+    parser.add_argument("--timeout", type=int, default=600, help="Seconds to wait for the nucleus to connect")
+    parser.add_argument("--settle", type=int, default=300, help="Seconds to sample memory after connecting")
+    parser.add_argument("--interval", type=int, default=5, help="Seconds between memory samples")
+    parser.add_argument("--output", default=RESULTS_FILE, help="JSON file to merge results into")
+    args = parser.parse_args()
+
+    verify_cwd()
+    if not CONFIG_FILE.is_file():
+        print(f"{CONFIG_FILE} not found, run 'python3 config_docker.py' first")
+        sys.exit(1)
+    region = re.search(r'awsRegion: "(.*)"', CONFIG_FILE.read_text()).group(1)
+
+    output = Path(args.output)
+    results = json.loads(output.read_text()) if output.is_file() else {}
+    for name in args.profiles:
+        results[name] = profile_run(name, region, args.image, args.timeout, args.settle, args.interval)
+        print(f"Profile '{name}': {json.dumps(results[name])}")
+        output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
@@ -0,0 +1,141 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Journal of gateways rendered by config_docker.py, used to resume interrupted runs.
+
+For every gateway that was moved into place the journal records the hash of
+its template inputs and the SHA-256 of each generated file. On a rerun a
+gateway is
+
+    complete   inputs unchanged and every file matches its hash, skipped
+    stale      journaled but inputs changed or files are missing or modified,
+               regenerated, reusing its certificate and key if they still match
+    new        not journaled, rendered from scratch
+
+Before a batch is moved into place its gateways are held: the journal lists
+their directories and keeps the certificate and private key issued for them.
+A run that stops between issuing and recording a batch therefore leaves no
+directory the next run refuses to overwrite, and the next run writes the held
+certificate instead of issuing another one. The journal holds private keys
+and is only readable by its owner.
+
+The journal is rewritten with a rename after each step, so it never lists a
+gateway as complete whose files were not completely written.
+"""
+
+import os
+import json
+import hashlib
+from pathlib import Path
+from datetime import datetime, timezone
+
+JOURNAL_FILE = "./render-journal.json"
+CERTIFICATE_FILE = "volumes/certs/device.pem.crt"
+PRIVATE_KEY_FILE = "volumes/certs/private.pem.key"
+GATEWAY_FILES = [
+    CERTIFICATE_FILE,
+    PRIVATE_KEY_FILE,
+    "volumes/certs/AmazonRootCA1.pem",
+    "volumes/config/config.yaml",
+    "docker-compose.yml",
+]
+
+COMPLETE = "complete"
+STALE = "stale"
+NEW = "new"
+
+
+def file_hash(path: Path) -> str:
+    """SHA-256 of a file, None if it does not exist"""
+    if not path.is_file():
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def inputs_hash(values: dict, template_files: list) -> str:
+    """Hash of the template values and template contents a gateway is rendered from"""
+    digest = hashlib.sha256(json.dumps(values, sort_keys=True).encode())
+    for template in template_files:
+        digest.update(Path(template).read_bytes())
+    return digest.hexdigest()
+
+
+class RenderJournal:
+    def __init__(self, path: str = JOURNAL_FILE):
+        self.path = Path(path)
+        self.gateways = {}
+        self.held = {}
+        if self.path.is_file():
+            with open(self.path) as f:
+                journal = json.load(f)
+            self.gateways = journal["gateways"]
+            self.held = journal.get("held", {})
+
+    def _files_match(self, entry: dict, gateway_dir: Path, files: list) -> bool:
+        return all(file_hash(gateway_dir / name) == entry["files"].get(name) for name in files)
+
+    def status(self, name: str, gateway_dir: Path, inputs: str) -> str:
+        entry = self.gateways.get(name)
+        if entry is None:
+            return NEW
+        if entry["inputs"] == inputs and self._files_match(entry, gateway_dir, GATEWAY_FILES):
+            return COMPLETE
+        return STALE
+
+    def reusable_certificate(self, name: str, gateway_dir: Path) -> tuple:
+        """(certificate_pem, private_key_pem) of a journaled gateway if both
+        files are unchanged, else the ones held for it, else None"""
+
+        entry = self.gateways.get(name)
+        if entry is not None and self._files_match(entry, gateway_dir, [CERTIFICATE_FILE, PRIVATE_KEY_FILE]):
+            return (gateway_dir / CERTIFICATE_FILE).read_text(), (gateway_dir / PRIVATE_KEY_FILE).read_text()
+        held = self.held.get(name)
+        if held is not None and held["dir"] == str(gateway_dir):
+            return held["certificate"], held["private_key"]
+        return None
+
+    def hold(self, name: str, gateway_dir: Path, certificate_pem: str, private_key_pem: str):
+        """Keep the certificate of a gateway about to be written until it is recorded"""
+        self.held[name] = {
+            "dir": str(gateway_dir),
+            "certificate": certificate_pem,
+            "private_key": private_key_pem,
+            "held": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+
+    def directories(self) -> set:
+        """Directories of recorded and held gateways, written by config_docker.py"""
+        return {entry["dir"] for entry in (*self.gateways.values(), *self.held.values())}
+
+    def record(self, name: str, gateway_dir: Path, inputs: str):
+        self.held.pop(name, None)
+        self.gateways[name] = {
+            "dir": str(gateway_dir),
+            "inputs": inputs,
+            "files": {file: file_hash(gateway_dir / file) for file in GATEWAY_FILES},
+            "completed": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+
+    def rehash(self, name: str, gateway_dir: Path, files: list):
+        """Record new hashes for files changed outside config_docker.py, e.g. rotated certificates"""
+        if name in self.gateways:
+            self.gateways[name]["files"].update({file: file_hash(gateway_dir / file) for file in files})
+
+    def forget(self, gateway_dir: Path):
+        """Drop the entry of a gateway directory"""
+        self.gateways = {name: entry for name, entry in self.gateways.items() if entry["dir"] != str(gateway_dir)}
+
+    def save(self):
+        staging = self.path.parent / f".{self.path.name}.staging"
+        # Held private keys, readable by the owner only
+        fd = os.open(staging, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(fd, "w") as f:
+            json.dump({"gateways": self.gateways, "held": self.held}, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(staging, self.path)
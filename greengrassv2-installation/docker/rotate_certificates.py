@@ -0,0 +1,303 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Rotate the device certificate of gateway containers, restarting each container once.
+
+The rotation is not restart free: the nucleus reads its key pair only at start,
+has no reload signal, and its MQTT reconnects reuse the TLS context it loaded
+then. OPC UA values are not collected from the restart until the nucleus has
+connected again, and the status of each gateway reports that time.
+
+For each gateway directory (holding docker-compose.yml and volumes/) whose
+certificate is due, the rotation:
+
+1. issues a new certificate, from a locally generated key and CSR with --csr
+   (gateways rendered by config_docker.py --csr or --fleet, implied when the
+   stack was deployed with CertificateFromCsr) or with a key pair
+   from AWS IoT, and attaches the policies of the current certificate and the
+   thing to it, so both certificates are valid at once
+2. updates the certificate and private key parameters in Parameter Store,
+   except with --csr where the private key never leaves this host
+3. writes the new files to volumes/certs/<certificate id>/ and swaps the
+   volumes/certs/active symlink with a single rename; device.pem.crt and
+   private.pem.key are symlinks into active/, so the pair changes atomically
+4. restarts the container, as the nucleus only loads the key pair at start,
+   and waits until the container started after the swap, sees the new
+   certificate and logs a connection to AWS IoT Core. StreamManager keeps
+   its streams on disk, so only the values of the restart itself are missing
+5. only then detaches and deactivates the previous certificate
+
+Gateways are rotated in parallel batches; a batch with failures stops the run.
+
+    python3 rotate_certificates.py --gateway-dir . --gateway-dir ../account-b --renew-before-days 30
+    python3 rotate_certificates.py --gateway-dir gateways/line1 --csr --force
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import threading
+import subprocess
+from pathlib import Path
+from datetime import datetime, timezone, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import yaml
+from botocore.exceptions import ClientError
+
+import render_journal
+from config_docker import generate_key_and_csr
+
+CERTIFICATE_FILE = "device.pem.crt"
+PRIVATE_KEY_FILE = "private.pem.key"
+ACTIVE_LINK = "active"
+CONNECTED_MARKER = "Successfully connected to AWS IoT Core"
+# Where the nucleus reads the certificate, certificateFilePath of templates/config.yaml.template
+CONTAINER_CERTIFICATE_PATH = "/tmp/certs/device.pem.crt"
+DEFAULT_STACK_NAME = "IotFactoryCdkStack"
+JOURNAL_PATH = Path(__file__).resolve().parent / render_journal.JOURNAL_FILE
+journal_lock = threading.Lock()
+
+
+class Gateway:
+    """Paths, names and AWS clients of one gateway directory"""
+
+    def __init__(self, gateway_dir: str, stack_name: str):
+        self.dir = Path(gateway_dir).resolve()
+        self.certs = self.dir / "volumes" / "certs"
+        config = (self.dir / "volumes" / "config" / "config.yaml").read_text()
+        self.thing_name = re.search(r'thingName: "(.*)"', config).group(1)
+        self.region = re.search(r'awsRegion: "(.*)"', config).group(1)
+        with open(self.dir / "docker-compose.yml") as f:
+            compose = yaml.safe_load(f)
+        self.container = next(iter(compose["services"].values()))["container_name"]
+        self.log_file = self.dir / "volumes" / "gg_root" / "logs" / "greengrass.log"
+        self.certificate_parameter = f"/{stack_name}/{self.thing_name}/certificate_pem"
+        self.private_key_parameter = f"/{stack_name}/{self.thing_name}/private_key"
+        session = boto3.Session(region_name=self.region)
+        self.iot = session.client("iot")
+        self.ssm = session.client("ssm")
+
+
+def current_certificate_id(gateway: Gateway) -> str:
+    """Find the attached certificate whose PEM matches the one in the certs volume"""
+    pem = (gateway.certs / CERTIFICATE_FILE).read_text().strip()
+    principals = gateway.iot.list_thing_principals(thingName=gateway.thing_name)["principals"]
+    for principal in principals:
+        certificate_id = principal.split("/")[-1]
+        description = gateway.iot.describe_certificate(certificateId=certificate_id)["certificateDescription"]
+        if description["certificatePem"].strip() == pem:
+            return certificate_id
+    raise RuntimeError(f"Certificate in {gateway.certs} is not attached to thing {gateway.thing_name}")
+
+
+def rotation_due(gateway: Gateway, certificate_id: str, renew_before_days: int, max_age_days: int) -> bool:
+    description = gateway.iot.describe_certificate(certificateId=certificate_id)["certificateDescription"]
+    now = datetime.now(timezone.utc)
+    if description["validity"]["notAfter"] - now < timedelta(days=renew_before_days):
+        return True
+    return max_age_days is not None and now - description["creationDate"] > timedelta(days=max_age_days)
+
+
+def issue_certificate(gateway: Gateway, old_certificate_id: str, csr: bool) -> dict:
+    """Create a new active certificate with the same policies and thing as the old one"""
+    if csr:
+        private_key, csr_pem = generate_key_and_csr(gateway.thing_name)
+        response = gateway.iot.create_certificate_from_csr(certificateSigningRequest=csr_pem, setAsActive=True)
+    else:
+        response = gateway.iot.create_keys_and_certificate(setAsActive=True)
+        private_key = response["keyPair"]["PrivateKey"]
+    old_arn = gateway.iot.describe_certificate(certificateId=old_certificate_id)["certificateDescription"]["certificateArn"]
+    for policy in gateway.iot.list_attached_policies(target=old_arn)["policies"]:
+        gateway.iot.attach_policy(policyName=policy["policyName"], target=response["certificateArn"])
+    gateway.iot.attach_thing_principal(thingName=gateway.thing_name, principal=response["certificateArn"])
+    return {
+        "certificate_id": response["certificateId"],
+        "certificate_arn": response["certificateArn"],
+        "certificate_pem": response["certificatePem"],
+        "private_key": private_key,
+    }
+
+
+def has_parameters(gateway: Gateway) -> bool:
+    try:
+        gateway.ssm.get_parameter(Name=gateway.certificate_parameter)
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ParameterNotFound":
+            return False
+        raise
+    return True
+
+
+def update_parameters(gateway: Gateway, certificate: dict):
+    """Overwrite the Parameter Store values created by the IotThingCertPolicy construct"""
+    gateway.ssm.put_parameter(
+        Name=gateway.certificate_parameter, Value=certificate["certificate_pem"], Type="String", Overwrite=True, Tier="Advanced"
+    )
+    gateway.ssm.put_parameter(
+        Name=gateway.private_key_parameter, Value=certificate["private_key"], Type="SecureString", Overwrite=True, Tier="Advanced"
+    )
+
+
+def swap_certificate_files(certs: Path, certificate_id: str, certificate_pem: str, private_key: str):
+    """Write the new pair into its own directory and switch the active link to it"""
+
+    generation = certs / certificate_id[:16]
+    generation.mkdir(exist_ok=True)
+    for name, content, mode in ((CERTIFICATE_FILE, certificate_pem, 0o644), (PRIVATE_KEY_FILE, private_key, 0o600)):
+        path = generation / name
+        with open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode), "w") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+
+    staging = certs / f".{ACTIVE_LINK}.tmp"
+    if staging.is_symlink():
+        staging.unlink()
+    staging.symlink_to(generation.name)
+    os.replace(staging, certs / ACTIVE_LINK)
+
+    # The first rotation replaces the plain files written by config_docker.py with links into active/
+    for name in (CERTIFICATE_FILE, PRIVATE_KEY_FILE):
+        path = certs / name
+        if not path.is_symlink():
+            link = certs / f".{name}.tmp"
+            if link.is_symlink():
+                link.unlink()
+            link.symlink_to(f"{ACTIVE_LINK}/{name}")
+            os.replace(link, path)
+    directory = os.open(certs, os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+def update_journal(gateway: Gateway):
+    """Record the rotated files in the config_docker.py render journal so a
+    later configuration run does not treat the gateway as stale"""
+
+    if not JOURNAL_PATH.is_file():
+        return
+    with journal_lock:
+        journal = render_journal.RenderJournal(JOURNAL_PATH)
+        journal.rehash(gateway.thing_name, gateway.dir, [render_journal.CERTIFICATE_FILE, render_journal.PRIVATE_KEY_FILE])
+        journal.save()
+
+
+def container_started_at(gateway: Gateway) -> datetime:
+    started = subprocess.run(
+        ["docker", "inspect", "--format", "{{.State.StartedAt}}", gateway.container],
+        capture_output=True, text=True, check=True,
+    ).stdout.strip()
+    # Docker reports up to nanoseconds, datetime parses exactly microseconds
+    seconds, _, fraction = started.rstrip("Z").partition(".")
+    return datetime.fromisoformat(f"{seconds}.{fraction[:6]:0<6}+00:00")
+
+
+def restart_nucleus(gateway: Gateway, stop_timeout: int):
+    """Restart the container so the nucleus loads the new key pair. The nucleus
+    has no reload signal, and a reconnect reuses the TLS context it loaded at start"""
+
+    subprocess.run(["docker", "restart", "--time", str(stop_timeout), gateway.container], check=True, capture_output=True)
+
+
+def new_certificate_in_use(gateway: Gateway, certificate_pem: str, swapped_at: datetime, offset: int, timeout: int) -> bool:
+    """Wait until the nucleus connected with the new certificate: the container
+    started after the swap, so it loaded the key pair after it, the certificate
+    it reads is the new one, and it logged a connection since the restart"""
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if gateway.log_file.exists():
+            if gateway.log_file.stat().st_size < offset:
+                # The log was rotated during the restart
+                offset = 0
+            with open(gateway.log_file, errors="replace") as f:
+                f.seek(offset)
+                connected = CONNECTED_MARKER in f.read()
+            if connected:
+                if container_started_at(gateway) <= swapped_at:
+                    return False
+                presented = subprocess.run(
+                    ["docker", "exec", gateway.container, "cat", CONTAINER_CERTIFICATE_PATH],
+                    capture_output=True, text=True, check=True,
+                ).stdout
+                return presented.strip() == certificate_pem.strip()
+        time.sleep(2)
+    return False
+
+
+def retire_certificate(gateway: Gateway, certificate_id: str, delete: bool):
+    arn = gateway.iot.describe_certificate(certificateId=certificate_id)["certificateDescription"]["certificateArn"]
+    gateway.iot.detach_thing_principal(thingName=gateway.thing_name, principal=arn)
+    for policy in gateway.iot.list_attached_policies(target=arn)["policies"]:
+        gateway.iot.detach_policy(policyName=policy["policyName"], target=arn)
+    gateway.iot.update_certificate(certificateId=certificate_id, newStatus="INACTIVE")
+    if delete:
+        gateway.iot.delete_certificate(certificateId=certificate_id)
+
+
+def rotate(gateway_dir: str, args) -> str:
+    """Rotate one gateway, returning a status string"""
+
+    gateway = Gateway(gateway_dir, args.stack_name)
+    old_certificate_id = current_certificate_id(gateway)
+    if not args.force and not rotation_due(gateway, old_certificate_id, args.renew_before_days, args.max_age_days):
+        return "not due"
+
+    # Gateways of a stack deployed with CertificateFromCsr have no Parameter Store values to update
+    csr = args.csr or not has_parameters(gateway)
+    certificate = issue_certificate(gateway, old_certificate_id, csr)
+    if not csr:
+        update_parameters(gateway, certificate)
+    swap_certificate_files(gateway.certs, certificate["certificate_id"], certificate["certificate_pem"], certificate["private_key"])
+    update_journal(gateway)
+
+    swapped_at = datetime.now(timezone.utc)
+    offset = gateway.log_file.stat().st_size if gateway.log_file.exists() else 0
+    restarted = time.monotonic()
+    restart_nucleus(gateway, args.stop_timeout)
+    if not new_certificate_in_use(gateway, certificate["certificate_pem"], swapped_at, offset, args.reconnect_timeout):
+        # Both certificates stay valid, the old one is only retired once the new one is proven in use
+        return f"rotated to {certificate['certificate_id']}, connection with it not confirmed, kept {old_certificate_id} active"
+    # Upper bound of the collection gap, the log is polled every 2 seconds
+    gap = time.monotonic() - restarted
+    retire_certificate(gateway, old_certificate_id, args.delete_old)
+    return f"rotated to {certificate['certificate_id']} with {gap:.0f}s from restart to reconnect, retired {old_certificate_id}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rotate gateway certificates")
+    parser.add_argument("--gateway-dir", action="append", default=[], help="Gateway directory, repeatable")
+    parser.add_argument("--stack-name", default=DEFAULT_STACK_NAME, help="Stack name used in the Parameter Store names")
+    parser.add_argument("--renew-before-days", type=int, default=30, help="Rotate when the certificate expires sooner")
+    parser.add_argument("--max-age-days", type=int, help="Rotate certificates older than this")
+    parser.add_argument("--force", action="store_true", help="Rotate regardless of age and expiry")
+    parser.add_argument("--batch-size", type=int, default=10, help="Gateways rotated in parallel")
+    parser.add_argument("--csr", action="store_true", help="Generate the key locally and issue the certificate from a CSR, "
+                                                         "implied when the stack created no Parameter Store values")
+    parser.add_argument("--stop-timeout", type=int, default=60, help="Seconds the nucleus gets to stop before it is killed")
+    parser.add_argument("--reconnect-timeout", type=int, default=300, help="Seconds to wait for the restarted nucleus to connect")
+    parser.add_argument("--delete-old", action="store_true", help="Delete instead of only deactivating old certificates")
+    args = parser.parse_args()
+
+    gateway_dirs = args.gateway_dir or [os.path.dirname(os.path.abspath(__file__))]
+    failed = []
+    with ThreadPoolExecutor(max_workers=args.batch_size) as executor:
+        for start in range(0, len(gateway_dirs), args.batch_size):
+            batch = gateway_dirs[start:start + args.batch_size]
+            futures = {executor.submit(rotate, gateway_dir, args): gateway_dir for gateway_dir in batch}
+            for future, gateway_dir in futures.items():
+                try:
+                    print(f"{gateway_dir}: {future.result()}")
+                except (ClientError, RuntimeError, OSError, subprocess.CalledProcessError) as e:
+                    print(f"{gateway_dir}: rotation failed, {e}")
+                    failed.append(gateway_dir)
+            if failed:
+                print(f"Stopping after batch with failures: {failed}")
+                sys.exit(1)
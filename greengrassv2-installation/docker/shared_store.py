@@ -0,0 +1,347 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Host level store for immutable Greengrass artifacts shared by every gateway
+container on the host.
+
+Component packages (the SiteWise collector and publisher, StreamManager,
+the nucleus distro) are identical for every gateway that runs the same
+component versions. Instead of each ``volumes/gg_root`` holding its own
+copy, the files live once in the shared store and each gateway root only
+holds hard links to them. Mutable state (config, logs, deployments) is never
+touched and stays per container.
+
+Hard links are used rather than a read-only bind mount because Greengrass
+re-applies artifact permissions on every deployment, which fails on a
+read-only file system. All links of a file share one inode, so a write or a
+chmod through any gateway root is seen by every gateway. Nothing here relies
+on Greengrass never doing that:
+
+- the mode Greengrass gave a file is kept, the store does not chmod the
+  shared inode
+- the SHA-256 of every file is recorded in the store manifest when it enters
+  the store, and checked before the file is linked into a gateway root again.
+  A file that changed since is reported and no longer linked. The manifest
+  also keeps the inode, size and mtime the digest was taken at, so a file is
+  only hashed again when one of them changed, not once per gateway seeded
+- unshare replaces the links of a gateway root with private copies, run it
+  before anything that changes artifacts in place, such as editing a
+  component artifact while debugging
+
+    python3 shared_store.py harvest   # move artifacts of ./volumes/gg_root into the store
+    python3 shared_store.py seed      # link store artifacts into ./volumes/gg_root
+    python3 shared_store.py status    # report shared and private artifact bytes
+    python3 shared_store.py verify    # list store files that changed since they were recorded
+    python3 shared_store.py unshare   # give ./volumes/gg_root private copies of shared artifacts
+"""
+
+import os
+import sys
+import json
+import errno
+import shutil
+import hashlib
+import argparse
+from pathlib import Path
+
+DEFAULT_STORE_PATH = "./volumes/shared"
+DEFAULT_GG_ROOT_PATH = "./volumes/gg_root"
+
+# Immutable artifact trees below the Greengrass root, with the nucleus distro
+# of every launch directory below alts/ (see _shared_trees). Everything else
+# under the root (config/, logs/, deployments/, work/, launch.params) is per
+# gateway state.
+SHARED_TREES = [
+    "packages/artifacts",
+    "packages/artifacts-unarchived",
+]
+ALTS_DIR = "alts"
+DISTRO_DIR = "distro"
+
+# By path relative to the store, {"sha256": digest when the file entered the
+# store, "stat": [inode, size, mtime_ns] the digest was last confirmed at}
+MANIFEST_FILE = ".manifest.json"
+
+
+def _shared_trees(root: Path) -> list:
+    """Shared trees below root: the artifact trees and alts/<launch dir>/distro.
+    current, old and new below alts/ are symlinks to launch directories and are
+    left out, so a distro is only walked under its real directory name"""
+    trees = list(SHARED_TREES)
+    alts = root / ALTS_DIR
+    if alts.is_dir():
+        for launch_dir in sorted(alts.iterdir()):
+            if launch_dir.is_dir() and not launch_dir.is_symlink() and (launch_dir / DISTRO_DIR).is_dir():
+                trees.append(f"{ALTS_DIR}/{launch_dir.name}/{DISTRO_DIR}")
+    return trees
+
+
+def _walk_files(root: Path):
+    """Yield the path of each regular file below root, relative to root"""
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = Path(dirpath, name)
+            if path.is_file() and not path.is_symlink():
+                yield path.relative_to(root)
+
+
+def _same_file(a: Path, b: Path) -> bool:
+    try:
+        return os.path.samefile(a, b)
+    except OSError:
+        return False
+
+
+def _digest(path: Path, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(store: Path) -> dict:
+    try:
+        with open(store / MANIFEST_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(store: Path, manifest: dict):
+    path = store / MANIFEST_FILE
+    with open(path.with_name(f"{MANIFEST_FILE}.tmp"), "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path.with_name(f"{MANIFEST_FILE}.tmp"), path)
+
+
+def _fingerprint(path: Path) -> list:
+    stat = path.stat()
+    return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+
+def _record(store: Path, key: str, manifest: dict):
+    manifest[key] = {"sha256": _digest(store / key), "stat": _fingerprint(store / key)}
+
+
+def _unchanged(store: Path, key: str, manifest: dict) -> bool:
+    """Whether a store file still has its recorded content. The file is only
+    hashed when its inode, size or mtime differ from the last confirmation.
+    Files of stores harvested before the manifest existed are recorded as
+    they are now"""
+    entry = manifest.get(key)
+    if entry is None:
+        _record(store, key, manifest)
+        return True
+    if isinstance(entry, str):
+        # Manifest written before the stat was kept
+        entry = {"sha256": entry, "stat": None}
+    fingerprint = _fingerprint(store / key)
+    if entry["stat"] == fingerprint:
+        return True
+    if _digest(store / key) != entry["sha256"]:
+        return False
+    manifest[key] = {"sha256": entry["sha256"], "stat": fingerprint}
+    return True
+
+
+def _link_or_copy(source: Path, target: Path) -> bool:
+    """Hard link source to target, replacing target. Falls back to a copy when
+    the store and gateway root are on different file systems.
+
+    :return: True when a link was created, False when the file was copied
+    """
+    target.parent.mkdir(parents=True, exist_ok=True)
+    staging = target.with_name(f".{target.name}.shared")
+    if staging.exists():
+        staging.unlink()
+    try:
+        os.link(source, staging)
+        linked = True
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        shutil.copy2(source, staging)
+        linked = False
+    os.replace(staging, target)
+    return linked
+
+
+def _files_equal(a: Path, b: Path, chunk_size: int = 1 << 20) -> bool:
+    if a.stat().st_size != b.stat().st_size:
+        return False
+    with open(a, "rb") as fa, open(b, "rb") as fb:
+        while True:
+            chunk_a = fa.read(chunk_size)
+            if chunk_a != fb.read(chunk_size):
+                return False
+            if not chunk_a:
+                return True
+
+
+def harvest(gg_root: Path, store: Path) -> dict:
+    """Move immutable artifacts of a gateway root into the store and replace
+    them with hard links. Files already in the store with identical content
+    are deduplicated; differing files, and store files that changed since
+    they were recorded, are left untouched in the gateway root.
+
+    :param gg_root: Greengrass root of a gateway, e.g. ./volumes/gg_root
+    :param store: shared store directory
+    :return: counters of files moved, linked, skipped and changed
+    """
+
+    counts = {"moved": 0, "linked": 0, "skipped": 0, "changed": 0}
+    manifest = load_manifest(store)
+    try:
+        for tree in _shared_trees(gg_root):
+            source_tree = gg_root / tree
+            if not source_tree.is_dir():
+                continue
+            for relative in _walk_files(source_tree):
+                gateway_file = source_tree / relative
+                store_file = store / tree / relative
+                key = f"{tree}/{relative}"
+                if _same_file(gateway_file, store_file):
+                    continue
+                if not store_file.exists():
+                    store_file.parent.mkdir(parents=True, exist_ok=True)
+                    shutil.copy2(gateway_file, store_file)
+                    _record(store, key, manifest)
+                    counts["moved"] += 1
+                elif not _unchanged(store, key, manifest):
+                    print(f"Store copy of {key} changed since it was recorded, keeping private copy")
+                    counts["changed"] += 1
+                    continue
+                elif not _files_equal(gateway_file, store_file):
+                    print(f"Store copy of {key} differs, keeping private copy")
+                    counts["skipped"] += 1
+                    continue
+                if _link_or_copy(store_file, gateway_file):
+                    counts["linked"] += 1
+    finally:
+        save_manifest(store, manifest)
+    return counts
+
+
+def seed(store: Path, gg_root: Path) -> dict:
+    """Link every artifact in the store into a gateway root that does not
+    already have it, so first start and new deployments skip the download.
+
+    :param store: shared store directory
+    :param gg_root: Greengrass root of a gateway
+    :return: counters of files linked, copied, already present, and changed in the store
+    """
+
+    counts = {"linked": 0, "copied": 0, "present": 0, "changed": 0}
+    manifest = load_manifest(store)
+    try:
+        for tree in _shared_trees(store):
+            store_tree = store / tree
+            if not store_tree.is_dir():
+                continue
+            for relative in _walk_files(store_tree):
+                target = gg_root / tree / relative
+                if target.exists():
+                    counts["present"] += 1
+                    continue
+                if not _unchanged(store, f"{tree}/{relative}", manifest):
+                    # Greengrass downloads its own copy instead
+                    print(f"Store copy of {tree}/{relative} changed since it was recorded, not linking it")
+                    counts["changed"] += 1
+                    continue
+                if _link_or_copy(store_tree / relative, target):
+                    counts["linked"] += 1
+                else:
+                    counts["copied"] += 1
+    finally:
+        save_manifest(store, manifest)
+    return counts
+
+
+def verify(store: Path) -> list:
+    """Store files whose content differs from the manifest, files not recorded yet are recorded by the next harvest or seed"""
+    manifest = load_manifest(store)
+    changed = []
+    for tree in _shared_trees(store):
+        store_tree = store / tree
+        if not store_tree.is_dir():
+            continue
+        for relative in _walk_files(store_tree):
+            key = f"{tree}/{relative}"
+            entry = manifest.get(key)
+            recorded = entry["sha256"] if isinstance(entry, dict) else entry
+            if recorded is not None and recorded != _digest(store_tree / relative):
+                changed.append(key)
+    return changed
+
+
+def unshare(gg_root: Path) -> dict:
+    """Replace every hard linked artifact of a gateway root with a private
+    copy, so that changing it does not change the other gateways
+
+    :param gg_root: Greengrass root of a gateway
+    :return: counters of files copied and already private
+    """
+
+    counts = {"copied": 0, "private": 0}
+    for tree in _shared_trees(gg_root):
+        source_tree = gg_root / tree
+        if not source_tree.is_dir():
+            continue
+        for relative in _walk_files(source_tree):
+            path = source_tree / relative
+            if path.stat().st_nlink == 1:
+                counts["private"] += 1
+                continue
+            staging = path.with_name(f".{path.name}.private")
+            shutil.copy2(path, staging)
+            os.replace(staging, path)
+            counts["copied"] += 1
+    return counts
+
+
+def status(store: Path, gg_root: Path) -> dict:
+    """Report how many artifact bytes of a gateway root are shared with the
+    store and how many are private to the gateway"""
+
+    result = {"shared_bytes": 0, "private_bytes": 0}
+    for tree in _shared_trees(gg_root):
+        source_tree = gg_root / tree
+        if not source_tree.is_dir():
+            continue
+        for relative in _walk_files(source_tree):
+            gateway_file = source_tree / relative
+            key = "shared_bytes" if _same_file(gateway_file, store / tree / relative) else "private_bytes"
+            result[key] += gateway_file.stat().st_size
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the shared Greengrass artifact store")
+    parser.add_argument("action", choices=["harvest", "seed", "status", "verify", "unshare"])
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="Shared store directory")
+    parser.add_argument("--gg-root", default=DEFAULT_GG_ROOT_PATH, help="Greengrass root of the gateway")
+    args = parser.parse_args()
+
+    store_path = Path(args.store)
+    gg_root_path = Path(args.gg_root)
+    if args.action != "verify" and not gg_root_path.is_dir():
+        print(f"Greengrass root '{gg_root_path}' not found")
+        sys.exit(1)
+    store_path.mkdir(parents=True, exist_ok=True)
+
+    if args.action == "harvest":
+        print(f"Harvested artifacts from {gg_root_path} into {store_path}: {harvest(gg_root_path, store_path)}")
+    elif args.action == "seed":
+        print(f"Seeded {gg_root_path} from {store_path}: {seed(store_path, gg_root_path)}")
+    elif args.action == "verify":
+        changed = verify(store_path)
+        for key in changed:
+            print(f"{key} changed since it was recorded, run unshare on the gateways linking it")
+        print(f"{len(changed)} changed files in {store_path}")
+        sys.exit(1 if changed else 0)
+    elif args.action == "unshare":
+        print(f"Unshared artifacts of {gg_root_path}: {unshare(gg_root_path)}")
+    else:
+        print(status(store_path, gg_root_path))
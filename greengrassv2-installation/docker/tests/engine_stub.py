@@ -0,0 +1,135 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Stub of the Docker Engine API endpoints docker_engine.py uses, served on a
+unix socket from memory.
+
+Answers container inspect, create, start and delete, and streams /events
+with chunked transfer encoding. Every request is recorded as
+(method, path without the API version, JSON body). Responses can be replaced
+with errors by (method, path prefix), and events are pushed by the test.
+
+    stub = EngineStub(socket_path)
+    await stub.start()
+    stub.fail("POST", "/containers/create", 500, "no space left on device")
+    stub.emit({"status": "health_status: healthy", "Actor": {"Attributes": {"name": "sitewise-container-line1"}}})
+    await stub.close()
+"""
+
+import re
+import json
+import asyncio
+import urllib.parse
+
+REASONS = {200: "OK", 201: "Created", 204: "No Content", 304: "Not Modified", 404: "Not Found", 409: "Conflict", 500: "Internal Server Error"}
+
+
+class EngineStub:
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self.containers = {}
+        self.requests = []
+        self.failures = {}
+        self.listeners = []
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+
+    async def close(self):
+        for queue in self.listeners:
+            queue.put_nowait(None)
+        self.server.close()
+        await self.server.wait_closed()
+
+    def fail(self, method: str, prefix: str, status: int, message: str):
+        self.failures[(method, prefix)] = (status, message)
+
+    def emit(self, event: dict):
+        for queue in self.listeners:
+            queue.put_nowait(event)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        method, target, _ = (await reader.readline()).decode().split(" ", 2)
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode().strip()
+            if not line:
+                break
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+        data = await reader.readexactly(int(headers.get("content-length", 0)))
+        body = json.loads(data) if data else None
+
+        url = urllib.parse.urlsplit(re.sub(r"^/v[\d.]+", "", target))
+        query = dict(urllib.parse.parse_qsl(url.query))
+        self.requests.append((method, url.path, body))
+        try:
+            for (fail_method, prefix), (status, message) in self.failures.items():
+                if method == fail_method and url.path.startswith(prefix):
+                    self._respond(writer, status, {"message": message})
+                    return
+            if method == "GET" and url.path == "/events":
+                await self._events(writer)
+                return
+            status, result = self._route(method, url.path, query, body)
+            self._respond(writer, status, result)
+        finally:
+            await writer.drain()
+            writer.close()
+
+    def _route(self, method: str, path: str, query: dict, body: dict) -> tuple:
+        if method == "POST" and path == "/containers/create":
+            name = query["name"]
+            if name in self.containers:
+                return 409, {"message": f"Conflict. The container name \"/{name}\" is already in use"}
+            self.containers[name] = {
+                "Name": f"/{name}", "Config": {"Image": body["Image"], "Labels": body.get("Labels", {})},
+                "HostConfig": body.get("HostConfig", {}), "State": {"Running": False},
+            }
+            return 201, {"Id": name, "Warnings": []}
+
+        match = re.fullmatch(r"/containers/([^/]+)(/json|/start)?", path)
+        container = self.containers.get(match.group(1)) if match else None
+        if container is None:
+            return 404, {"message": f"No such container: {match.group(1) if match else path}"}
+        if method == "GET" and match.group(2) == "/json":
+            return 200, container
+        if method == "POST" and match.group(2) == "/start":
+            if container["State"]["Running"]:
+                return 304, None
+            container["State"]["Running"] = True
+            return 204, None
+        if method == "DELETE" and match.group(2) is None:
+            if container["State"]["Running"] and query.get("force") != "true":
+                return 409, {"message": "You cannot remove a running container"}
+            del self.containers[match.group(1)]
+            return 204, None
+        return 404, {"message": f"page not found: {method} {path}"}
+
+    @staticmethod
+    def _respond(writer: asyncio.StreamWriter, status: int, result):
+        payload = json.dumps(result).encode() if result is not None else b""
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, 'Error')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+        )
+
+    async def _events(self, writer: asyncio.StreamWriter):
+        queue = asyncio.Queue()
+        self.listeners.append(queue)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nTransfer-Encoding: chunked\r\n\r\n")
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                line = json.dumps(event).encode() + b"\n"
+                writer.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                await writer.drain()
+            writer.write(b"0\r\n\r\n")
+        finally:
+            self.listeners.remove(queue)
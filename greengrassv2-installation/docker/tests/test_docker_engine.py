@@ -0,0 +1,159 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+docker_engine.py against the Engine API stub of engine_stub.py.
+
+    python3 -m unittest discover -s tests
+"""
+
+import sys
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from docker_engine import EngineBackend, EngineClient, EngineError, CONFIG_HASH_LABEL, GATEWAY_LABEL  # noqa: E402
+from engine_stub import EngineStub  # noqa: E402
+
+CONTAINER = "sitewise-container-line1"
+
+
+def service(memory: str = "1g") -> dict:
+    return {
+        "init": True,
+        "container_name": CONTAINER,
+        "image": "x86_64/aws-iot-greengrass:2.10.3",
+        "cpu_shares": 1024,
+        "deploy": {"resources": {"limits": {"cpus": "1.5", "memory": memory}, "reservations": {"memory": "512m"}}},
+        "ports": ["9111:9110"],
+        "healthcheck": {"test": ["CMD", "true"], "interval": "30s", "timeout": "10s", "retries": 3, "start_period": "5m"},
+        "volumes": ["./volumes/gg_root:/greengrass/v2", "./volumes/certs:/tmp/certs:ro"],
+        "environment": {"GATEWAY_NAME": "line1"},
+    }
+
+
+class EngineBackendTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.gateway_dir = Path(self.directory.name, "line1")
+        self.gateway_dir.mkdir()
+        self.render(service())
+        self.stub = EngineStub(str(Path(self.directory.name, "docker.sock")))
+        await self.stub.start()
+        self.backend = EngineBackend(self.stub.socket_path)
+
+    async def asyncTearDown(self):
+        await self.stub.close()
+        if self.backend.watcher is not None:
+            self.backend.watcher.cancel()
+            await asyncio.gather(self.backend.watcher, return_exceptions=True)
+        self.directory.cleanup()
+
+    def render(self, definition: dict):
+        with open(self.gateway_dir / "docker-compose.yml", "w") as f:
+            yaml.safe_dump({"version": "3.7", "services": {"greengrass_accel_line1": definition}}, f)
+
+    def calls(self) -> list:
+        return [(method, path) for method, path, _ in self.stub.requests if path != "/events"]
+
+    async def test_create_and_start(self):
+        await self.backend.start(self.gateway_dir)
+        self.assertEqual(self.calls(), [
+            ("GET", f"/containers/{CONTAINER}/json"),
+            ("POST", "/containers/create"),
+            ("POST", f"/containers/{CONTAINER}/start"),
+        ])
+        spec = next(body for method, path, body in self.stub.requests if path == "/containers/create")
+        self.assertEqual(spec["HostConfig"]["NanoCpus"], 1_500_000_000)
+        self.assertEqual(spec["HostConfig"]["Memory"], 1 << 30)
+        self.assertEqual(spec["HostConfig"]["PortBindings"], {"9110/tcp": [{"HostPort": "9111"}]})
+        self.assertEqual(spec["HostConfig"]["Binds"][0], f"{(self.gateway_dir / 'volumes/gg_root').resolve()}:/greengrass/v2")
+        self.assertEqual(spec["Healthcheck"]["StartPeriod"], 300 * 10**9)
+        self.assertEqual(spec["Labels"][GATEWAY_LABEL], str(self.gateway_dir.resolve()))
+        self.assertTrue(self.stub.containers[CONTAINER]["State"]["Running"])
+
+    async def test_running_container_with_same_config_is_left_alone(self):
+        await self.backend.start(self.gateway_dir)
+        self.stub.requests.clear()
+        await self.backend.start(self.gateway_dir)
+        self.assertEqual(self.calls(), [("GET", f"/containers/{CONTAINER}/json")])
+
+    async def test_stopped_container_with_same_config_is_started(self):
+        await self.backend.start(self.gateway_dir)
+        self.stub.containers[CONTAINER]["State"]["Running"] = False
+        self.stub.requests.clear()
+        await self.backend.start(self.gateway_dir)
+        self.assertEqual(self.calls(), [
+            ("GET", f"/containers/{CONTAINER}/json"),
+            ("POST", f"/containers/{CONTAINER}/start"),
+        ])
+
+    async def test_changed_config_recreates_container(self):
+        await self.backend.start(self.gateway_dir)
+        old_hash = self.stub.containers[CONTAINER]["Config"]["Labels"][CONFIG_HASH_LABEL]
+        self.render(service(memory="2g"))
+        self.stub.requests.clear()
+        await self.backend.start(self.gateway_dir)
+        self.assertEqual(self.calls(), [
+            ("GET", f"/containers/{CONTAINER}/json"),
+            ("DELETE", f"/containers/{CONTAINER}"),
+            ("POST", "/containers/create"),
+            ("POST", f"/containers/{CONTAINER}/start"),
+        ])
+        container = self.stub.containers[CONTAINER]
+        self.assertEqual(container["HostConfig"]["Memory"], 2 << 30)
+        self.assertNotEqual(container["Config"]["Labels"][CONFIG_HASH_LABEL], old_hash)
+        self.assertTrue(container["State"]["Running"])
+
+    async def test_create_error_is_raised(self):
+        self.stub.fail("POST", "/containers/create", 500, "no space left on device")
+        with self.assertRaises(EngineError) as raised:
+            await self.backend.start(self.gateway_dir)
+        self.assertEqual(raised.exception.status, 500)
+        self.assertIn("no space left on device", str(raised.exception))
+        self.assertNotIn(("POST", f"/containers/{CONTAINER}/start"), self.calls())
+
+    async def test_inspect_error_other_than_missing_is_raised(self):
+        self.stub.fail("GET", f"/containers/{CONTAINER}/json", 500, "daemon busy")
+        with self.assertRaises(EngineError) as raised:
+            await self.backend.start(self.gateway_dir)
+        self.assertEqual(raised.exception.status, 500)
+        self.assertEqual(self.calls(), [("GET", f"/containers/{CONTAINER}/json")])
+
+    async def test_inspect_missing_container(self):
+        with self.assertRaises(EngineError) as raised:
+            await EngineClient(self.stub.socket_path).request("GET", "/containers/missing/json")
+        self.assertEqual(raised.exception.status, 404)
+
+    async def test_wait_healthy_from_events(self):
+        await self.backend.start(self.gateway_dir)
+        self.stub.containers[CONTAINER]["State"]["Health"] = {"Status": "starting"}
+        waiting = asyncio.ensure_future(self.backend.wait_healthy(self.gateway_dir, timeout=5))
+        while not self.stub.listeners or CONTAINER not in self.backend.waiters:
+            await asyncio.sleep(0.01)
+        self.stub.emit({"status": "health_status: healthy", "Actor": {"Attributes": {"name": CONTAINER}}})
+        await waiting
+
+    async def test_wait_healthy_fails_when_container_dies(self):
+        await self.backend.start(self.gateway_dir)
+        self.stub.containers[CONTAINER]["State"]["Health"] = {"Status": "starting"}
+        waiting = asyncio.ensure_future(self.backend.wait_healthy(self.gateway_dir, timeout=5))
+        while not self.stub.listeners or CONTAINER not in self.backend.waiters:
+            await asyncio.sleep(0.01)
+        self.stub.emit({"Action": "die", "Actor": {"Attributes": {"name": CONTAINER}}})
+        with self.assertRaises(RuntimeError):
+            await waiting
+
+    async def test_wait_healthy_returns_when_already_healthy(self):
+        await self.backend.start(self.gateway_dir)
+        self.stub.containers[CONTAINER]["State"]["Health"] = {"Status": "healthy"}
+        await self.backend.wait_healthy(self.gateway_dir, timeout=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -17,4 +17,45 @@
 
 export OPCUAIP="<IP of the instance deployed as part of satck OPCUAInstanceStack, for example '172.xx.8.xxx'>"
 export OPCUAPort="<Port Number for the OPCUA Instance Datasource, if using default then 62541>"
-export Environment=dev
\ No newline at end of file
+# For the local simulator in opcua-simulator/ use the IP of its host and port 4840
+# Optional: nodeFilterRules written by iot_factory_cdk/stacks/sitewise_gateway/node_filters.py, all tags are collected without it
+# export NodeFilterRulesFile="node-filter-rules.json"
+# Optional: partitions.json of partition_planner.py, one SiteWise gateway per fleet gateway dividing the tags between them
+# export GatewayPartitionsFile="partitions/partitions.json"
+# Optional: collector propertyGroups JSON with scan mode, sampling rate and deadband per browse path, e.g.
+# [{"name": "Analog", "nodeFilterRuleDefinitions": [{"type": "OpcUaRootPath", "rootPath": "/Simulation/**/Temperature*"}],
+#   "scanMode": {"type": "EXCHANGE", "rate": 1000}, "deadband": {"type": "PERCENT", "value": 0.5, "eguMin": 0, "eguMax": 200, "timeoutMilliseconds": 60000}}]
+# export PropertyGroupsFile="property-groups.json"
+# Optional: deploy the edge aggregation component and route the collector through it, configured with a JSON file such as
+# {"WindowSeconds": 60, "Aggregates": ["min", "max", "mean", "last"], "AggregatePrefixes": ["/Simulation/Line1/"],
+#  "CompressPrefixes": ["/Simulation/Line2/"], "CompressionDeviation": 0.5}
+# Bump EdgeAggregationVersion whenever the component code changes
+# export EdgeAggregationFile="edge-aggregation.json"
+# export EdgeAggregationVersion="1.0.1"
+# Optional: deploy the recent values cache, the last RecentValuesCapacity values of up to RecentValuesMaxAliases aliases
+# in memory (about 17 bytes per value), served on port 9120 of the gateway container (--recent-values-port of config_docker.py)
+# export RecentValuesCapacity="3600"
+# export RecentValuesMaxAliases="10000"
+# export RecentValuesVersion="1.0.1"
+# Optional: deploy the outage buffer in front of the publisher, which keeps WAN outage data as compressed columnar
+# segments and drains them after reconnect, configured with a JSON file such as
+# {"MaxDiskMB": 10240, "DrainPointsPerSecond": 10000, "SegmentSeconds": 300}
+# Set "Drain": false to keep the segments of a long outage for backfill.py instead of publishing them
+# export OutageBufferFile="outage-buffer.json"
+# export OutageBufferVersion="1.0.1"
+# Optional: create the bucket and the IoT SiteWise bulk import role (BackfillBucketName and BackfillRoleArn outputs)
+# that greengrassv2-installation/docker/backfill.py imports gateway history with
+# export Backfill="true"
+export Environment=dev
+# Optional: issue the Greengrass core certificate with config_docker.py from a CSR generated on the docker host, so the stack
+# creates no key pair and no Advanced tier Parameter Store values for it. Set before the first deploy of the stack
+# export CertificateFromCsr="true"
+# Optional: size StreamManager for the expected property values per second and WAN outage hours to buffer
+# export StreamManagerPointsPerSecond="1000"
+# export StreamManagerOutageHours="24"
+# export StreamManagerJvmArgs="-Xmx256m"
+# Optional: CPU cores and memory (MB) limits for the SiteWise collector and publisher processes
+# export CollectorCpus="1.0"
+# export CollectorMemoryMB="1024"
+# export PublisherCpus="1.0"
+# export PublisherMemoryMB="1024"
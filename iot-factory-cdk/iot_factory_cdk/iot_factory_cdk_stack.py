@@ -21,14 +21,24 @@ from aws_cdk import (
     aws_secretsmanager as _secret,
 )
 import os
+import json
 from constructs import Construct
 
 # Import Stack Submodules
 from iot_factory_cdk.stacks.greengrass_v2_deployment.greengrass_v2_deployment import GreengrassV2Deployment
+from iot_factory_cdk.stacks.greengrass_v2_deployment.stream_manager import StreamManagerTuning
+from iot_factory_cdk.stacks.greengrass_v2_deployment.component_configuration import ComponentConfiguration
 from iot_factory_cdk.stacks.iot_role_alias.iot_role_alias import IotRoleAlias
 from iot_factory_cdk.stacks.iot_thing_cert_policy.iot_thing_cert_policy import IotThingCertPolicy
 from iot_factory_cdk.stacks.iot_thing_group.iot_thing_group import IotThingGroup
 from iot_factory_cdk.stacks.sitewise_gateway.sitewise_gateway import SitewiseGateway
+from iot_factory_cdk.stacks.sitewise_gateway.node_filters import NodeFilterRule
+from iot_factory_cdk.stacks.sitewise_gateway.partition_planner import read_partitions
+from iot_factory_cdk.stacks.sitewise_gateway.collector_configuration import read_property_groups
+from iot_factory_cdk.stacks.edge_aggregation.edge_aggregation import EdgeAggregation, PUBLISHER_STREAM
+from iot_factory_cdk.stacks.recent_values.recent_values import RecentValues
+from iot_factory_cdk.stacks.outage_buffer.outage_buffer import OutageBuffer
+from iot_factory_cdk.stacks.backfill.backfill import Backfill
 
 # Initial Construct parent "Stack" is being created with the name "IotFactoryCdkStack"
 class IotFactoryCdkStack(Stack):
@@ -67,7 +77,9 @@ class IotFactoryCdkStack(Stack):
             cost_center = cost_center,
         )
 
-        # Then create IoT thing, certificate/private key, and IoT Policy
+        # Then create IoT thing, certificate/private key, and IoT Policy. With CertificateFromCsr the certificate is
+        # issued by config_docker.py from a CSR instead, so the private key never passes through Lambda or Parameter Store
+        certificate_from_csr = os.getenv("CertificateFromCsr", "false").lower() == "true"
         iot_thing_cert_policy = IotThingCertPolicy(
             self,
             'GreengrassCore',
@@ -76,7 +88,8 @@ class IotFactoryCdkStack(Stack):
             iot_policy_name = f'{stack.stack_name}-Greengrass-Minimal-Policy-{region}-{env}',
             role_alias_name = greengrass_role_alias.role_alias_name, 
             app_name = app_name,
-            cost_center = cost_center
+            cost_center = cost_center,
+            issue_certificate = not certificate_from_csr
         )
 
         # Then create thing group and add thing
@@ -92,39 +105,182 @@ class IotFactoryCdkStack(Stack):
             cost_center = cost_center
         )
 
-        GreengrassV2Deployment(
+        # Optional per component CPU and memory limits so a noisy collector cannot starve the publisher (see env.sh)
+        def optional_float(name):
+            value = os.getenv(name)
+            return float(value) if value else None
+
+        def optional_int(name):
+            value = os.getenv(name)
+            return int(value) if value else None
+
+        deployment_components = {}
+        for component_configuration in [
+            ComponentConfiguration('aws.greengrass.Nucleus', '2.10.3'),
+            ComponentConfiguration('aws.iot.SiteWiseEdgeCollectorOpcua', '2.3.0',
+                cpus = optional_float("CollectorCpus"),
+                memory_mb = optional_int("CollectorMemoryMB")
+            ),
+            ComponentConfiguration('aws.iot.SiteWiseEdgePublisher', '2.2.3',
+                cpus = optional_float("PublisherCpus"),
+                memory_mb = optional_int("PublisherMemoryMB")
+            ),
+            ComponentConfiguration('aws.greengrass.StreamManager', '2.1.9')
+        ]:
+            deployment_components.update(component_configuration.to_component())
+
+        # Optional StreamManager sizing from the gateway data rate and the WAN outage it must ride out (see env.sh)
+        stream_manager_points_per_second = os.getenv("StreamManagerPointsPerSecond")
+        stream_manager_outage_hours = os.getenv("StreamManagerOutageHours")
+        if stream_manager_points_per_second and stream_manager_outage_hours:
+            stream_manager_tuning = StreamManagerTuning.from_rates(
+                '2.1.9',
+                points_per_second = float(stream_manager_points_per_second),
+                outage_hours = float(stream_manager_outage_hours),
+                jvm_args = os.getenv("StreamManagerJvmArgs")
+            )
+            print(f'StreamManager needs {stream_manager_tuning.required_store_bytes / (1 << 30):.2f} GB of disk for a {stream_manager_outage_hours} hour outage')
+            deployment_components.update(stream_manager_tuning.to_component())
+
+        # Optional columnar buffer of WAN outage data in front of the publisher, configured with the JSON of OutageBufferFile (see env.sh)
+        outage_buffer = None
+        outage_buffer_file = os.getenv("OutageBufferFile")
+        if outage_buffer_file:
+            with open(outage_buffer_file) as f:
+                buffer = json.load(f)
+            outage_buffer = OutageBuffer(
+                self,
+                'OutageBuffer',
+                env = env,
+                component_version = os.getenv("OutageBufferVersion", "1.0.1"),
+                token_exchange_role_arn = greengrass_role_alias.iam_role_arn,
+                app_name = app_name,
+                cost_center = cost_center
+            )
+            deployment_components.update(outage_buffer.to_component(buffer))
+
+        # Optional edge aggregation between collector and publisher, configured with the JSON of EdgeAggregationFile (see env.sh)
+        edge_aggregation = None
+        edge_aggregation_file = os.getenv("EdgeAggregationFile")
+        if edge_aggregation_file:
+            with open(edge_aggregation_file) as f:
+                aggregation = json.load(f)
+            edge_aggregation = EdgeAggregation(
+                self,
+                'EdgeAggregation',
+                env = env,
+                component_version = os.getenv("EdgeAggregationVersion", "1.0.1"),
+                token_exchange_role_arn = greengrass_role_alias.iam_role_arn,
+                app_name = app_name,
+                cost_center = cost_center,
+                destination_stream = outage_buffer.source_stream if outage_buffer else PUBLISHER_STREAM
+            )
+            deployment_components.update(edge_aggregation.to_component(aggregation))
+
+        # Stream the collector writes to: edge aggregation, then the outage buffer, then the publisher
+        collector_stream = None
+        if edge_aggregation:
+            collector_stream = edge_aggregation.source_stream
+        elif outage_buffer:
+            collector_stream = outage_buffer.source_stream
+
+        # Optional local cache of the recent values of every alias with an HTTP query API, sized by RecentValuesCapacity (see env.sh)
+        recent_values = None
+        recent_values_capacity = optional_int("RecentValuesCapacity")
+        if recent_values_capacity:
+            # Raw collector data, and the aggregates it is reduced to when edge aggregation is deployed
+            streams = [collector_stream or PUBLISHER_STREAM]
+            if edge_aggregation:
+                streams.append(edge_aggregation.destination_stream)
+            recent_values = RecentValues(
+                self,
+                'RecentValues',
+                env = env,
+                component_version = os.getenv("RecentValuesVersion", "1.0.1"),
+                token_exchange_role_arn = greengrass_role_alias.iam_role_arn,
+                app_name = app_name,
+                cost_center = cost_center,
+                streams = streams
+            )
+            deployment_components.update(recent_values.to_component(
+                capacity = recent_values_capacity,
+                max_aliases = optional_int("RecentValuesMaxAliases")
+            ))
+
+        deployment = GreengrassV2Deployment(
             self, 
             'GreengrassDeployment',
             env = env,
             target_arn = deployment_group.thing_group_arn,
             deployment_name = f'{stack.stack_name} - Sitewise Components deployment for {env}',
-            component = {
-                'aws.greengrass.Nucleus': { 'componentVersion': '2.10.3' },
-                'aws.iot.SiteWiseEdgeCollectorOpcua': { 'componentVersion': '2.3.0' },
-                'aws.iot.SiteWiseEdgePublisher': { 'componentVersion': '2.2.3' },
-                'aws.greengrass.StreamManager': { 'componentVersion': '2.1.9' }
-            },
+            component = deployment_components,
             iot_job_configuraiton = {},
             deployment_policies = {},
             app_name = app_name,
             cost_center = cost_center,
         )
+        if edge_aggregation:
+            # The component version must exist before the deployment references it
+            deployment.node.add_dependency(edge_aggregation)
+        if recent_values:
+            deployment.node.add_dependency(recent_values)
+        if outage_buffer:
+            deployment.node.add_dependency(outage_buffer)
+
+        # Optional bucket and role for bulk import of gateway history with backfill.py (see env.sh)
+        backfill = None
+        if os.getenv("Backfill", "false").lower() == "true":
+            backfill = Backfill(
+                self,
+                'Backfill',
+                env = env,
+                app_name = app_name,
+                cost_center = cost_center
+            )
         ip = os.getenv("OPCUAIP")
         port = os.getenv("OPCUAPort")
 
-        # Create the IOT Sitewise Gateway
-        SitewiseGateway(
-            self, 
-            'SitewiseGateway',
-            env = env,
-            stack_name = stack.stack_name,
-            thing_name = iot_thing_cert_policy.thing_name,
-            kepserver_ip = ip,
-            kepserver_port = port,
-            # opcua_secret_arn = opcua_username_password_secret_arn,
-            app_name = app_name,
-            cost_center = cost_center
-        )
+        # Optional nodeFilterRules emitted by node_filters.py, so the gateway subscribes only to the modelled tags (see env.sh)
+        node_filter_rules = None
+        node_filter_rules_file = os.getenv("NodeFilterRulesFile")
+        if node_filter_rules_file:
+            with open(node_filter_rules_file) as f:
+                node_filter_rules = [NodeFilterRule.from_rule(rule) for rule in json.load(f)]
+
+        # Optional scan mode, sampling rate and deadband per browse path in the collector propertyGroups format (see env.sh)
+        property_groups = None
+        property_groups_file = os.getenv("PropertyGroupsFile")
+        if property_groups_file:
+            property_groups = read_property_groups(property_groups_file)
+
+        # Optional partitions of the OPC UA server written by partition_planner.py, one SiteWise gateway per
+        # partition so that the gateway containers divide the tags instead of each collecting all of them (see env.sh)
+        partitions = [('default', node_filter_rules)]
+        gateway_partitions_file = os.getenv("GatewayPartitionsFile")
+        if gateway_partitions_file:
+            partitions = read_partitions(gateway_partitions_file)
+            if 'default' not in [name for name, _ in partitions]:
+                raise ValueError(f'{gateway_partitions_file} needs a partition for the default gateway')
+
+        for name, rules in partitions:
+            # Fleet gateways are the things config_docker.py --fleet registers as <stack>-<name>
+            default = name == 'default'
+            SitewiseGateway(
+                self, 
+                'SitewiseGateway' if default else f'SitewiseGateway-{name}',
+                env = env,
+                stack_name = stack.stack_name,
+                thing_name = iot_thing_cert_policy.thing_name if default else f'{stack.stack_name}-{name}',
+                kepserver_ip = ip,
+                kepserver_port = port,
+                # opcua_secret_arn = opcua_username_password_secret_arn,
+                app_name = app_name,
+                cost_center = cost_center,
+                node_filter_rules = rules,
+                property_groups = property_groups,
+                destination_stream = collector_stream,
+                gateway_name = None if default else f'{stack.stack_name}GreenGrassCore-Gateway-{env}-{name}'
+            )
 
 
 
@@ -236,23 +392,25 @@ class IotFactoryCdkStack(Stack):
             value = greengrass_role_alias.iam_role_arn
         )
 
-        # Export of Certificate Arn for additional reference
-        CfnOutput(self, 'CertificateArn',
-            export_name = f'{stack.stack_name}-CertificateArn-{env}',
-            value = iot_thing_cert_policy.certificate_arn
-        )
+        # Without CertificateFromCsr the stack issues the certificate, config_docker.py reads it from Parameter Store
+        if not certificate_from_csr:
+            # Export of Certificate Arn for additional reference
+            CfnOutput(self, 'CertificateArn',
+                export_name = f'{stack.stack_name}-CertificateArn-{env}',
+                value = iot_thing_cert_policy.certificate_arn
+            )
 
-        # Export of Systems Manager Parameter Certificate PEM for document_updater.py
-        CfnOutput(self, 'CertificatePemParameter',
-            export_name = f'{stack.stack_name}-CertificatePem-{env}',
-            value = iot_thing_cert_policy.certificate_pem_parameter
-        )
+            # Export of Systems Manager Parameter Certificate PEM for document_updater.py
+            CfnOutput(self, 'CertificatePemParameter',
+                export_name = f'{stack.stack_name}-CertificatePem-{env}',
+                value = iot_thing_cert_policy.certificate_pem_parameter
+            )
 
-        # Export of Systems Manager Parameter Private Key Secret Arn for document_updater.py
-        CfnOutput(self, 'PrivateKeySecretParameter',
-            export_name = f'{stack.stack_name}-PrivateKey-{env}',
-            value = iot_thing_cert_policy.private_key_secret_parameter
-        )
+            # Export of Systems Manager Parameter Private Key Secret Arn for document_updater.py
+            CfnOutput(self, 'PrivateKeySecretParameter',
+                export_name = f'{stack.stack_name}-PrivateKey-{env}',
+                value = iot_thing_cert_policy.private_key_secret_parameter
+            )
 
 
         # Provide Output for Data Ats Endpoint Address
@@ -263,4 +421,15 @@ class IotFactoryCdkStack(Stack):
         # Provide Output for Credential Provider Endpoint Address
         CfnOutput(self, 'CredentialProviderEndpointAddress',
             value = iot_thing_cert_policy.credential_provider_endpoint_address
-        )
\ No newline at end of file
+        )
+
+        if backfill:
+            # Provide Output for the bulk import bucket for backfill.py
+            CfnOutput(self, 'BackfillBucketName',
+                value = backfill.bucket_name
+            )
+
+            # Provide Output for the bulk import job role for backfill.py
+            CfnOutput(self, 'BackfillRoleArn',
+                value = backfill.role_arn
+            )
\ No newline at end of file
@@ -0,0 +1,62 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+
+
+from aws_cdk import (
+    Duration,
+    Tags,
+    aws_iam as iam,
+    aws_s3 as s3
+)
+from constructs import Construct
+
+# Import files are staged for one backfill run, expire what a failed run left behind
+DEFAULT_EXPIRATION_DAYS = 30
+
+
+# This construct creates the bucket backfill.py stages bulk import files in and the role SiteWise reads them with.
+# @summary Private bucket and IoT SiteWise bulk import job role.
+class Backfill(Construct):
+
+    # @param {int} expiration_days - days after which import files and error reports are deleted.
+    def __init__(self, scope: Construct, id: str, env: str, app_name: str, cost_center: str, expiration_days: int = DEFAULT_EXPIRATION_DAYS, **kwargs) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        self.bucket = s3.Bucket(self, 'BackfillBucket',
+            block_public_access = s3.BlockPublicAccess.BLOCK_ALL,
+            encryption = s3.BucketEncryption.S3_MANAGED,
+            enforce_ssl = True,
+            lifecycle_rules = [s3.LifecycleRule(
+                expiration = Duration.days(expiration_days),
+                abort_incomplete_multipart_upload_after = Duration.days(1)
+            )]
+        )
+
+        self.role = iam.Role(self, 'BackfillRole',
+            assumed_by = iam.ServicePrincipal('iotsitewise.amazonaws.com'),
+            description = f'{app_name} IoT SiteWise bulk import of gateway history ({env})'
+        )
+        # Read the import files, write the error reports and delete the files when deleteFilesAfterImport is set
+        self.bucket.grant_read_write(self.role)
+        self.bucket.grant_delete(self.role)
+
+        Tags.of(self).add('app', app_name)
+        Tags.of(self).add('costcenter', cost_center)
+
+        self.bucket_name = self.bucket.bucket_name
+        self.role_arn = self.role.role_arn
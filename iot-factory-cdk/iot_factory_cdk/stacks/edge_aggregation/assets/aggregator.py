@@ -0,0 +1,365 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Greengrass component between the SiteWise OPC UA collector and the SiteWise publisher.
+# The collector writes to SourceStream instead of the publisher stream, this component reads
+# the property values in batches and writes to DestinationStream (SiteWise_Edge_Stream):
+#   - aliases under AggregatePrefixes as windowed min / max / mean / last / count per WindowSeconds,
+#     to the aliases of AliasTemplate, e.g. /Line1/Machine1/Speed/mean
+#   - aliases under CompressPrefixes as the points kept by swinging door compression, within
+#     CompressionDeviation of the raw signal and at least every CompressionMaxSeconds
+#   - every other alias and non numeric values unchanged
+
+import os
+import sys
+import json
+import time
+import math
+import hashlib
+import argparse
+
+import numpy as np
+
+AGGREGATES = ['min', 'max', 'mean', 'last', 'count']
+MAX_VALUES_PER_ENTRY = 10
+CHECKPOINT_FILE = 'checkpoint.json'
+DEFAULT_CONFIGURATION = {
+    'WindowSeconds': 60,
+    'LatenessSeconds': 5,
+    'Aggregates': ['min', 'max', 'mean', 'last'],
+    'AliasTemplate': '{alias}/{aggregate}',
+    'AggregatePrefixes': [],
+    'CompressPrefixes': [],
+    'CompressionDeviation': 0.5,
+    'CompressionMaxSeconds': 600,
+}
+
+
+# Windowed aggregates of many series, computed per batch with numpy instead of per point.
+class WindowAggregator:
+
+    def __init__(self, window_seconds: float, aggregates: list, lateness_seconds: float = 0):
+        unknown = set(aggregates) - set(AGGREGATES)
+        if window_seconds <= 0 or unknown:
+            raise ValueError(f'Window must be positive and aggregates of {AGGREGATES}, got {window_seconds} and {sorted(unknown)}')
+        self.window = window_seconds
+        self.aggregates = aggregates
+        self.lateness = lateness_seconds
+        # (series, window index) -> [min, max, sum, count, last timestamp, last value]
+        self.open = {}
+        self.watermark = -math.inf
+        self.closed_before = -sys.maxsize
+        self.late = 0
+
+    # @param {ndarray} series - int series id of every point.
+    # @param {ndarray} timestamps - seconds since the epoch.
+    # @param {ndarray} values - float values.
+    def add(self, series: np.ndarray, timestamps: np.ndarray, values: np.ndarray):
+        if not len(values):
+            return
+        windows = np.floor(timestamps / self.window).astype(np.int64)
+        on_time = windows >= self.closed_before
+        self.late += int(len(values) - on_time.sum())
+        series, windows, timestamps, values = series[on_time], windows[on_time], timestamps[on_time], values[on_time]
+        if not len(values):
+            return
+
+        order = np.lexsort((timestamps, windows, series))
+        series, windows, timestamps, values = series[order], windows[order], timestamps[order], values[order]
+        starts = np.flatnonzero(np.r_[True, (series[1:] != series[:-1]) | (windows[1:] != windows[:-1])])
+        ends = np.r_[starts[1:], len(values)] - 1
+        mins = np.minimum.reduceat(values, starts)
+        maxs = np.maximum.reduceat(values, starts)
+        sums = np.add.reduceat(values, starts)
+        counts = np.diff(np.r_[starts, len(values)])
+
+        # One dictionary update per series and window, not per point
+        for key, mn, mx, total, count, last_ts, last in zip(
+            zip(series[starts].tolist(), windows[starts].tolist()),
+            mins.tolist(), maxs.tolist(), sums.tolist(), counts.tolist(), timestamps[ends].tolist(), values[ends].tolist()
+        ):
+            state = self.open.get(key)
+            if state is None:
+                self.open[key] = [mn, mx, total, count, last_ts, last]
+                continue
+            state[0], state[1] = min(state[0], mn), max(state[1], mx)
+            state[2] += total
+            state[3] += count
+            if last_ts >= state[4]:
+                state[4], state[5] = last_ts, last
+        self.watermark = max(self.watermark, float(timestamps.max()))
+
+    def flush(self, force: bool = False) -> list:
+        """Windows that ended LatenessSeconds before the newest point, as (series, window start, {aggregate: value})"""
+        horizon = math.inf if force else math.floor((self.watermark - self.lateness) / self.window)
+        closed = []
+        for key in [key for key in self.open if key[1] + 1 <= horizon]:
+            mn, mx, total, count, _, last = self.open.pop(key)
+            values = {'min': mn, 'max': mx, 'mean': total / count, 'last': last, 'count': float(count)}
+            closed.append((key[0], key[1] * self.window, {a: values[a] for a in self.aggregates}))
+        if not force and horizon > self.closed_before:
+            self.closed_before = int(horizon)
+        return sorted(closed, key=lambda c: (c[0], c[1]))
+
+
+# Swinging door compression of many series, keeps the points needed to reconstruct each signal
+# by linear interpolation within the deviation.
+class SwingingDoor:
+
+    def __init__(self, deviation: float, max_seconds: float = None):
+        if deviation < 0:
+            raise ValueError(f'Compression deviation must not be negative, got {deviation}')
+        self.deviation = deviation
+        self.max_seconds = max_seconds
+        # series -> [archived timestamp, archived value, min upper slope, max lower slope, held timestamp, held value]
+        self.state = {}
+
+    def add(self, series: np.ndarray, timestamps: np.ndarray, values: np.ndarray) -> list:
+        """Archived points of the batch as (series, timestamp, value)"""
+        archived = []
+        order = np.lexsort((timestamps, series))
+        series, timestamps, values = series[order].tolist(), timestamps[order].tolist(), values[order].tolist()
+        deviation, max_seconds = self.deviation, self.max_seconds
+        for s, t, v in zip(series, timestamps, values):
+            state = self.state.get(s)
+            if state is None:
+                self.state[s] = [t, v, math.inf, -math.inf, None, None]
+                archived.append((s, t, v))
+                continue
+            t0, v0, upper, lower, held_t, held_v = state
+            dt = t - t0
+            if dt <= 0:
+                continue
+            # The line from the archived point to this one must pass through the doors of every point since,
+            # otherwise the held point is the last one a straight line covers within the deviation
+            slope = (v - v0) / dt
+            if held_t is not None and (not lower <= slope <= upper or (max_seconds and t - t0 > max_seconds)):
+                archived.append((s, held_t, held_v))
+                t0, v0, dt = held_t, held_v, t - held_t
+                upper, lower = math.inf, -math.inf
+            upper = min(upper, (v + deviation - v0) / dt)
+            lower = max(lower, (v - deviation - v0) / dt)
+            state[:] = [t0, v0, upper, lower, t, v]
+        return archived
+
+    def flush(self, now: float) -> list:
+        """Held points of series that archived nothing for max_seconds, so slow signals still publish"""
+        archived = []
+        if not self.max_seconds:
+            return archived
+        for s, state in self.state.items():
+            if state[4] is not None and now - state[0] > self.max_seconds:
+                archived.append((s, state[4], state[5]))
+                state[:] = [state[4], state[5], math.inf, -math.inf, None, None]
+        return archived
+
+
+# Routes property value entries by alias prefix to aggregation, compression or pass through.
+class Processor:
+
+    def __init__(self, configuration: dict):
+        configuration = dict(DEFAULT_CONFIGURATION, **configuration)
+        self.configuration = configuration
+        self.aggregator = WindowAggregator(configuration['WindowSeconds'], configuration['Aggregates'], configuration['LatenessSeconds'])
+        self.compressor = SwingingDoor(configuration['CompressionDeviation'], configuration['CompressionMaxSeconds'])
+        self.aliases, self.series = [], {}
+        self.routes = {}
+        self.points_in, self.points_out = 0, 0
+
+    def route(self, alias: str) -> str:
+        route = self.routes.get(alias)
+        if route is None:
+            if any(alias.startswith(p) for p in self.configuration['CompressPrefixes']):
+                route = 'compress'
+            elif any(alias.startswith(p) for p in self.configuration['AggregatePrefixes']):
+                route = 'aggregate'
+            else:
+                route = 'pass'
+            self.routes[alias] = route
+        return route
+
+    def series_id(self, alias: str) -> int:
+        series = self.series.get(alias)
+        if series is None:
+            series = self.series[alias] = len(self.aliases)
+            self.aliases.append(alias)
+        return series
+
+    def snapshot(self) -> dict:
+        """Open windows and compression state by alias, saved with the read checkpoint so a restart loses no partial window"""
+        aggregator, compressor = self.aggregator, self.compressor
+        return {
+            'WindowSeconds': aggregator.window,
+            'open': [[self.aliases[series], window] + state for (series, window), state in aggregator.open.items()],
+            'watermark': aggregator.watermark if aggregator.watermark > -math.inf else None,
+            'closedBefore': aggregator.closed_before,
+            'late': aggregator.late,
+            'compression': {self.aliases[series]: state for series, state in compressor.state.items()},
+        }
+
+    def restore(self, snapshot: dict):
+        aggregator = self.aggregator
+        if snapshot.get('WindowSeconds') == aggregator.window:
+            # Window indexes of another window length mean nothing, those partial windows are dropped
+            for alias, window, *state in snapshot['open']:
+                aggregator.open[(self.series_id(alias), window)] = state
+            if snapshot['watermark'] is not None:
+                aggregator.watermark = snapshot['watermark']
+            aggregator.closed_before = snapshot['closedBefore']
+            aggregator.late = snapshot['late']
+        for alias, state in snapshot['compression'].items():
+            self.compressor.state[self.series_id(alias)] = state
+
+    def process(self, entries: list, now: float = None) -> tuple:
+        """Returns (indexes of the entries passed through unchanged, {alias: [(timestamp, value)]} of reduced points)"""
+        passed = []
+        columns = {'aggregate': ([], [], []), 'compress': ([], [], [])}
+        for index, entry in enumerate(entries):
+            alias = entry.get('propertyAlias')
+            route = self.route(alias) if alias else 'pass'
+            values = entry.get('propertyValues', [])
+            self.points_in += len(values)
+            numeric = route != 'pass' and all(
+                'doubleValue' in v['value'] or 'integerValue' in v['value'] for v in values
+            )
+            if not numeric:
+                passed.append(index)
+                self.points_out += len(values)
+                continue
+            series, timestamps, data = columns[route]
+            series_id = self.series_id(alias)
+            for v in values:
+                series.append(series_id)
+                timestamps.append(v['timestamp']['timeInSeconds'] + v['timestamp'].get('offsetInNanos', 0) / 1e9)
+                data.append(v['value'].get('doubleValue', v['value'].get('integerValue')))
+
+        arrays = {route: (np.array(s, dtype=np.int64), np.array(t, dtype=np.float64), np.array(d, dtype=np.float64))
+                  for route, (s, t, d) in columns.items()}
+        reduced = {}
+        self.aggregator.add(*arrays['aggregate'])
+        template = self.configuration['AliasTemplate']
+        for series, start, aggregates in self.aggregator.flush():
+            for aggregate, value in aggregates.items():
+                alias = template.format(alias=self.aliases[series], aggregate=aggregate)
+                reduced.setdefault(alias, []).append((start, value))
+        archived = self.compressor.add(*arrays['compress']) + self.compressor.flush(now if now is not None else time.time())
+        for series, timestamp, value in archived:
+            reduced.setdefault(self.aliases[series], []).append((timestamp, value))
+        self.points_out += sum(len(points) for points in reduced.values())
+        return passed, reduced
+
+
+# Returns the next sequence number to read and the Processor snapshot taken after the message before it
+def load_checkpoint(work_dir: str) -> tuple:
+    try:
+        with open(os.path.join(work_dir, CHECKPOINT_FILE)) as f:
+            checkpoint = json.load(f)
+        return checkpoint['sequenceNumber'], checkpoint.get('state')
+    except (OSError, ValueError, KeyError):
+        return 0, None
+
+
+def save_checkpoint(work_dir: str, sequence_number: int, state: dict):
+    path = os.path.join(work_dir, CHECKPOINT_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'sequenceNumber': sequence_number, 'state': state}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+# Stream manager entry ids allow only letters, digits, '_' and '-', aliases contain '/' and timestamps '.'.
+# The same point gets the same id when it is sent again after a restart.
+def point_entry_id(alias: str, timestamp: float) -> str:
+    return hashlib.sha1(f'{alias}@{timestamp!r}'.encode()).hexdigest()[:32]
+
+
+def run(args, configuration: dict):
+    from stream_manager import (
+        StreamManagerClient, ReadMessagesOptions, MessageStreamDefinition, StrategyOnFull, Persistence,
+        NotEnoughMessagesException, ResourceNotFoundException,
+        PutAssetPropertyValueEntry, AssetPropertyValue, Variant, TimeInNanos, Quality,
+    )
+    from stream_manager.util import Util
+
+    client = StreamManagerClient()
+    try:
+        client.describe_message_stream(args.source_stream)
+    except ResourceNotFoundException:
+        # The collector writes to the stream, it has to exist first
+        client.create_message_stream(MessageStreamDefinition(
+            name = args.source_stream, strategy_on_full = StrategyOnFull.OverwriteOldestData, persistence = Persistence.File
+        ))
+    oldest = client.describe_message_stream(args.source_stream).storage_status.oldest_sequence_number or 0
+    sequence, state = load_checkpoint(args.work_dir)
+    processor = Processor(configuration)
+    if state:
+        processor.restore(state)
+    sequence = max(sequence, oldest)
+    reported = checkpointed = time.monotonic()
+
+    while True:
+        try:
+            messages = client.read_messages(args.source_stream, ReadMessagesOptions(
+                desired_start_sequence_number = sequence, min_message_count = 1,
+                max_message_count = args.batch_size, read_timeout_millis = 1000
+            ))
+        except NotEnoughMessagesException:
+            messages = []
+        passed, reduced = processor.process([json.loads(message.payload) for message in messages])
+
+        for index in passed:
+            client.append_message(args.destination_stream, messages[index].payload)
+        for alias, points in reduced.items():
+            for start in range(0, len(points), MAX_VALUES_PER_ENTRY):
+                entry = PutAssetPropertyValueEntry(
+                    entry_id = point_entry_id(alias, points[start][0]),
+                    property_alias = alias,
+                    property_values = [
+                        AssetPropertyValue(
+                            value = Variant(double_value = value),
+                            quality = Quality.GOOD,
+                            timestamp = TimeInNanos(time_in_seconds = int(timestamp), offset_in_nanos = int(timestamp % 1 * 1e9)),
+                        )
+                        for timestamp, value in points[start:start + MAX_VALUES_PER_ENTRY]
+                    ],
+                )
+                client.append_message(args.destination_stream, Util.validate_and_serialize_to_json_bytes(entry))
+        if messages:
+            sequence = messages[-1].sequence_number + 1
+        if messages and time.monotonic() - checkpointed > args.checkpoint_interval:
+            # The read position and the windows it left open are saved together, after their output was appended.
+            # A restart reads again from the last checkpoint and sends the same points with the same entry ids.
+            save_checkpoint(args.work_dir, sequence, processor.snapshot())
+            checkpointed = time.monotonic()
+
+        if time.monotonic() - reported > args.report_interval:
+            ratio = processor.points_in / processor.points_out if processor.points_out else 0
+            print(f'{processor.points_in} points in, {processor.points_out} out ({ratio:.1f}x), {processor.aggregator.late} late', flush=True)
+            reported = time.monotonic()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Downsample SiteWise collector streams before the publisher')
+    parser.add_argument('--config', default='{}', help='Aggregation configuration JSON')
+    parser.add_argument('--source-stream', required=True)
+    parser.add_argument('--destination-stream', required=True)
+    parser.add_argument('--work-dir', default='.')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Messages read per batch')
+    parser.add_argument('--checkpoint-interval', type=float, default=5, help='Seconds between saves of the read position and open windows')
+    parser.add_argument('--report-interval', type=float, default=60)
+    args = parser.parse_args()
+    run(args, json.loads(args.config))
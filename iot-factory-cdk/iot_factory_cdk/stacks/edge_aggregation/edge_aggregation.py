@@ -0,0 +1,73 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import json
+from os import path
+from constructs import Construct
+
+from iot_factory_cdk.stacks.greengrass_v2_deployment.python_component import PythonComponent
+
+COMPONENT_NAME = 'com.iotfactory.SiteWiseEdgeAggregator'
+# Stream the collector writes to instead of the publisher stream, read by the aggregator
+DEFAULT_SOURCE_STREAM = 'SiteWise_Aggregation_Stream'
+PUBLISHER_STREAM = 'SiteWise_Edge_Stream'
+# numpy 1.24 is the last release for python 3.8, the PYTHON of python_component.py
+PIP_REQUIREMENTS = 'numpy==1.24.4 stream-manager==1.1.1'
+PUBLISHER_DEPENDENCY = { 'aws.iot.SiteWiseEdgePublisher': { 'VersionRequirement': '^2.0.0', 'DependencyType': 'SOFT' } }
+
+
+# This construct registers the edge aggregation component, which downsamples SiteWise collector data before the publisher.
+# @summary Greengrass component version with the aggregator artifact in S3, readable by the token exchange role.
+class EdgeAggregation(PythonComponent):
+
+    # @param {string} component_version - semantic version, bump it when assets/aggregator.py changes.
+    # @param {string} token_exchange_role_arn - role of the Greengrass role alias, granted read on the artifact.
+    # @param {string} source_stream - StreamManager stream the collector writes to.
+    # @param {string} destination_stream - stream of the reduced data, the publisher stream unless another component sits in between.
+    def __init__(self, scope: Construct, id: str, env: str, component_version: str, token_exchange_role_arn: str, app_name: str, cost_center: str, source_stream: str = DEFAULT_SOURCE_STREAM, destination_stream: str = PUBLISHER_STREAM, **kwargs) -> None:
+        super().__init__(scope, id,
+            component_name = COMPONENT_NAME,
+            component_version = component_version,
+            id_prefix = 'Aggregator',
+            description = 'Windowed aggregates and swinging door compression of SiteWise collector data before the publisher',
+            assets_path = path.join(path.dirname(__file__), 'assets'),
+            script = 'aggregator.py',
+            arguments = (
+                "--config '{configuration:/Aggregation}'"
+                " --source-stream {configuration:/SourceStream} --destination-stream {configuration:/DestinationStream}"
+                " --work-dir {work:path}"
+            ),
+            default_configuration = {
+                'SourceStream': source_stream,
+                'DestinationStream': destination_stream,
+                # A JSON string rather than an object so that it interpolates into the run command
+                'Aggregation': '{}'
+            },
+            pip_requirements = PIP_REQUIREMENTS,
+            dependencies = PUBLISHER_DEPENDENCY,
+            token_exchange_role_arn = token_exchange_role_arn,
+            app_name = app_name,
+            cost_center = cost_center,
+            **kwargs
+        )
+        self.source_stream = source_stream
+        self.destination_stream = destination_stream
+
+    # Returns the component entry for the GreengrassV2Deployment component dict
+    # @param {dict} aggregation - WindowSeconds, Aggregates, AggregatePrefixes, CompressPrefixes ... of assets/aggregator.py.
+    def to_component(self, aggregation: dict = None, **kwargs) -> dict:
+        return self.component_entry({ 'Aggregation': json.dumps(aggregation) } if aggregation else None, **kwargs)
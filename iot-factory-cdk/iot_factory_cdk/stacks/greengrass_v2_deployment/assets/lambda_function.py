@@ -16,10 +16,45 @@
 
 import boto3
 import sys
+import json
 
 # Create SDK client for greengrassv2
 client = boto3.client('greengrassv2')
 
+# validate_components checks configurationUpdate and runWith of each component and restores the
+# number types that CloudFormation turns into strings in custom resource properties
+def validate_components(components):
+    validated = {}
+    for name, component in components.items():
+        if not component.get('componentVersion'):
+            raise ValueError(f'Component {name} has no componentVersion')
+        component = dict(component)
+
+        configuration_update = component.get('configurationUpdate')
+        if configuration_update:
+            merge = configuration_update.get('merge')
+            if merge is not None and not isinstance(json.loads(merge), dict):
+                raise ValueError(f'Component {name} configurationUpdate merge must be a JSON object')
+            for pointer in configuration_update.get('reset', []):
+                if pointer != '' and not pointer.startswith('/'):
+                    raise ValueError(f'Component {name} reset path {pointer} must be a JSON pointer')
+
+        limits = component.get('runWith', {}).get('systemResourceLimits')
+        if limits:
+            limits = dict(limits)
+            if 'cpus' in limits:
+                limits['cpus'] = float(limits['cpus'])
+                if limits['cpus'] <= 0:
+                    raise ValueError(f'Component {name} cpus limit must be positive')
+            if 'memory' in limits:
+                limits['memory'] = int(limits['memory'])
+                if limits['memory'] <= 0:
+                    raise ValueError(f'Component {name} memory limit must be positive')
+            component['runWith'] = dict(component['runWith'], systemResourceLimits = limits)
+
+        validated[name] = component
+    return validated
+
 # on_event is the lambda event handler entry point
 def on_event(event, context):
     print(f'Received event: {event}  Received context: {context}')
@@ -43,53 +78,74 @@ def on_create(event):
     else:
         print('Create new resource with properties: ', props)
 
-        target_arn = props['TargetArn']
-        deployment_name = props['DeploymentName']
-        components = props['Components']
-        tags = props['Tags']
-
-        physical_resource_id = ''
-        deployment_id = ''
-        iot_job_id = ''
-        iot_job_arn = ''
-
-        # Create GreenGrass Deployment
-        try:
-            deployment_response = client.create_deployment(
-                targetArn = target_arn,
-                deploymentName = deployment_name,
-                components = components,
-                tags= tags
-            )
-            deployment_id = deployment_response.get('deploymentId')
-            iot_job_id  = deployment_response.get('iotJobId')
-            iot_job_arn = deployment_response.get('iotJobArn')
-            physical_resource_id = deployment_response.get('deploymentId')
-        except Exception as error:
-            print(f'Error calling create_deployment for target ${target_arn}, error: ${error}')
-            sys.exit(1)
-            
-        print("Output: {'PhysicalResourceId': ", physical_resource_id, " 'Data': { 'DeploymentId': ", deployment_id, " 'IotJobId': ", iot_job_id, " 'IotJobArn': ", iot_job_arn, "}")
-
-        return { 'PhysicalResourceId': physical_resource_id, 'Data': { 'DeploymentId': deployment_id, 'IotJobId': iot_job_id, 'IotJobArn': iot_job_arn } }
-
-# on_update provides custom resource data to return to CDK update calls
+        return create_deployment(props)
+
+# create_deployment validates the components of the resource properties and deploys them to the target
+def create_deployment(props):
+    target_arn = props['TargetArn']
+    deployment_name = props['DeploymentName']
+    tags = props['Tags']
+
+    # Reject invalid component configuration before creating the deployment
+    try:
+        components = validate_components(props['Components'])
+    except (ValueError, TypeError) as error:
+        print(f'Invalid component configuration for deployment {deployment_name}, error: {error}')
+        sys.exit(1)
+
+    physical_resource_id = ''
+    deployment_id = ''
+    iot_job_id = ''
+    iot_job_arn = ''
+
+    # Create GreenGrass Deployment
+    try:
+        deployment_response = client.create_deployment(
+            targetArn = target_arn,
+            deploymentName = deployment_name,
+            components = components,
+            tags= tags
+        )
+        deployment_id = deployment_response.get('deploymentId')
+        iot_job_id  = deployment_response.get('iotJobId')
+        iot_job_arn = deployment_response.get('iotJobArn')
+        physical_resource_id = deployment_response.get('deploymentId')
+    except Exception as error:
+        print(f'Error calling create_deployment for target ${target_arn}, error: ${error}')
+        sys.exit(1)
+
+    print("Output: {'PhysicalResourceId': ", physical_resource_id, " 'Data': { 'DeploymentId': ", deployment_id, " 'IotJobId': ", iot_job_id, " 'IotJobArn': ", iot_job_arn, "}")
+
+    return { 'PhysicalResourceId': physical_resource_id, 'Data': { 'DeploymentId': deployment_id, 'IotJobId': iot_job_id, 'IotJobArn': iot_job_arn } }
+
+# on_update creates a new deployment for the target when the components, target or name changed. The new
+# deployment replaces the previous one on the target, which CloudFormation then deletes (cancels) as the old physical id
 def on_update(event):
-    print('Update existing resource with properties: ', event['ResourceProperties'])
+    props = event['ResourceProperties']
+    old_props = event.get('OldResourceProperties', {})
+    print('Update existing resource with properties: ', props)
 
-    deployment_id = event['ResourceProperties']['DeploymentId']
     physical_resource_id = event['PhysicalResourceId']
+    if any(props.get(key) != old_props.get(key) for key in ('Components', 'TargetArn', 'DeploymentName')):
+        print(f'Components of deployment {physical_resource_id} changed, creating a new deployment')
+        return create_deployment(props)
 
-    print('No update required for already created greengrass v2 deployment: ', deployment_id)
+    print('No update required for already created greengrass v2 deployment: ', physical_resource_id)
+    try:
+        deployment = client.get_deployment(deploymentId = physical_resource_id)
+    except Exception as error:
+        print(f'Error calling get_deployment for deployment id {physical_resource_id}, error: {error}')
+        sys.exit(1)
 
-    return { 'PhysicalResourceId': physical_resource_id, 'Data': {} }
+    return { 'PhysicalResourceId': physical_resource_id, 'Data': { 'DeploymentId': physical_resource_id, 'IotJobId': deployment.get('iotJobId', ''), 'IotJobArn': deployment.get('iotJobArn', '') } }
 
 # on_delete detaches and deletes resources for this project sub resources
 def on_delete(event):
     print('Delete existing resource with properties: ', event['ResourceProperties'])
 
-    deployment_id = event['ResourceProperties']['DeploymentId']
+    # The DeploymentId property is always empty, the physical id is the id of the deployment
     physical_resource_id = event['PhysicalResourceId']
+    deployment_id = physical_resource_id
 
     # Cancel the deployment
     try:
@@ -0,0 +1,83 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import json
+
+
+# Builds one entry of the GreengrassV2Deployment component dict.
+# @summary Typed component version, configurationUpdate merge/reset and runWith system resource limits.
+class ComponentConfiguration:
+
+    # @param {string} component_name - e.g. aws.iot.SiteWiseEdgeCollectorOpcua.
+    # @param {string} component_version - version to deploy.
+    # @param {dict} merge - configuration keys merged into the component configuration.
+    # @param {list} reset - JSON pointers of configuration keys reset to their default values.
+    # @param {float} cpus - maximum CPU cores the component processes may use.
+    # @param {int} memory_mb - maximum memory of the component processes in MB.
+    # @param {string} posix_user - user:group the component runs as, defaults to the nucleus default user.
+    def __init__(self, component_name: str, component_version: str, merge: dict = None, reset: list = None,
+                 cpus: float = None, memory_mb: int = None, posix_user: str = None):
+        self.component_name = component_name
+        self.component_version = component_version
+        self.merge = merge
+        self.reset = reset
+        self.cpus = cpus
+        self.memory_mb = memory_mb
+        self.posix_user = posix_user
+        self.validate()
+
+    def validate(self):
+        if not self.component_version:
+            raise ValueError(f'Component {self.component_name} requires a componentVersion')
+        if self.merge is not None and not isinstance(self.merge, dict):
+            raise ValueError(f'Component {self.component_name} merge must be a dict, got {type(self.merge).__name__}')
+        for pointer in self.reset or []:
+            if pointer != '' and not pointer.startswith('/'):
+                raise ValueError(f'Component {self.component_name} reset path {pointer} must be a JSON pointer starting with /')
+        if self.cpus is not None and self.cpus <= 0:
+            raise ValueError(f'Component {self.component_name} cpus must be positive, got {self.cpus}')
+        if self.memory_mb is not None and self.memory_mb <= 0:
+            raise ValueError(f'Component {self.component_name} memory_mb must be positive, got {self.memory_mb}')
+        if self.posix_user is not None and not self.posix_user.strip():
+            raise ValueError(f'Component {self.component_name} posix_user must not be empty')
+
+    # Returns { component_name: { componentVersion, configurationUpdate, runWith } } in the create_deployment format
+    def to_component(self) -> dict:
+        component = { 'componentVersion': self.component_version }
+
+        configuration_update = {}
+        if self.merge:
+            configuration_update['merge'] = json.dumps(self.merge)
+        if self.reset:
+            configuration_update['reset'] = list(self.reset)
+        if configuration_update:
+            component['configurationUpdate'] = configuration_update
+
+        run_with = {}
+        if self.posix_user:
+            run_with['posixUser'] = self.posix_user
+        limits = {}
+        if self.cpus is not None:
+            limits['cpus'] = self.cpus
+        if self.memory_mb is not None:
+            # Greengrass expects the memory limit in KB
+            limits['memory'] = self.memory_mb * 1024
+        if limits:
+            run_with['systemResourceLimits'] = limits
+        if run_with:
+            component['runWith'] = run_with
+
+        return { self.component_name: component }
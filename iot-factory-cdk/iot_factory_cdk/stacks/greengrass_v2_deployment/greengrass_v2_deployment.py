@@ -90,11 +90,11 @@ class GreengrassV2Deployment (Construct) :
         provider = GreengrassV2Deployment.get_or_create_provider(self, id, self.custom_resource_name, lambda_role)
         
         # Custom resource Lambda role permissions 
-        # Permissions for Creating or cancelling deployment - requires expanded permissions to interact with things and jobs
+        # Permissions for creating, reading or cancelling deployments - requires expanded permissions to interact with things and jobs
         provider.on_event_handler.role.add_to_principal_policy(
             iam.PolicyStatement (
                 effect = iam.Effect.ALLOW,
-                actions = ['greengrass:CancelDeployment', 'greengrass:CreateDeployment', 'greengrass:TagResource'],
+                actions = ['greengrass:CancelDeployment', 'greengrass:CreateDeployment', 'greengrass:GetDeployment', 'greengrass:TagResource'],
                 resources = [f'arn:{partition}:greengrass:{region}:{account_id}:deployments*']
             )
         )
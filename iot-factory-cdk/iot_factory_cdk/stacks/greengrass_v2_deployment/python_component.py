@@ -0,0 +1,97 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import json
+from aws_cdk import (
+    aws_iam as iam,
+    aws_s3_assets as s3_assets,
+    aws_greengrassv2 as greengrassv2
+)
+from constructs import Construct
+
+from iot_factory_cdk.stacks.greengrass_v2_deployment.component_configuration import ComponentConfiguration
+
+# python3 of the gateway image is the python 3.7 of amazonlinux:2, python3.8 is installed next to it (Dockerfile)
+PYTHON = 'python3.8'
+STREAM_MANAGER_DEPENDENCY = { 'aws.greengrass.StreamManager': { 'VersionRequirement': '^2.0.0', 'DependencyType': 'HARD' } }
+
+
+# Base of the components whose artifact is a directory of python scripts, run with the python 3.8 of the gateway image.
+# @summary Greengrass component version with the assets directory in S3, readable by the token exchange role.
+class PythonComponent(Construct):
+
+    # @param {string} component_name - Greengrass component name.
+    # @param {string} component_version - semantic version, bump it when the assets change.
+    # @param {string} id_prefix - prefix of the artifact and component construct ids, kept stable so that
+    #                             the CloudFormation logical ids of deployed component versions do not change.
+    # @param {string} assets_path - directory uploaded as the artifact, __pycache__ excluded.
+    # @param {string} script - script in assets_path the component runs.
+    # @param {string} arguments - command line of the script, with {configuration:/...} interpolation.
+    # @param {dict} default_configuration - DefaultConfiguration of the recipe.
+    # @param {string} pip_requirements - packages installed for the component user.
+    # @param {dict} dependencies - ComponentDependencies besides StreamManager.
+    # @param {string} token_exchange_role_arn - role of the Greengrass role alias, granted read on the artifact.
+    def __init__(self, scope: Construct, id: str, component_name: str, component_version: str, id_prefix: str, description: str,
+                 assets_path: str, script: str, arguments: str, default_configuration: dict, pip_requirements: str,
+                 token_exchange_role_arn: str, app_name: str, cost_center: str, dependencies: dict = None, **kwargs) -> None:
+        super().__init__(scope, id, **kwargs)
+        self.component_name = component_name
+        self.component_version = component_version
+
+        artifact = s3_assets.Asset(self, f'{id_prefix}Artifact',
+            path = assets_path,
+            exclude = ['__pycache__']
+        )
+        artifact.grant_read(iam.Role.from_role_arn(self, 'TokenExchangeRole', token_exchange_role_arn))
+
+        recipe = {
+            'RecipeFormatVersion': '2020-01-25',
+            'ComponentName': component_name,
+            'ComponentVersion': component_version,
+            'ComponentDescription': description,
+            'ComponentPublisher': app_name,
+            'ComponentDependencies': dict(STREAM_MANAGER_DEPENDENCY, **(dependencies or {})),
+            'ComponentConfiguration': {
+                'DefaultConfiguration': default_configuration
+            },
+            'Manifests': [{
+                'Platform': { 'os': 'linux' },
+                'Lifecycle': {
+                    'Install': f'{PYTHON} -m pip install --user {pip_requirements}',
+                    # Directory assets are zip files named after the asset hash
+                    'Run': f'{PYTHON} -u {{artifacts:decompressedPath}}/{artifact.asset_hash}/{script} {arguments}'
+                },
+                'Artifacts': [{
+                    'Uri': f's3://{artifact.s3_bucket_name}/{artifact.s3_object_key}',
+                    'Unarchive': 'ZIP'
+                }]
+            }]
+        }
+        self.component = greengrassv2.CfnComponentVersion(self, f'{id_prefix}Component',
+            inline_recipe = json.dumps(recipe),
+            tags = { 'app': app_name, 'costcenter': cost_center }
+        )
+
+    # Returns the component entry for the GreengrassV2Deployment component dict
+    # @param {dict} merge - configurationUpdate merge, None to deploy the default configuration.
+    def component_entry(self, merge: dict = None, **kwargs) -> dict:
+        return ComponentConfiguration(
+            self.component_name,
+            self.component_version,
+            merge = merge,
+            **kwargs
+        ).to_component()
@@ -0,0 +1,130 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import sys
+import json
+import math
+import argparse
+
+from iot_factory_cdk.stacks.greengrass_v2_deployment.component_configuration import ComponentConfiguration
+
+STREAM_MANAGER_COMPONENT = 'aws.greengrass.StreamManager'
+
+# Approximate size of one SiteWise property value entry in the StreamManager store
+DEFAULT_BYTES_PER_POINT = 250
+# Extra store capacity kept on top of the computed outage backlog
+DEFAULT_SAFETY_FACTOR = 1.5
+LOG_LEVELS = ['TRACE', 'DEBUG', 'INFO', 'WARN', 'ERROR']
+
+
+# Holds StreamManager component tuning for one gateway and renders it as a deployment configurationUpdate merge.
+# @summary Typed StreamManager settings with validation and an outage based sizing calculator.
+class StreamManagerTuning:
+
+    # @param {string} component_version - StreamManager component version to deploy.
+    # @param {string} store_root_dir - directory of the StreamManager store, size the backing volume with required_store_bytes.
+    # @param {int} max_bandwidth_kbps - export bandwidth cap in kilobits per second, None for unlimited.
+    # @param {int} thread_pool_size - number of exporter threads.
+    # @param {string} jvm_args - JVM arguments of the StreamManager process, e.g. its heap size.
+    # @param {string} log_level - StreamManager log level.
+    # @param {int} required_store_bytes - disk the store needs to ride out the planned outage, informational.
+    def __init__(self, component_version: str, store_root_dir: str = None, max_bandwidth_kbps: int = None,
+                 thread_pool_size: int = None, jvm_args: str = None, log_level: str = None, required_store_bytes: int = None):
+        self.component_version = component_version
+        self.store_root_dir = store_root_dir
+        self.max_bandwidth_kbps = max_bandwidth_kbps
+        self.thread_pool_size = thread_pool_size
+        self.jvm_args = jvm_args
+        self.log_level = log_level
+        self.required_store_bytes = required_store_bytes
+        self.validate()
+
+    def validate(self):
+        if self.max_bandwidth_kbps is not None and self.max_bandwidth_kbps <= 0:
+            raise ValueError(f'StreamManager max_bandwidth_kbps must be positive, got {self.max_bandwidth_kbps}')
+        if self.thread_pool_size is not None and not 1 <= self.thread_pool_size <= 64:
+            raise ValueError(f'StreamManager thread_pool_size must be between 1 and 64, got {self.thread_pool_size}')
+        if self.log_level is not None and self.log_level not in LOG_LEVELS:
+            raise ValueError(f'StreamManager log_level must be one of {LOG_LEVELS}, got {self.log_level}')
+        if self.store_root_dir is not None and not self.store_root_dir.startswith('/'):
+            raise ValueError(f'StreamManager store_root_dir must be an absolute path, got {self.store_root_dir}')
+
+    # Returns the StreamManager component configuration keys that are set
+    def configuration(self) -> dict:
+        configuration = {}
+        if self.store_root_dir is not None:
+            configuration['STREAM_MANAGER_STORE_ROOT_DIR'] = self.store_root_dir
+        if self.max_bandwidth_kbps is not None:
+            # StreamManager takes the cap in kilobits per second
+            configuration['STREAM_MANAGER_EXPORTER_MAX_BANDWIDTH'] = str(self.max_bandwidth_kbps)
+        if self.thread_pool_size is not None:
+            configuration['STREAM_MANAGER_EXPORTER_THREAD_POOL_SIZE'] = str(self.thread_pool_size)
+        if self.jvm_args is not None:
+            configuration['JVM_ARGS'] = self.jvm_args
+        if self.log_level is not None:
+            configuration['LOG_LEVEL'] = self.log_level
+        return configuration
+
+    # Returns the component entry for the GreengrassV2Deployment component dict
+    def to_component(self) -> dict:
+        return ComponentConfiguration(
+            STREAM_MANAGER_COMPONENT,
+            self.component_version,
+            merge = self.configuration() or None
+        ).to_component()
+
+    # @summary Size StreamManager for a gateway from its data rate and the WAN outage it must survive.
+    # @param {float} points_per_second - property values collected per second by the gateway.
+    # @param {float} outage_hours - longest uplink outage to buffer without dropping data.
+    # @param {float} drain_hours - time allowed to drain the backlog after reconnecting, while live data keeps flowing.
+    # @param {int} bytes_per_point - stored size of one property value.
+    # @param {float} safety_factor - multiplier on the computed store size.
+    @staticmethod
+    def from_rates(component_version: str, points_per_second: float, outage_hours: float, drain_hours: float = None,
+                   bytes_per_point: int = DEFAULT_BYTES_PER_POINT, safety_factor: float = DEFAULT_SAFETY_FACTOR, **kwargs):
+        if points_per_second <= 0 or outage_hours <= 0:
+            raise ValueError('points_per_second and outage_hours must be positive')
+        live_bytes_per_second = points_per_second * bytes_per_point
+        backlog_bytes = live_bytes_per_second * outage_hours * 3600
+        drain_hours = drain_hours if drain_hours else outage_hours
+        # Export bandwidth must carry live data and drain the backlog in drain_hours
+        bandwidth = live_bytes_per_second + backlog_bytes / (drain_hours * 3600)
+        # Exporter threads scale with the drain rate, one per ~1 MB/s, capped to keep CPU for the collector
+        threads = min(16, max(1, math.ceil(bandwidth / (1 << 20))))
+        kwargs.setdefault('thread_pool_size', threads)
+        kwargs.setdefault('max_bandwidth_kbps', math.ceil(bandwidth * 1.2 * 8 / 1000))
+        return StreamManagerTuning(
+            component_version,
+            required_store_bytes = int(math.ceil(backlog_bytes * safety_factor)),
+            **kwargs
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Size StreamManager for a gateway from its data rate and outage tolerance')
+    parser.add_argument('--points-per-second', type=float, required=True)
+    parser.add_argument('--outage-hours', type=float, required=True)
+    parser.add_argument('--drain-hours', type=float)
+    parser.add_argument('--bytes-per-point', type=int, default=DEFAULT_BYTES_PER_POINT)
+    parser.add_argument('--disk-gb', type=float, help='Disk available to the gateway for the store')
+    args = parser.parse_args()
+
+    tuning = StreamManagerTuning.from_rates('2.1.9', args.points_per_second, args.outage_hours, args.drain_hours, args.bytes_per_point)
+    print(f'Required store size: {tuning.required_store_bytes / (1 << 30):.2f} GB')
+    print(f'Component configuration: {json.dumps(tuning.configuration(), indent=2)}')
+    if args.disk_gb and tuning.required_store_bytes > args.disk_gb * (1 << 30):
+        print(f'Store does not fit in {args.disk_gb} GB of disk, reduce the outage tolerance or add disk')
+        sys.exit(1)
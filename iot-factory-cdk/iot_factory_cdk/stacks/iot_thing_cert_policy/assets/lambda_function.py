@@ -60,6 +60,12 @@ def on_create(event):
         thing_arn = ''
         app_name = props['AppName']
         cost_center = props['CostCenter']
+        issue_certificate = props.get('IssueCertificate', 'true') == 'true'
+        # Without a certificate the thing name identifies the resource
+        physical_resource_id = thing_name
+        if not issue_certificate:
+            parameter_private_key = ''
+            parameter_certificate_pem = ''
 
         # Create IoT thing
         try:
@@ -71,19 +77,22 @@ def on_create(event):
             print(f'Error creating thing: {thing_name}', error)
             sys.exit(1)
 
-        # Create IoT certificate and keys
-        try:
-            key_and_certs_response = iot_client.create_keys_and_certificate(
-                setAsActive = True
-            )
-            certificate_arn = key_and_certs_response.get('certificateArn')
-            certificate_pem = key_and_certs_response.get('certificatePem')
-            physical_resource_id = key_and_certs_response.get('certificateId')
-            private_key = key_and_certs_response['keyPair'].get('PrivateKey')
-            print(key_and_certs_response)
-        except Exception as error:
-            print('Error creating certificate and keys: ', error)
-            sys.exit(1)
+        # With IssueCertificate false the certificate is issued from a CSR on the docker host (config_docker.py),
+        # so no private key is created here or stored in Parameter Store
+        if issue_certificate:
+            # Create IoT certificate and keys
+            try:
+                key_and_certs_response = iot_client.create_keys_and_certificate(
+                    setAsActive = True
+                )
+                certificate_arn = key_and_certs_response.get('certificateArn')
+                certificate_pem = key_and_certs_response.get('certificatePem')
+                physical_resource_id = key_and_certs_response.get('certificateId')
+                private_key = key_and_certs_response['keyPair'].get('PrivateKey')
+                print(key_and_certs_response)
+            except Exception as error:
+                print('Error creating certificate and keys: ', error)
+                sys.exit(1)
 
         # Create IoT policy
         try:
@@ -117,70 +126,71 @@ def on_create(event):
             print(f'Error creating policy: {policy_name}', error)
             sys.exit(1)
 
-        # Attach certificate and policy
-        try:
-            iot_client.attach_policy(
-                policyName = policy_name,
-                target = certificate_arn
-            )
-        except Exception as error:
-            print(f'Error attaching certificate: {certificate_arn} to policy: {policy_name}: ', error)
-            sys.exit(1)
-
-        # Attach thing and certificate
-        try:
-            iot_client.attach_thing_principal(
-                thingName = thing_name,
-                principal = certificate_arn
-            )
-
-        except Exception as error:
-            print(f'Error attaching certificate: {certificate_arn} to thing: {thing_name}: ', error)
-            sys.exit(1)
+        if issue_certificate:
+            # Attach certificate and policy
+            try:
+                iot_client.attach_policy(
+                    policyName = policy_name,
+                    target = certificate_arn
+                )
+            except Exception as error:
+                print(f'Error attaching certificate: {certificate_arn} to policy: {policy_name}: ', error)
+                sys.exit(1)
+
+            # Attach thing and certificate
+            try:
+                iot_client.attach_thing_principal(
+                    thingName = thing_name,
+                    principal = certificate_arn
+                )
 
-        # Store certificate and private key in SSM param store
-        try:
-            # Private Key
-            ssm_client.put_parameter(
-                Name = parameter_private_key,
-                Description = f'Certificate private key for IoT thing {thing_name}',
-                Value = private_key,
-                Type = 'SecureString',
-                Tags=[
-                    {
-                        'Key': 'app',
-                        'Value': app_name
-                    },
-                    {
-                        'Key': 'costcenter',
-                        'Value': cost_center
-                    }
+            except Exception as error:
+                print(f'Error attaching certificate: {certificate_arn} to thing: {thing_name}: ', error)
+                sys.exit(1)
+
+            # Store certificate and private key in SSM param store
+            try:
+                # Private Key
+                ssm_client.put_parameter(
+                    Name = parameter_private_key,
+                    Description = f'Certificate private key for IoT thing {thing_name}',
+                    Value = private_key,
+                    Type = 'SecureString',
+                    Tags=[
+                        {
+                            'Key': 'app',
+                            'Value': app_name
+                        },
+                        {
+                            'Key': 'costcenter',
+                            'Value': cost_center
+                        }
                     
-                ],
-                Tier = 'Advanced'
-            )
+                    ],
+                    Tier = 'Advanced'
+                )
 
-            # Certificate PEM
-            ssm_client.put_parameter(
-                Name = parameter_certificate_pem,
-                Description = f'Certificate PEM for IoT thing {thing_name}',
-                Value = certificate_pem,
-                Type = 'String',
-                Tags=[
-                    {
-                        'Key': 'app',
-                        'Value': app_name
-                    },
-                    {
-                        'Key': 'costcenter',
-                        'Value': cost_center
-                    }
-                ],
-                Tier = 'Advanced'
-            )
-        except Exception as error:
-            print('Error creating secure string parameters: ', error)
-            sys.exit(1)
+                # Certificate PEM
+                ssm_client.put_parameter(
+                    Name = parameter_certificate_pem,
+                    Description = f'Certificate PEM for IoT thing {thing_name}',
+                    Value = certificate_pem,
+                    Type = 'String',
+                    Tags=[
+                        {
+                            'Key': 'app',
+                            'Value': app_name
+                        },
+                        {
+                            'Key': 'costcenter',
+                            'Value': cost_center
+                        }
+                    ],
+                    Tier = 'Advanced'
+                )
+            except Exception as error:
+                print('Error creating secure string parameters: ', error)
+                sys.exit(1)
 
         # Additional data - these calls and responses are used in other constructs or external applications
         # Get the IoT-Data endpoint
@@ -232,12 +242,14 @@ def on_delete(event):
     physical_resource_id = event['PhysicalResourceId']
     parameter_private_key = f'/{stack_name}/{thing_name}/private_key'
     parameter_certificate_pem = f'/{stack_name}/{thing_name}/certificate_pem'
+    issue_certificate = event['ResourceProperties'].get('IssueCertificate', 'true') == 'true'
 
     # Delete certificate and private key from SSM param store
-    try:
-        ssm_client.delete_parameters( Names = [ parameter_private_key, parameter_certificate_pem ] )
-    except Exception as error:
-        print('Unable to delete parameter store values: ', error)
+    if issue_certificate:
+        try:
+            ssm_client.delete_parameters( Names = [ parameter_private_key, parameter_certificate_pem ] )
+        except Exception as error:
+            print('Unable to delete parameter store values: ', error)
 
     # Delete policy (prune versions, detach from targets)
     # Delete all non active policy versions
@@ -282,11 +294,12 @@ def on_delete(event):
         print(f'Unable to list or detach things or policies from certificate {certificate_arn}: ', error)
 
     # Update Certificate
-    try:
-        iot_client.update_certificate( certificateId = physical_resource_id, newStatus = 'REVOKED' )
-        iot_client.delete_certificate( certificateId = physical_resource_id )
-    except Exception as error:
-        print(f'Unable to delete certificate {certificate_arn}: ', error)
+    if issue_certificate:
+        try:
+            iot_client.update_certificate( certificateId = physical_resource_id, newStatus = 'REVOKED' )
+            iot_client.delete_certificate( certificateId = physical_resource_id )
+        except Exception as error:
+            print(f'Unable to delete certificate {certificate_arn}: ', error)
 
     # Delete thing
     # Check and detach principals attached to thing
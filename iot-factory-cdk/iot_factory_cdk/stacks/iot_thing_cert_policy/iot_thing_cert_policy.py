@@ -44,8 +44,10 @@ class IotThingCertPolicy (Construct):
     # @param {cdk.App} scope - represents the scope for all the resources.
     # @param {string} id - this is a scope-unique id.
     # @param {thing_name, iot_policy_name, role_alias_name, app_name} props - user provided props for the construct.
+    # @param {bool} issue_certificate - False when the certificate is issued from a CSR on the docker host, then no key pair
+    #                                   and no Parameter Store values are created and the certificate attributes are empty.
     # @since AWS CDK v2.22.0
-    def __init__(self, scope: Construct, id: str, env: str, thing_name: str, iot_policy_name: str, role_alias_name: str, app_name: str, cost_center:str, **kwargs) -> None:
+    def __init__(self, scope: Construct, id: str, env: str, thing_name: str, iot_policy_name: str, role_alias_name: str, app_name: str, cost_center:str, issue_certificate: bool = True, **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
 
         # ============================================================= #
@@ -168,7 +170,8 @@ class IotThingCertPolicy (Construct):
                 'IotPolicyName' : iot_policy_name,
                 'CertificateArn' : self.certificate_arn,
                 'AppName' : app_name,
-                'CostCenter' : cost_center
+                'CostCenter' : cost_center,
+                'IssueCertificate' : 'true' if issue_certificate else 'false'
             }
         )
 
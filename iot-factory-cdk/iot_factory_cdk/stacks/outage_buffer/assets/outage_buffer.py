@@ -0,0 +1,432 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+# Greengrass component between the SiteWise OPC UA collector and the SiteWise publisher that keeps
+# WAN outage data as compact columnar segments instead of one JSON message per value.
+# While the SiteWise endpoint is reachable, property values pass from SourceStream to DestinationStream
+# (SiteWise_Edge_Stream) unchanged. During an outage they go into an open segment in memory, sealed to
+# <work>/segments every SegmentSeconds or SegmentMaxPoints:
+#   - one series per property alias, sorted by timestamp
+#   - timestamps as int64 nanosecond deltas, values as float64 / int64 / uint8 arrays (strings as JSON)
+#   - timestamps, values and qualities of all series in three zlib blocks
+# After reconnect live data is forwarded first and the segments are drained oldest first, each series
+# as entries of 10 values, at most DrainPointsPerSecond. The source stream read position is only saved
+# once values are forwarded or sealed, so a restart loses nothing but may send a segment twice.
+# With Drain false the segments are left for backfill.py, which moves them out of the directory and
+# imports them with SiteWise bulk import jobs, so that the publisher only carries fresh data. A segment
+# is renamed to .draining before it drains, backfill.py only takes .seg files, so no segment goes both ways.
+
+import os
+import sys
+import json
+import time
+import zlib
+import socket
+import struct
+import argparse
+import threading
+from array import array
+from itertools import accumulate
+
+MAGIC = b'SWB1'
+LENGTHS = struct.Struct('<IIII')
+VARIANTS = ['doubleValue', 'integerValue', 'booleanValue', 'stringValue']
+TYPECODES = {'doubleValue': 'd', 'integerValue': 'q', 'booleanValue': 'B'}
+QUALITIES = ['GOOD', 'BAD', 'UNCERTAIN']
+MAX_VALUES_PER_ENTRY = 10
+SEGMENT_SUFFIX = '.seg'
+# Suffix of the segment being drained, resumed first after a restart or the next reconnect
+DRAINING_SUFFIX = '.draining'
+CHECKPOINT_FILE = 'checkpoint.json'
+DEFAULT_CONFIGURATION = {
+    'SegmentSeconds': 300,
+    'SegmentMaxPoints': 1000000,
+    'MaxDiskMB': 10240,
+    'DrainPointsPerSecond': 10000,
+    'Drain': True,
+    'CompressionLevel': 6,
+    # Host probed on port 443 for connectivity, data.iotsitewise.<region>.amazonaws.com when empty
+    'ProbeHost': '',
+    'ProbeSeconds': 10,
+    'ProbeFailures': 3,
+}
+
+
+def _little_endian(column: array) -> bytes:
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _from_little_endian(typecode: str, data: bytes) -> array:
+    column = array(typecode)
+    column.frombytes(data)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+
+# Values of one property alias in an open segment, in arrival order.
+class Series:
+
+    __slots__ = ('variant', 'timestamps', 'values', 'qualities')
+
+    def __init__(self, variant: str):
+        self.variant = variant
+        self.timestamps = array('q')
+        self.values = [] if variant == 'stringValue' else array(TYPECODES[variant])
+        self.qualities = array('B')
+
+
+# Outage data of one time partition in memory, encoded to a segment file when sealed.
+class Segment:
+
+    def __init__(self):
+        self.series = {}
+        self.points = 0
+        self.start = None
+        self.end = None
+        self.opened = time.monotonic()
+
+    def add(self, entries: list) -> int:
+        """Add PutAssetPropertyValueEntry dicts, returns the number of malformed entries"""
+        malformed = 0
+        for entry in entries:
+            try:
+                alias = entry['propertyAlias']
+                for v in entry['propertyValues']:
+                    variant = next(k for k in VARIANTS if k in v['value'])
+                    # Converted before anything is appended, so that a bad value leaves the columns of equal length
+                    timestamp = array('q', [v['timestamp']['timeInSeconds'] * 1000000000 + v['timestamp'].get('offsetInNanos', 0)])[0]
+                    value = v['value'][variant]
+                    if variant != 'stringValue':
+                        value = array(TYPECODES[variant], [value])[0]
+                    elif not isinstance(value, str):
+                        raise TypeError(f'stringValue {value!r} is not a string')
+                    quality = QUALITIES.index(v.get('quality', 'GOOD'))
+                    key = (alias, variant)
+                    series = self.series.get(key)
+                    if series is None:
+                        series = self.series[key] = Series(variant)
+                    series.timestamps.append(timestamp)
+                    series.values.append(value)
+                    series.qualities.append(quality)
+                    self.points += 1
+                    self.start = timestamp if self.start is None else min(self.start, timestamp)
+                    self.end = timestamp if self.end is None else max(self.end, timestamp)
+            except (KeyError, TypeError, ValueError, OverflowError, StopIteration):
+                malformed += 1
+        return malformed
+
+    def encode(self, level: int = 6) -> bytes:
+        meta, timestamp_parts, value_parts, quality_parts = [], [], [], []
+        for (alias, variant), series in sorted(self.series.items()):
+            timestamps = series.timestamps
+            order = range(len(timestamps))
+            if any(b < a for a, b in zip(timestamps, timestamps[1:])):
+                order = sorted(order, key = timestamps.__getitem__)
+            ordered = [timestamps[i] for i in order]
+            deltas = array('q', [ordered[0]] + [b - a for a, b in zip(ordered, ordered[1:])])
+            timestamp_parts.append(_little_endian(deltas))
+            if variant == 'stringValue':
+                values = json.dumps([series.values[i] for i in order]).encode()
+            else:
+                values = _little_endian(array(series.values.typecode, [series.values[i] for i in order]))
+            value_parts.append(values)
+            quality_parts.append(bytes(series.qualities[i] for i in order))
+            meta.append([alias, variant, len(ordered), len(values)])
+        header = zlib.compress(json.dumps({'start': self.start, 'end': self.end, 'points': self.points, 'series': meta}).encode(), level)
+        blocks = [zlib.compress(b''.join(parts), level) for parts in (timestamp_parts, value_parts, quality_parts)]
+        return MAGIC + LENGTHS.pack(len(header), *[len(b) for b in blocks]) + header + b''.join(blocks)
+
+
+def read_header(data: bytes) -> tuple:
+    """Returns (header dict, offset of the column blocks) of an encoded segment"""
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('Not a buffer segment')
+    lengths = LENGTHS.unpack_from(data, len(MAGIC))
+    offset = len(MAGIC) + LENGTHS.size
+    header = json.loads(zlib.decompress(data[offset:offset + lengths[0]]))
+    return header, offset + lengths[0], lengths[1:]
+
+
+def decode(data: bytes):
+    """Yields (alias, variant, timestamps in nanoseconds, values, qualities) of every series of a segment"""
+    header, offset, lengths = read_header(data)
+    blocks = []
+    for length in lengths:
+        blocks.append(zlib.decompress(data[offset:offset + length]))
+        offset += length
+    timestamp_block, value_block, quality_block = blocks
+    t, v, q = 0, 0, 0
+    for alias, variant, count, value_bytes in header['series']:
+        timestamps = list(accumulate(_from_little_endian('q', timestamp_block[t:t + 8 * count])))
+        if variant == 'stringValue':
+            values = json.loads(value_block[v:v + value_bytes])
+        else:
+            values = _from_little_endian(TYPECODES[variant], value_block[v:v + value_bytes]).tolist()
+            if variant == 'booleanValue':
+                values = [bool(value) for value in values]
+        yield alias, variant, timestamps, values, quality_block[q:q + count]
+        t, v, q = t + 8 * count, v + value_bytes, q + count
+
+
+def drain_entries(data: bytes, prefix: str = 'b'):
+    """Yields (points, PutAssetPropertyValueEntry dict) of a segment with up to 10 values per entry"""
+    n = 0
+    for alias, variant, timestamps, values, qualities in decode(data):
+        for start in range(0, len(timestamps), MAX_VALUES_PER_ENTRY):
+            end = start + MAX_VALUES_PER_ENTRY
+            entry = {
+                'entryId': f'{prefix}-{n}',
+                'propertyAlias': alias,
+                'propertyValues': [
+                    {
+                        'value': {variant: value},
+                        'timestamp': {'timeInSeconds': timestamp // 1000000000, 'offsetInNanos': timestamp % 1000000000},
+                        'quality': QUALITIES[quality],
+                    }
+                    for timestamp, value, quality in zip(timestamps[start:end], values[start:end], qualities[start:end])
+                ],
+            }
+            n += 1
+            yield len(entry['propertyValues']), entry
+
+
+# Sealed segments in a directory, named by their first timestamp so that listing order is drain order.
+class SegmentStore:
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.sequence = 0
+        self.dropped_segments = 0
+        os.makedirs(directory, exist_ok = True)
+        for name in os.listdir(directory):
+            if name.endswith('.tmp'):
+                os.remove(os.path.join(directory, name))
+
+    def segments(self) -> list:
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX))
+
+    def _size(self, name: str) -> int:
+        try:
+            return os.path.getsize(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            # Claimed by backfill.py
+            return 0
+
+    def size(self) -> int:
+        return sum(self._size(name) for name in os.listdir(self.directory) if name.endswith((SEGMENT_SUFFIX, DRAINING_SUFFIX)))
+
+    def write(self, segment: Segment, level: int = 6) -> str:
+        data = segment.encode(level)
+        self.sequence += 1
+        name = f'{segment.start:020d}-{os.getpid()}-{self.sequence:06d}{SEGMENT_SUFFIX}'
+        path = os.path.join(self.directory, name)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+        # Past the disk budget the oldest outage data goes first, like StreamManager OverwriteOldestData
+        segments = self.segments()
+        total = self.size()
+        while total > self.max_bytes and len(segments) > 1:
+            oldest = segments.pop(0)
+            total -= self._size(oldest)
+            try:
+                os.remove(os.path.join(self.directory, oldest))
+                self.dropped_segments += 1
+            except FileNotFoundError:
+                pass
+        return path
+
+    def claim_oldest(self) -> str:
+        """Path of the segment being drained, or of the oldest segment renamed to drain it, None without segments"""
+        draining = sorted(name for name in os.listdir(self.directory) if name.endswith(DRAINING_SUFFIX))
+        if draining:
+            return os.path.join(self.directory, draining[0])
+        for name in self.segments():
+            path = os.path.join(self.directory, name)
+            claimed = path[:-len(SEGMENT_SUFFIX)] + DRAINING_SUFFIX
+            try:
+                os.rename(path, claimed)
+                return claimed
+            except FileNotFoundError:
+                # Claimed by backfill.py
+                continue
+        return None
+
+
+# Connectivity to the SiteWise endpoint, probed in a background thread.
+class Probe:
+
+    def __init__(self, host: str, interval: float, failures: int):
+        self.host = host
+        self.interval = interval
+        self.failures = failures
+        self.failed = 0
+        self.online = True
+
+    def check(self) -> bool:
+        try:
+            socket.create_connection((self.host, 443), timeout = 3).close()
+            return True
+        except OSError:
+            return False
+
+    def run(self):
+        while True:
+            if self.check():
+                self.failed = 0
+                self.online = True
+            else:
+                self.failed += 1
+                if self.failed >= self.failures:
+                    self.online = False
+            time.sleep(self.interval)
+
+
+def load_checkpoint(work_dir: str) -> int:
+    try:
+        with open(os.path.join(work_dir, CHECKPOINT_FILE)) as f:
+            return json.load(f)['sequenceNumber']
+    except (OSError, ValueError, KeyError):
+        return 0
+
+
+def save_checkpoint(work_dir: str, sequence_number: int):
+    path = os.path.join(work_dir, CHECKPOINT_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'sequenceNumber': sequence_number}, f)
+    os.replace(path + '.tmp', path)
+
+
+def run(args, configuration: dict):
+    from stream_manager import (
+        StreamManagerClient, ReadMessagesOptions, MessageStreamDefinition, StrategyOnFull, Persistence,
+        NotEnoughMessagesException, ResourceNotFoundException,
+    )
+
+    configuration = dict(DEFAULT_CONFIGURATION, **configuration)
+    level = configuration['CompressionLevel']
+    store = SegmentStore(os.path.join(args.work_dir, 'segments'), configuration['MaxDiskMB'] * 2 ** 20)
+    probe = Probe(
+        configuration['ProbeHost'] or f'data.iotsitewise.{os.getenv("AWS_REGION")}.amazonaws.com',
+        configuration['ProbeSeconds'], configuration['ProbeFailures']
+    )
+    threading.Thread(target = probe.run, daemon = True).start()
+
+    client = StreamManagerClient()
+    try:
+        client.describe_message_stream(args.source_stream)
+    except ResourceNotFoundException:
+        client.create_message_stream(MessageStreamDefinition(
+            name = args.source_stream, strategy_on_full = StrategyOnFull.OverwriteOldestData, persistence = Persistence.File
+        ))
+    oldest = client.describe_message_stream(args.source_stream).storage_status.oldest_sequence_number or 0
+    sequence = max(load_checkpoint(args.work_dir), oldest)
+
+    segment = Segment()
+    draining, drain_path = None, None
+    budget, refilled = 0.0, time.monotonic()
+    counts = {'forwarded': 0, 'buffered': 0, 'drained': 0, 'malformed': 0}
+    reported = time.monotonic()
+
+    while True:
+        try:
+            messages = client.read_messages(args.source_stream, ReadMessagesOptions(
+                desired_start_sequence_number = sequence, min_message_count = 1,
+                max_message_count = args.batch_size, read_timeout_millis = 1000
+            ))
+        except NotEnoughMessagesException:
+            messages = []
+
+        if probe.online:
+            if segment.points:
+                # The outage is over, seal what it left so that it drains in order
+                store.write(segment, level)
+                segment = Segment()
+            for message in messages:
+                client.append_message(args.destination_stream, message.payload)
+            counts['forwarded'] += len(messages)
+            if messages:
+                sequence = messages[-1].sequence_number + 1
+                save_checkpoint(args.work_dir, sequence)
+
+            # Drain the backlog with what is left of the points per second budget
+            now = time.monotonic()
+            budget = min(budget + (now - refilled) * configuration['DrainPointsPerSecond'], configuration['DrainPointsPerSecond'])
+            refilled = now
+            while configuration['Drain'] and budget > 0:
+                if draining is None:
+                    drain_path = store.claim_oldest()
+                    if drain_path is None:
+                        break
+                    with open(drain_path, 'rb') as f:
+                        draining = drain_entries(f.read(), os.path.basename(drain_path)[:-len(DRAINING_SUFFIX)])
+                entry = next(draining, None)
+                if entry is None:
+                    os.remove(drain_path)
+                    draining = None
+                    continue
+                points, payload = entry
+                client.append_message(args.destination_stream, json.dumps(payload).encode())
+                budget -= points
+                counts['drained'] += points
+        else:
+            if draining is not None:
+                # The segment stays .draining and resumes from its start after the next reconnect
+                draining = None
+            entries = []
+            for message in messages:
+                try:
+                    entries.append(json.loads(message.payload))
+                except ValueError:
+                    counts['malformed'] += 1
+            points = segment.points
+            counts['malformed'] += segment.add(entries)
+            counts['buffered'] += segment.points - points
+            if messages:
+                sequence = messages[-1].sequence_number + 1
+            age = time.monotonic() - segment.opened
+            if segment.points >= configuration['SegmentMaxPoints'] or (segment.points and age >= configuration['SegmentSeconds']):
+                store.write(segment, level)
+                segment = Segment()
+                save_checkpoint(args.work_dir, sequence)
+            elif not segment.points and messages:
+                save_checkpoint(args.work_dir, sequence)
+
+        if time.monotonic() - reported > args.report_interval:
+            state = 'online' if probe.online else 'offline'
+            print(f'{state}, {counts}, {len(store.segments())} segments of {store.size() / 2 ** 20:.1f} MB, '
+                  f'{store.dropped_segments} dropped for MaxDiskMB', flush = True)
+            reported = time.monotonic()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Buffer SiteWise collector data as columnar segments during WAN outages')
+    parser.add_argument('--config', default='{}', help='Buffer configuration JSON')
+    parser.add_argument('--source-stream', required=True)
+    parser.add_argument('--destination-stream', required=True)
+    parser.add_argument('--work-dir', default='.')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Messages read per batch')
+    parser.add_argument('--report-interval', type=float, default=60)
+    args = parser.parse_args()
+    run(args, json.loads(args.config))
@@ -0,0 +1,69 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import json
+from os import path
+from constructs import Construct
+
+from iot_factory_cdk.stacks.greengrass_v2_deployment.python_component import PythonComponent
+from iot_factory_cdk.stacks.edge_aggregation.edge_aggregation import PUBLISHER_STREAM, PUBLISHER_DEPENDENCY
+
+COMPONENT_NAME = 'com.iotfactory.SiteWiseOutageBuffer'
+# Stream the collector (or edge aggregation) writes to instead of the publisher stream, read by the buffer
+DEFAULT_SOURCE_STREAM = 'SiteWise_Buffer_Stream'
+PIP_REQUIREMENTS = 'stream-manager==1.1.1'
+
+
+# This construct registers the outage buffer component, which keeps WAN outage data as compressed columnar segments.
+# @summary Greengrass component version with the buffer artifact in S3, readable by the token exchange role.
+class OutageBuffer(PythonComponent):
+
+    # @param {string} component_version - semantic version, bump it when assets/outage_buffer.py changes.
+    # @param {string} token_exchange_role_arn - role of the Greengrass role alias, granted read on the artifact.
+    # @param {string} source_stream - StreamManager stream the collector or edge aggregation writes to.
+    def __init__(self, scope: Construct, id: str, env: str, component_version: str, token_exchange_role_arn: str, app_name: str, cost_center: str, source_stream: str = DEFAULT_SOURCE_STREAM, **kwargs) -> None:
+        super().__init__(scope, id,
+            component_name = COMPONENT_NAME,
+            component_version = component_version,
+            id_prefix = 'OutageBuffer',
+            description = 'Columnar on-disk buffer of SiteWise collector data during WAN outages, drained in order after reconnect',
+            assets_path = path.join(path.dirname(__file__), 'assets'),
+            script = 'outage_buffer.py',
+            arguments = (
+                "--config '{configuration:/Buffer}'"
+                " --source-stream {configuration:/SourceStream} --destination-stream {configuration:/DestinationStream}"
+                " --work-dir {work:path}"
+            ),
+            default_configuration = {
+                'SourceStream': source_stream,
+                'DestinationStream': PUBLISHER_STREAM,
+                # A JSON string rather than an object so that it interpolates into the run command
+                'Buffer': '{}'
+            },
+            pip_requirements = PIP_REQUIREMENTS,
+            dependencies = PUBLISHER_DEPENDENCY,
+            token_exchange_role_arn = token_exchange_role_arn,
+            app_name = app_name,
+            cost_center = cost_center,
+            **kwargs
+        )
+        self.source_stream = source_stream
+
+    # Returns the component entry for the GreengrassV2Deployment component dict
+    # @param {dict} buffer - SegmentSeconds, MaxDiskMB, DrainPointsPerSecond, ProbeHost ... of assets/outage_buffer.py.
+    def to_component(self, buffer: dict = None, **kwargs) -> dict:
+        return self.component_entry({ 'Buffer': json.dumps(buffer) } if buffer else None, **kwargs)
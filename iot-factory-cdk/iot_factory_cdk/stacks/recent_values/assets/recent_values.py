@@ -0,0 +1,320 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+# Greengrass component serving the recent values of the gateway from memory.
+# It tails the StreamManager streams of the SiteWise collector (reads do not consume, the publisher
+# still gets every message) into one preallocated ring buffer per property alias and answers on a
+# local HTTP port, so dashboards on the plant floor keep working during WAN outages:
+#   GET /aliases?prefix=/Line1/&limit=100                   aliases in the index, sorted
+#   GET /latest?alias=/Line1/Speed&alias=...  or ?prefix=   latest value of each alias
+#   GET /values?alias=/Line1/Speed&seconds=60               values of the last seconds, or since= and until=
+#   GET /stats                                              aliases, points, dropped points and memory
+# Timestamps are epoch seconds, values are [timestamp, value, quality].
+
+import sys
+import json
+import time
+import bisect
+import argparse
+import threading
+import urllib.parse
+from array import array
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+QUALITIES = ['GOOD', 'BAD', 'UNCERTAIN']
+VARIANTS = ['doubleValue', 'integerValue', 'booleanValue', 'stringValue']
+DEFAULT_PORT = 9120
+DEFAULT_CAPACITY = 3600
+DEFAULT_MAX_ALIASES = 10000
+DEFAULT_WARMUP_MESSAGES = 10000
+MAX_QUERY_VALUES = 10000
+# Bytes per value of a numeric ring: timestamp, value and quality
+VALUE_BYTES = 8 + 8 + 1
+
+
+# Last capacity values of one property in timestamp order, allocated once.
+class RingBuffer:
+
+    __slots__ = ('capacity', 'variant', 'timestamps', 'values', 'qualities', 'start', 'size')
+
+    def __init__(self, capacity: int, variant: str):
+        self.capacity = capacity
+        self.variant = variant
+        self.timestamps = array('d', bytes(8 * capacity))
+        # Strings are kept as references, everything else as doubles
+        self.values = [None] * capacity if variant == 'stringValue' else array('d', bytes(8 * capacity))
+        self.qualities = array('b', bytes(capacity))
+        self.start = 0
+        self.size = 0
+
+    def _at(self, i: int) -> int:
+        return (self.start + i) % self.capacity
+
+    def append(self, timestamp: float, value, quality: int) -> bool:
+        """False for a value older than the newest one, which would break the time order"""
+        if self.size:
+            newest = self._at(self.size - 1)
+            if timestamp < self.timestamps[newest]:
+                return False
+            if timestamp == self.timestamps[newest]:
+                # SiteWise keeps the last value written for a timestamp
+                self.values[newest], self.qualities[newest] = value, quality
+                return True
+        if self.size < self.capacity:
+            i = self._at(self.size)
+            self.size += 1
+        else:
+            i = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.timestamps[i], self.values[i], self.qualities[i] = timestamp, value, quality
+        return True
+
+    def _point(self, i: int) -> list:
+        value = self.values[i]
+        if self.variant == 'integerValue':
+            value = int(value)
+        elif self.variant == 'booleanValue':
+            value = bool(value)
+        return [self.timestamps[i], value, QUALITIES[self.qualities[i]]]
+
+    def _bisect(self, timestamp: float, right: bool) -> int:
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            t = self.timestamps[self._at(mid)]
+            if t < timestamp or (right and t == timestamp):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def latest(self) -> list:
+        return self._point(self._at(self.size - 1)) if self.size else None
+
+    def window(self, since: float, until: float, limit: int) -> list:
+        """Values with since <= timestamp <= until, the newest limit of them"""
+        first = self._bisect(since, right = False)
+        last = self._bisect(until, right = True)
+        first = max(first, last - limit)
+        return [self._point(self._at(i)) for i in range(first, last)]
+
+
+# Ring buffers of every alias with a sorted alias index, shared by the stream readers and the HTTP threads.
+class RecentValues:
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, max_aliases: int = DEFAULT_MAX_ALIASES):
+        if capacity <= 0 or max_aliases <= 0:
+            raise ValueError(f'Capacity and max aliases must be positive, got {capacity} and {max_aliases}')
+        self.capacity = capacity
+        self.max_aliases = max_aliases
+        self.lock = threading.Lock()
+        self.buffers = {}
+        self.index = []
+        self.points = 0
+        self.out_of_order = 0
+        self.dropped = 0
+        self.malformed = 0
+        self.streams = {}
+
+    def _buffer(self, alias: str, variant: str) -> RingBuffer:
+        buffer = self.buffers.get(alias)
+        if buffer is None:
+            if len(self.buffers) >= self.max_aliases:
+                return None
+            buffer = self.buffers[alias] = RingBuffer(self.capacity, variant)
+            bisect.insort(self.index, alias)
+        elif buffer.variant != variant and 'stringValue' in (buffer.variant, variant):
+            # The data type of a property changed, start over rather than mix strings and numbers
+            buffer = self.buffers[alias] = RingBuffer(self.capacity, variant)
+        return buffer
+
+    def add(self, entries: list, stream: str = None, malformed: int = 0):
+        """Add PutAssetPropertyValueEntry dicts as the collector writes them to StreamManager"""
+        with self.lock:
+            self.malformed += malformed
+            for entry in entries:
+                try:
+                    alias = entry['propertyAlias']
+                    for v in entry['propertyValues']:
+                        variant = next(k for k in VARIANTS if k in v['value'])
+                        buffer = self._buffer(alias, variant)
+                        if buffer is None:
+                            self.dropped += 1
+                            continue
+                        value = v['value'][variant]
+                        timestamp = v['timestamp']['timeInSeconds'] + v['timestamp'].get('offsetInNanos', 0) / 1e9
+                        quality = QUALITIES.index(v.get('quality', 'GOOD'))
+                        if buffer.append(timestamp, value if variant == 'stringValue' else float(value), quality):
+                            self.points += 1
+                        else:
+                            self.out_of_order += 1
+                except (KeyError, TypeError, ValueError, StopIteration):
+                    self.malformed += 1
+            if stream:
+                read = self.streams.setdefault(stream, {'entries': 0, 'last_read': None})
+                read['entries'] += len(entries)
+                read['last_read'] = time.time()
+
+    def aliases(self, prefix: str = '', limit: int = MAX_QUERY_VALUES) -> list:
+        with self.lock:
+            start = bisect.bisect_left(self.index, prefix)
+            found = []
+            for alias in self.index[start:start + limit]:
+                if not alias.startswith(prefix):
+                    break
+                found.append(alias)
+            return found
+
+    def latest(self, aliases: list) -> dict:
+        with self.lock:
+            return {alias: self.buffers[alias].latest() if alias in self.buffers else None for alias in aliases}
+
+    def window(self, alias: str, since: float, until: float, limit: int = MAX_QUERY_VALUES) -> list:
+        with self.lock:
+            buffer = self.buffers.get(alias)
+            return None if buffer is None else buffer.window(since, until, limit)
+
+    def stats(self) -> dict:
+        with self.lock:
+            strings = sum(1 for b in self.buffers.values() if b.variant == 'stringValue')
+            return {
+                'aliases': len(self.buffers),
+                'max_aliases': self.max_aliases,
+                'capacity': self.capacity,
+                'points': self.points,
+                'out_of_order': self.out_of_order,
+                'dropped': self.dropped,
+                'malformed': self.malformed,
+                # Ring arrays only, string values are counted as references
+                'memory_bytes': len(self.buffers) * self.capacity * VALUE_BYTES,
+                'string_aliases': strings,
+                'streams': {stream: dict(read) for stream, read in self.streams.items()},
+            }
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_handler(cache: RecentValues):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            query = urllib.parse.parse_qs(url.query)
+            try:
+                limit = min(int(query.get('limit', [MAX_QUERY_VALUES])[0]), MAX_QUERY_VALUES)
+                if limit <= 0:
+                    raise ValueError('limit must be positive')
+                if url.path == '/aliases':
+                    aliases = cache.aliases(query.get('prefix', [''])[0], limit)
+                    self._reply(200, {'aliases': aliases, 'count': len(aliases)})
+                elif url.path == '/latest':
+                    aliases = query.get('alias') or cache.aliases(query.get('prefix', [''])[0], limit)
+                    self._reply(200, {'values': cache.latest(aliases)})
+                elif url.path == '/values':
+                    if 'alias' not in query:
+                        raise ValueError('alias is required')
+                    alias = query['alias'][0]
+                    now = time.time()
+                    if 'seconds' in query:
+                        since, until = now - float(query['seconds'][0]), now
+                    else:
+                        since, until = float(query.get('since', [0])[0]), float(query.get('until', [now])[0])
+                    values = cache.window(alias, since, until, limit)
+                    if values is None:
+                        self._reply(404, {'message': f'No values for alias {alias}'})
+                    else:
+                        self._reply(200, {'alias': alias, 'values': values})
+                elif url.path == '/stats':
+                    self._reply(200, cache.stats())
+                elif url.path == '/healthz':
+                    self._reply(200, {'status': 'ok'})
+                else:
+                    self._reply(404, {'message': f'Unknown path {url.path}'})
+            except ValueError as e:
+                self._reply(400, {'message': str(e)})
+
+        def _reply(self, status: int, body: dict):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def tail(cache: RecentValues, stream: str, warmup_messages: int, batch_size: int):
+    from stream_manager import StreamManagerClient, ReadMessagesOptions, NotEnoughMessagesException, ResourceNotFoundException
+
+    client = StreamManagerClient()
+    sequence = None
+    while True:
+        try:
+            if sequence is None:
+                # Warm up from the newest messages instead of replaying a whole outage backlog
+                status = client.describe_message_stream(stream).storage_status
+                newest = status.newest_sequence_number if status.newest_sequence_number is not None else -1
+                sequence = max(status.oldest_sequence_number or 0, newest - warmup_messages + 1)
+            messages = client.read_messages(stream, ReadMessagesOptions(
+                desired_start_sequence_number = sequence, min_message_count = 1,
+                max_message_count = batch_size, read_timeout_millis = 1000
+            ))
+        except NotEnoughMessagesException:
+            continue
+        except ResourceNotFoundException:
+            # The collector creates its stream on the first write
+            time.sleep(5)
+            continue
+        entries, malformed = [], 0
+        for message in messages:
+            try:
+                entries.append(json.loads(message.payload))
+            except ValueError:
+                malformed += 1
+        cache.add(entries, stream, malformed)
+        sequence = messages[-1].sequence_number + 1
+
+
+def run(args):
+    cache = RecentValues(args.capacity, args.max_aliases)
+    streams = [stream.strip() for stream in args.streams.split(',') if stream.strip()]
+    for stream in streams:
+        threading.Thread(target = tail, args = (cache, stream, args.warmup_messages, args.batch_size), daemon = True).start()
+    print(f'Serving the last {args.capacity} values of up to {args.max_aliases} aliases of {streams} on port {args.port}, '
+          f'at most {args.capacity * args.max_aliases * VALUE_BYTES / 2 ** 20:.0f} MB of numeric values', flush=True)
+    ThreadingHTTPServer(('', args.port), make_handler(cache)).serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the recent values of the SiteWise collector streams over local HTTP')
+    parser.add_argument('--streams', required=True, help='Comma separated StreamManager streams to tail')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--capacity', type=int, default=DEFAULT_CAPACITY, help='Values kept per alias')
+    parser.add_argument('--max-aliases', type=int, default=DEFAULT_MAX_ALIASES, help='Aliases kept, values of further aliases are dropped')
+    parser.add_argument('--warmup-messages', type=int, default=DEFAULT_WARMUP_MESSAGES, help='Newest messages of each stream read at start')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Messages read per batch')
+    args = parser.parse_args()
+    if args.capacity <= 0 or args.max_aliases <= 0:
+        print('--capacity and --max-aliases must be positive')
+        sys.exit(1)
+    run(args)
@@ -0,0 +1,72 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from os import path
+from constructs import Construct
+
+from iot_factory_cdk.stacks.greengrass_v2_deployment.python_component import PythonComponent
+
+COMPONENT_NAME = 'com.iotfactory.SiteWiseRecentValues'
+# Port inside the gateway container, published on the host by docker-compose.yml (--recent-values-port of config_docker.py)
+CONTAINER_PORT = 9120
+DEFAULT_CAPACITY = 3600
+DEFAULT_MAX_ALIASES = 10000
+PIP_REQUIREMENTS = 'stream-manager==1.1.1'
+
+
+# This construct registers the recent values component, a local cache of the SiteWise collector streams with an HTTP query API.
+# @summary Greengrass component version with the cache artifact in S3, readable by the token exchange role.
+class RecentValues(PythonComponent):
+
+    # @param {string} component_version - semantic version, bump it when assets/recent_values.py changes.
+    # @param {string} token_exchange_role_arn - role of the Greengrass role alias, granted read on the artifact.
+    # @param {list} streams - StreamManager streams the collector (and edge aggregation) write to.
+    def __init__(self, scope: Construct, id: str, env: str, component_version: str, token_exchange_role_arn: str, app_name: str, cost_center: str, streams: list, **kwargs) -> None:
+        super().__init__(scope, id,
+            component_name = COMPONENT_NAME,
+            component_version = component_version,
+            id_prefix = 'RecentValues',
+            description = 'Recent values of the SiteWise collector streams in memory, served over local HTTP',
+            assets_path = path.join(path.dirname(__file__), 'assets'),
+            script = 'recent_values.py',
+            arguments = (
+                "--streams {configuration:/Streams} --port {configuration:/Port}"
+                " --capacity {configuration:/Capacity} --max-aliases {configuration:/MaxAliases}"
+            ),
+            default_configuration = {
+                'Streams': ','.join(streams),
+                'Port': CONTAINER_PORT,
+                'Capacity': DEFAULT_CAPACITY,
+                'MaxAliases': DEFAULT_MAX_ALIASES
+            },
+            pip_requirements = PIP_REQUIREMENTS,
+            token_exchange_role_arn = token_exchange_role_arn,
+            app_name = app_name,
+            cost_center = cost_center,
+            **kwargs
+        )
+
+    # Returns the component entry for the GreengrassV2Deployment component dict
+    # @param {int} capacity - values kept per alias.
+    # @param {int} max_aliases - aliases kept, memory is about capacity * max_aliases * 17 bytes.
+    def to_component(self, capacity: int = None, max_aliases: int = None, **kwargs) -> dict:
+        merge = {}
+        if capacity:
+            merge['Capacity'] = capacity
+        if max_aliases:
+            merge['MaxAliases'] = max_aliases
+        return self.component_entry(merge or None, **kwargs)
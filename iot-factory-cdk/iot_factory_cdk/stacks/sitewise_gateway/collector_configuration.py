@@ -0,0 +1,174 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import json
+
+from iot_factory_cdk.stacks.sitewise_gateway.node_filters import NodeFilterRule
+
+COLLECTOR_NAMESPACE = 'iotsitewise:opcuacollector:2'
+DEFAULT_SOURCE_NAME = 'OPC-UA Server'
+# EXCHANGE subscribes to data changes sampled at the rate, POLL reads the nodes every rate milliseconds
+SCAN_MODES = ['EXCHANGE', 'POLL']
+DEADBAND_TYPES = ['ABSOLUTE', 'PERCENT']
+
+
+# Collection settings for the nodes under a set of browse paths.
+# @summary Validated collector property group with scan mode, sampling rate and absolute or percent deadband.
+class PropertyGroup:
+
+    # @param {string} name - unique name of the group in the source.
+    # @param {list} root_paths - browse paths the group applies to, with the wildcards of NodeFilterRule.
+    # @param {string} scan_mode - EXCHANGE (subscription) or POLL, None for the collector default.
+    # @param {int} rate_ms - sampling interval of EXCHANGE or polling interval of POLL in milliseconds.
+    # @param {string} deadband_type - ABSOLUTE or PERCENT, None to collect every change.
+    # @param {float} deadband_value - change below which values are dropped, in engineering units or percent of the range.
+    # @param {float} egu_min - low end of the engineering range for PERCENT, read from the node EURange when not set.
+    # @param {float} egu_max - high end of the engineering range for PERCENT.
+    # @param {int} deadband_timeout_ms - send a value at least this often even within the deadband.
+    def __init__(self, name: str, root_paths: list, scan_mode: str = None, rate_ms: int = None,
+                 deadband_type: str = None, deadband_value: float = None, egu_min: float = None, egu_max: float = None,
+                 deadband_timeout_ms: int = None):
+        self.name = name
+        self.root_paths = root_paths
+        self.scan_mode = scan_mode
+        self.rate_ms = rate_ms
+        self.deadband_type = deadband_type
+        self.deadband_value = deadband_value
+        self.egu_min = egu_min
+        self.egu_max = egu_max
+        self.deadband_timeout_ms = deadband_timeout_ms
+        self.validate()
+
+    def validate(self):
+        if not self.name:
+            raise ValueError('Property group requires a name')
+        if not self.root_paths:
+            raise ValueError(f'Property group {self.name} requires at least one root path')
+        for root_path in self.root_paths:
+            NodeFilterRule('INCLUDE', root_path)
+        if self.scan_mode is not None and self.scan_mode not in SCAN_MODES:
+            raise ValueError(f'Property group {self.name} scan_mode must be one of {SCAN_MODES}, got {self.scan_mode}')
+        if self.scan_mode == 'POLL' and self.rate_ms is None:
+            raise ValueError(f'Property group {self.name} POLL requires rate_ms')
+        if self.rate_ms is not None and (self.scan_mode is None or self.rate_ms <= 0):
+            raise ValueError(f'Property group {self.name} rate_ms must be positive and needs a scan_mode, got {self.rate_ms}')
+        if self.deadband_type is None:
+            if any(v is not None for v in (self.deadband_value, self.egu_min, self.egu_max, self.deadband_timeout_ms)):
+                raise ValueError(f'Property group {self.name} deadband settings need a deadband_type')
+            return
+        if self.deadband_type not in DEADBAND_TYPES:
+            raise ValueError(f'Property group {self.name} deadband_type must be one of {DEADBAND_TYPES}, got {self.deadband_type}')
+        if self.deadband_value is None or self.deadband_value < 0:
+            raise ValueError(f'Property group {self.name} deadband_value must be zero or positive, got {self.deadband_value}')
+        if self.deadband_type == 'PERCENT':
+            if self.deadband_value > 100:
+                raise ValueError(f'Property group {self.name} PERCENT deadband_value must be at most 100, got {self.deadband_value}')
+            if (self.egu_min is None) != (self.egu_max is None):
+                raise ValueError(f'Property group {self.name} needs both egu_min and egu_max or neither')
+            if self.egu_min is not None and self.egu_min >= self.egu_max:
+                raise ValueError(f'Property group {self.name} egu_min must be below egu_max')
+        elif self.egu_min is not None or self.egu_max is not None:
+            raise ValueError(f'Property group {self.name} egu_min and egu_max only apply to PERCENT deadbands')
+        if self.deadband_timeout_ms is not None and self.deadband_timeout_ms <= 0:
+            raise ValueError(f'Property group {self.name} deadband_timeout_ms must be positive, got {self.deadband_timeout_ms}')
+
+    # Returns the group in the propertyGroups format of the collector source
+    def to_group(self) -> dict:
+        group = {
+            'name': self.name,
+            'nodeFilterRuleDefinitions': [{'type': 'OpcUaRootPath', 'rootPath': root_path} for root_path in self.root_paths],
+        }
+        if self.scan_mode is not None:
+            group['scanMode'] = {'type': self.scan_mode}
+            if self.rate_ms is not None:
+                group['scanMode']['rate'] = self.rate_ms
+        if self.deadband_type is not None:
+            deadband = {'type': self.deadband_type, 'value': self.deadband_value}
+            if self.egu_min is not None:
+                deadband['eguMin'], deadband['eguMax'] = self.egu_min, self.egu_max
+            if self.deadband_timeout_ms is not None:
+                deadband['timeoutMilliseconds'] = self.deadband_timeout_ms
+            group['deadband'] = deadband
+        return group
+
+    @staticmethod
+    def from_group(group: dict):
+        scan_mode = group.get('scanMode', {})
+        deadband = group.get('deadband', {})
+        return PropertyGroup(
+            group.get('name'),
+            [definition['rootPath'] for definition in group.get('nodeFilterRuleDefinitions', [])],
+            scan_mode = scan_mode.get('type'),
+            rate_ms = scan_mode.get('rate'),
+            deadband_type = deadband.get('type'),
+            deadband_value = deadband.get('value'),
+            egu_min = deadband.get('eguMin'),
+            egu_max = deadband.get('eguMax'),
+            deadband_timeout_ms = deadband.get('timeoutMilliseconds')
+        )
+
+
+# Returns the PropertyGroup list of a propertyGroups JSON file
+def read_property_groups(file: str) -> list:
+    with open(file) as f:
+        return [PropertyGroup.from_group(group) for group in json.load(f)]
+
+
+# @summary Build the iotsitewise:opcuacollector:2 capability configuration of one OPC UA source, without CDK so tools can render it too.
+# @param {string} endpoint_uri - e.g. opc.tcp://10.0.0.5:49320.
+# @param {list} node_filter_rules - NodeFilterRule list, None to collect the whole address space.
+# @param {list} property_groups - PropertyGroup list, None for the collector defaults on every node.
+# @param {string} destination_stream - StreamManager stream to write to instead of the publisher stream, e.g. for edge aggregation.
+# @param {string} source_name - name of the source in the gateway.
+def collector_configuration(endpoint_uri: str, node_filter_rules: list = None, property_groups: list = None,
+                            destination_stream: str = None, source_name: str = DEFAULT_SOURCE_NAME) -> dict:
+    for rule in node_filter_rules or []:
+        rule.validate()
+    names, paths = set(), {}
+    for group in property_groups or []:
+        group.validate()
+        if group.name in names:
+            raise ValueError(f'Property group name {group.name} is used twice')
+        names.add(group.name)
+        for root_path in group.root_paths:
+            # A node in two groups would get either group's settings
+            if root_path in paths:
+                raise ValueError(f'Root path {root_path} is in property groups {paths[root_path]} and {group.name}')
+            paths[root_path] = group.name
+
+    configuration = {
+        'sources': [{
+            'name': source_name,
+            'endpoint': {
+                'certificateTrust': { 'type': 'TrustAny' },
+                'endpointUri': endpoint_uri,
+                'securityPolicy': 'BASIC256_SHA256',
+                'messageSecurityMode': 'SIGN_AND_ENCRYPT',
+                'identityProvider':{'type':'Anonymous'},
+                'nodeFilterRules':[rule.to_rule() for rule in node_filter_rules or []]
+            },
+            'measurementDataStreamPrefix': ''
+        }]
+    }
+    if destination_stream:
+        configuration['sources'][0]['destination'] = {
+            'type': 'StreamManager',
+            'streamName': destination_stream,
+            'streamBufferSize': 10
+        }
+    if property_groups:
+        configuration['sources'][0]['propertyGroups'] = [group.to_group() for group in property_groups]
+    return configuration
@@ -0,0 +1,388 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import sys
+import json
+import asyncio
+import argparse
+from fnmatch import fnmatchcase
+
+ACTIONS = ['INCLUDE', 'EXCLUDE']
+DEFAULT_CACHE = 'address-space.json'
+# Assumed update rate of variables that do not report a MinimumSamplingInterval
+DEFAULT_RATE = 1.0
+READ_BATCH = 1000
+
+
+# One collector nodeFilterRules entry.
+# @summary Validated INCLUDE / EXCLUDE rule on an OPC UA browse path, * matches within a path segment and ** any number of segments.
+class NodeFilterRule:
+
+    # @param {string} action - INCLUDE or EXCLUDE.
+    # @param {string} root_path - browse path from the Objects folder, e.g. /Simulation/Line1/*, the node and everything below it are matched.
+    def __init__(self, action: str, root_path: str):
+        self.action = action
+        self.root_path = root_path
+        self.validate()
+
+    def validate(self):
+        if self.action not in ACTIONS:
+            raise ValueError(f'Node filter action must be one of {ACTIONS}, got {self.action}')
+        if not self.root_path.startswith('/'):
+            raise ValueError(f'Node filter rootPath {self.root_path} must start with /')
+        if '' in self.segments():
+            raise ValueError(f'Node filter rootPath {self.root_path} has an empty path segment')
+
+    def segments(self) -> list:
+        return self.root_path.strip('/').split('/') if self.root_path != '/' else []
+
+    # Returns the rule in the iotsitewise:opcuacollector:2 capability format
+    def to_rule(self) -> dict:
+        return {'action': self.action, 'definition': {'type': 'OpcUaRootPath', 'rootPath': self.root_path}}
+
+    @staticmethod
+    def from_rule(rule: dict):
+        return NodeFilterRule(rule['action'], rule['definition']['rootPath'])
+
+    def __str__(self):
+        return f'{self.action} {self.root_path}'
+
+
+# Node of the address space trie, keyed by browse name.
+class BrowseNode:
+    __slots__ = ('name', 'node_id', 'rate', 'parent', 'children', 'tags', 'known_rate', 'unknown_rate')
+
+    def __init__(self, name: str, parent=None, node_id: str = None, rate: float = None):
+        self.name = name
+        self.parent = parent
+        self.node_id = node_id
+        # Updates per second of a variable, None when the server did not report it, -1 for folders and objects
+        self.rate = rate
+        self.children = {}
+        # Subtree aggregates, filled by AddressSpace.index()
+        self.tags = 0
+        self.known_rate = 0.0
+        self.unknown_rate = 0
+
+    def path(self) -> str:
+        names = []
+        node = self
+        while node.parent is not None:
+            names.append(node.name)
+            node = node.parent
+        return '/' + '/'.join(reversed(names))
+
+
+def outermost(nodes: list) -> list:
+    """Nodes of the list that have no ancestor in the list, without duplicates"""
+    ids = {id(n) for n in nodes}
+    top, seen = [], set()
+    for node in nodes:
+        parent = node.parent
+        while parent is not None and id(parent) not in ids:
+            parent = parent.parent
+        if parent is None and id(node) not in seen:
+            seen.add(id(node))
+            top.append(node)
+    return top
+
+
+# Browsed OPC UA address space as a trie over browse paths with per subtree tag counts and rates,
+# so that filter rules are evaluated by walking only the matched branches.
+# @summary Indexed local cache of an OPC UA address space, saved as JSON.
+class AddressSpace:
+
+    def __init__(self):
+        self.root = BrowseNode('', rate = -1)
+
+    # @param {string} path - browse path of the node from the Objects folder.
+    # @param {string} node_id - NodeId string of the node.
+    # @param {float} rate - updates per second for variables, None if unknown, -1 for folders and objects.
+    def insert(self, path: str, node_id: str, rate: float = -1):
+        node = self.root
+        for name in path.strip('/').split('/'):
+            child = node.children.get(name)
+            if child is None:
+                child = node.children[name] = BrowseNode(name, node, rate = -1)
+            node = child
+        node.node_id = node_id
+        node.rate = rate
+        return node
+
+    # Compute the subtree aggregates bottom up, iteratively so deep servers do not hit the recursion limit
+    def index(self):
+        order, stack = [], [self.root]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(node.children.values())
+        for node in reversed(order):
+            node.tags = 1 if node.rate is None or node.rate >= 0 else 0
+            node.known_rate = node.rate if node.tags and node.rate is not None else 0.0
+            node.unknown_rate = 1 if node.tags and node.rate is None else 0
+            for child in node.children.values():
+                node.tags += child.tags
+                node.known_rate += child.known_rate
+                node.unknown_rate += child.unknown_rate
+
+    def match(self, rule: NodeFilterRule) -> list:
+        """Nodes whose browse path matches the rule, without duplicates"""
+        segments = rule.segments()
+        matched, matched_ids, seen = [], set(), set()
+        stack = [(self.root, 0)]
+        while stack:
+            node, i = stack.pop()
+            if (id(node), i) in seen:
+                continue
+            seen.add((id(node), i))
+            if i == len(segments):
+                if id(node) not in matched_ids:
+                    matched_ids.add(id(node))
+                    matched.append(node)
+                continue
+            segment = segments[i]
+            if segment == '**':
+                # ** matches zero segments here, or one more and stays
+                stack.append((node, i + 1))
+                stack.extend((child, i) for child in node.children.values())
+            elif any(c in segment for c in '*?['):
+                stack.extend((child, i + 1) for name, child in node.children.items() if fnmatchcase(name, segment))
+            elif segment in node.children:
+                stack.append((node.children[segment], i + 1))
+        return matched
+
+    def evaluate(self, rules: list, default_rate: float = DEFAULT_RATE) -> dict:
+        """Tag count and estimated updates per second of each rule and of all rules together"""
+        matches = {str(rule): self.match(rule) for rule in rules}
+        included = {id(n) for rule in rules if rule.action == 'INCLUDE' for n in matches[str(rule)]}
+        excluded = {id(n) for rule in rules if rule.action == 'EXCLUDE' for n in matches[str(rule)]}
+        if not any(rule.action == 'INCLUDE' for rule in rules):
+            # The collector subscribes to the whole address space when no INCLUDE rule is given
+            included = {id(self.root)}
+
+        # Ancestors of matched nodes are the only branches the walk has to descend into
+        def ancestors(ids):
+            result = set()
+            for node in [n for nodes in matches.values() for n in nodes] + [self.root]:
+                if id(node) not in ids:
+                    continue
+                node = node.parent
+                while node is not None and id(node) not in result:
+                    result.add(id(node))
+                    node = node.parent
+            return result
+
+        include_above, exclude_above = ancestors(included), ancestors(excluded)
+
+        tags, known_rate, unknown = 0, 0.0, 0
+        stack = [(self.root, False)]
+        while stack:
+            node, inside = stack.pop()
+            if id(node) in excluded:
+                continue
+            inside = inside or id(node) in included
+            if inside and id(node) not in exclude_above:
+                tags, known_rate, unknown = tags + node.tags, known_rate + node.known_rate, unknown + node.unknown_rate
+            elif inside or id(node) in include_above:
+                stack.extend((child, inside) for child in node.children.values())
+
+        report = []
+        for rule in rules:
+            # Nested matches of one rule, such as a folder and its tags for /Line1/**, count once
+            top = outermost(matches[str(rule)])
+            report.append({
+                'rule': str(rule),
+                'nodes': len(matches[str(rule)]),
+                'tags': sum(n.tags for n in top),
+                'updates_per_second': sum(n.known_rate + n.unknown_rate * default_rate for n in top),
+            })
+        return {
+            'rules': report,
+            'tags': tags,
+            'updates_per_second': known_rate + unknown * default_rate,
+            'unknown_rate_tags': unknown,
+        }
+
+    def save(self, file: str):
+        def encode(node):
+            entry = {'n': node.name, 'i': node.node_id, 'r': node.rate}
+            if node.children:
+                entry['c'] = [encode(child) for child in node.children.values()]
+            return entry
+
+        sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+        with open(file, 'w') as f:
+            json.dump(encode(self.root), f, separators=(',', ':'))
+
+    @staticmethod
+    def load(file: str):
+        with open(file) as f:
+            data = json.load(f)
+        space = AddressSpace()
+        stack = [(space.root, data)]
+        while stack:
+            node, entry = stack.pop()
+            node.node_id, node.rate = entry.get('i'), entry.get('r')
+            for child_entry in entry.get('c', []):
+                child = node.children[child_entry['n']] = BrowseNode(child_entry['n'], node)
+                stack.append((child, child_entry))
+        space.index()
+        return space
+
+
+# @summary Browse an OPC UA server from the Objects folder once into an AddressSpace.
+# @param {string} endpoint - e.g. opc.tcp://10.0.0.5:49320.
+# @param {string} security - asyncua security string, e.g. Basic256Sha256,SignAndEncrypt,cert.der,key.pem, None for no security.
+# @param {int} concurrency - browse requests in flight.
+async def browse(endpoint: str, security: str = None, concurrency: int = 8) -> AddressSpace:
+    try:
+        from asyncua import Client, ua
+    except ImportError:
+        print('asyncua is required to browse, pip3 install -r requirements-dev.txt')
+        sys.exit(1)
+
+    space = AddressSpace()
+    client = Client(endpoint, timeout=30)
+    if security:
+        await client.set_security_string(security)
+    async with client:
+        queue = asyncio.Queue()
+        queue.put_nowait((client.nodes.objects, ''))
+        variables = []
+        has_property = ua.NodeId(ua.ObjectIds.HasProperty)
+
+        async def worker():
+            while True:
+                node, path = await queue.get()
+                try:
+                    for reference in await node.get_children_descriptions(refs=ua.ObjectIds.HierarchicalReferences):
+                        # Skip the Server object and other standard nodes, and properties such as EURange
+                        if reference.NodeId.NamespaceIndex == 0 or reference.ReferenceTypeId == has_property:
+                            continue
+                        child_path = f'{path}/{reference.BrowseName.Name}'
+                        if reference.NodeClass == ua.NodeClass.Variable:
+                            variables.append((space.insert(child_path, reference.NodeId.to_string(), None), reference.NodeId))
+                        elif reference.NodeClass == ua.NodeClass.Object:
+                            space.insert(child_path, reference.NodeId.to_string())
+                            queue.put_nowait((client.get_node(reference.NodeId), child_path))
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+        await queue.join()
+        for task in workers:
+            task.cancel()
+
+        # Rates from the server's MinimumSamplingInterval in ms, 0 or negative means unknown or continuous
+        for start in range(0, len(variables), READ_BATCH):
+            batch = variables[start:start + READ_BATCH]
+            values = await client.read_attributes([client.get_node(i) for _, i in batch], ua.AttributeIds.MinimumSamplingInterval)
+            for (node, _), value in zip(batch, values):
+                interval = value.Value.Value if value.StatusCode.is_good() else None
+                node.rate = 1000.0 / interval if interval and interval > 0 else None
+    space.index()
+    return space
+
+
+def print_evaluation(result: dict):
+    for entry in result['rules']:
+        print(f"{entry['rule']:<60} {entry['nodes']:>8} nodes {entry['tags']:>9} tags {entry['updates_per_second']:>12,.1f} updates/s")
+    print(f"Selected {result['tags']} tags, about {result['updates_per_second']:,.1f} updates/s"
+          + (f", {result['unknown_rate_tags']} at the default rate" if result['unknown_rate_tags'] else ''))
+
+
+# @summary Check that every rule matches something and write the rules for SitewiseGateway (NodeFilterRulesFile in env.sh).
+def emit(space: AddressSpace, rules: list, file: str, default_rate: float):
+    result = space.evaluate(rules, default_rate)
+    unmatched = [entry['rule'] for entry in result['rules'] if entry['nodes'] == 0]
+    if unmatched:
+        raise ValueError(f'Rules match no node of the address space: {unmatched}')
+    if result['tags'] == 0:
+        raise ValueError('Rules select no tags')
+    with open(file, 'w') as f:
+        json.dump([rule.to_rule() for rule in rules], f, indent=2)
+    print(f'Wrote {len(rules)} rules selecting {result["tags"]} tags to {file}')
+
+
+def interactive(space: AddressSpace, rules: list, default_rate: float):
+    print('Commands: include <path>, exclude <path>, drop <n>, show, emit <file>, quit')
+    while True:
+        try:
+            line = input('> ').strip()
+        except EOFError:
+            return
+        command, _, value = line.partition(' ')
+        try:
+            if command in ('include', 'exclude'):
+                rules.append(NodeFilterRule(command.upper(), value.strip()))
+            elif command == 'drop':
+                rules.pop(int(value))
+            elif command == 'emit':
+                emit(space, rules, value.strip(), default_rate)
+                continue
+            elif command == 'quit':
+                return
+            elif command != 'show':
+                print(f'Unknown command {command}')
+                continue
+        except (ValueError, IndexError) as e:
+            print(e)
+            continue
+        for n, rule in enumerate(rules):
+            print(f'{n}: {rule}')
+        print_evaluation(space.evaluate(rules, default_rate))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Browse an OPC UA server once and compile nodeFilterRules against the cached address space')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    browse_parser = subparsers.add_parser('browse', help='Browse the server into the cache')
+    browse_parser.add_argument('--endpoint', required=True, help='e.g. opc.tcp://<OPCUAIP>:<OPCUAPort>')
+    browse_parser.add_argument('--security', help='asyncua security string, e.g. Basic256Sha256,SignAndEncrypt,cert.der,key.pem')
+    browse_parser.add_argument('--concurrency', type=int, default=8)
+    browse_parser.add_argument('--cache', default=DEFAULT_CACHE)
+    evaluate_parser = subparsers.add_parser('evaluate', help='Evaluate rules against the cache and optionally emit them')
+    evaluate_parser.add_argument('--cache', default=DEFAULT_CACHE)
+    evaluate_parser.add_argument('--rules', help='Start from the rules of an emitted file')
+    evaluate_parser.add_argument('--include', dest='rule', action='append', type=lambda p: NodeFilterRule('INCLUDE', p), default=[])
+    evaluate_parser.add_argument('--exclude', dest='rule', action='append', type=lambda p: NodeFilterRule('EXCLUDE', p))
+    evaluate_parser.add_argument('--default-rate', type=float, default=DEFAULT_RATE, help='Updates per second of tags without a sampling interval')
+    evaluate_parser.add_argument('--emit', help='Write the validated rules to this file')
+    evaluate_parser.add_argument('--interactive', action='store_true', help='Add and drop rules at a prompt')
+    args = parser.parse_args()
+
+    if args.command == 'browse':
+        space = asyncio.run(browse(args.endpoint, args.security, args.concurrency))
+        space.save(args.cache)
+        print(f'Cached {space.root.tags} tags of {args.endpoint} in {args.cache}')
+        sys.exit(0)
+
+    space = AddressSpace.load(args.cache)
+    rules = []
+    if args.rules:
+        with open(args.rules) as f:
+            rules = [NodeFilterRule.from_rule(rule) for rule in json.load(f)]
+    rules += args.rule
+    if args.interactive:
+        interactive(space, rules, args.default_rate)
+        sys.exit(0)
+    print_evaluation(space.evaluate(rules, args.default_rate))
+    if args.emit:
+        try:
+            emit(space, rules, args.emit, args.default_rate)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
@@ -0,0 +1,198 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+import sys
+import json
+import heapq
+import argparse
+
+from iot_factory_cdk.stacks.sitewise_gateway.node_filters import AddressSpace, NodeFilterRule, outermost, DEFAULT_CACHE, DEFAULT_RATE
+from iot_factory_cdk.stacks.sitewise_gateway.collector_configuration import collector_configuration, read_property_groups
+
+DEFAULT_GATEWAY = 'default'
+PARTITIONS_FILE = 'partitions.json'
+# Units per gateway the address space is split into before packing, more units balance better but need more rules
+DEFAULT_GRANULARITY = 4
+DEFAULT_MAX_RULES = 100
+
+
+# Disjoint share of the address space collected by one gateway.
+class Partition:
+
+    def __init__(self, name: str):
+        self.name = name
+        self.units = []
+        self.load = 0.0
+        self.tags = 0
+
+    def rules(self, excludes: list) -> list:
+        return [NodeFilterRule('INCLUDE', unit.path()) for unit in self.units] + excludes
+
+
+# Splits the selected address space into subtrees and packs them onto gateways by estimated updates per second.
+# @summary Rate weighted partitioning of one OPC UA server across several gateways.
+class PartitionPlanner:
+
+    # @param {AddressSpace} space - address space cached by node_filters.py browse.
+    # @param {list} scope_rules - NodeFilterRule list limiting what is collected at all, None for everything.
+    # @param {float} default_rate - updates per second of tags without a sampling interval.
+    def __init__(self, space: AddressSpace, scope_rules: list = None, default_rate: float = DEFAULT_RATE):
+        self.space = space
+        self.default_rate = default_rate
+        scope_rules = scope_rules or []
+        self.excludes = [rule for rule in scope_rules if rule.action == 'EXCLUDE']
+        self.excluded = {id(node) for rule in self.excludes for node in space.match(rule)}
+
+        includes = [node for rule in scope_rules if rule.action == 'INCLUDE' for node in space.match(rule)]
+        self.roots = outermost(includes) if includes else [space.root]
+
+        # Load of every branch above an excluded subtree, subtracted from the aggregates of that branch
+        self.excluded_tags, self.excluded_load = {}, {}
+        for node in outermost([n for rule in self.excludes for n in space.match(rule)]):
+            tags, load = node.tags, self._aggregate_load(node)
+            parent = node.parent
+            while parent is not None:
+                self.excluded_tags[id(parent)] = self.excluded_tags.get(id(parent), 0) + tags
+                self.excluded_load[id(parent)] = self.excluded_load.get(id(parent), 0.0) + load
+                parent = parent.parent
+
+    def _aggregate_load(self, node) -> float:
+        return node.known_rate + node.unknown_rate * self.default_rate
+
+    def _is_excluded(self, node) -> bool:
+        while node is not None:
+            if id(node) in self.excluded:
+                return True
+            node = node.parent
+        return False
+
+    def load(self, node) -> float:
+        return self._aggregate_load(node) - self.excluded_load.get(id(node), 0.0)
+
+    def tags(self, node) -> int:
+        return node.tags - self.excluded_tags.get(id(node), 0)
+
+    def units(self, target: float) -> list:
+        """Split the heaviest subtrees into their children until none is above target or it is a single tag"""
+        heap, units, counter = [], [], 0
+        for root in self.roots:
+            if not self._is_excluded(root) and self.tags(root):
+                heap.append((-self.load(root), counter, root))
+                counter += 1
+        heapq.heapify(heap)
+        while heap:
+            load, _, node = heapq.heappop(heap)
+            children = [c for c in node.children.values() if id(c) not in self.excluded and self.tags(c)]
+            if -load <= target or not children:
+                units.append(node)
+                continue
+            if node.rate is not None and node.rate >= 0:
+                # A variable with child variables is collected as one unit
+                units.append(node)
+                continue
+            for child in children:
+                heapq.heappush(heap, (-self.load(child), counter, child))
+                counter += 1
+        return units
+
+    # @summary Longest processing time first packing of the units onto the gateways.
+    # @param {list} gateway_names - one partition per gateway, in this order.
+    # @param {int} granularity - units per gateway to aim for.
+    def plan(self, gateway_names: list, granularity: int = DEFAULT_GRANULARITY) -> list:
+        if not gateway_names:
+            raise ValueError('At least one gateway is required')
+        total = sum(self.load(root) for root in self.roots if not self._is_excluded(root))
+        partitions = [Partition(name) for name in gateway_names]
+        heap = [(0.0, i) for i in range(len(partitions))]
+        units = self.units(total / (len(partitions) * granularity))
+        for unit in sorted(units, key=self.load, reverse=True):
+            load, i = heapq.heappop(heap)
+            partition = partitions[i]
+            partition.units.append(unit)
+            partition.load += self.load(unit)
+            partition.tags += self.tags(unit)
+            heapq.heappush(heap, (partition.load, i))
+        empty = [p.name for p in partitions if not p.units]
+        if empty:
+            # A collector without INCLUDE rules would subscribe to the whole server
+            raise ValueError(f'Gateways {empty} got no tags, the address space has fewer branches than gateways')
+        return partitions
+
+
+# @summary Write partitions.json for the stack (GatewayPartitionsFile in env.sh) and one collector configuration per gateway.
+def write_partitions(partitions: list, excludes: list, out_dir: str, endpoint_uri: str, property_groups: list = None):
+    os.makedirs(out_dir, exist_ok=True)
+    gateways = []
+    for partition in partitions:
+        rules = partition.rules(excludes)
+        gateways.append({
+            'name': partition.name,
+            'tags': partition.tags,
+            'updates_per_second': partition.load,
+            'nodeFilterRules': [rule.to_rule() for rule in rules],
+        })
+        with open(os.path.join(out_dir, f'{partition.name}.json'), 'w') as f:
+            json.dump(collector_configuration(endpoint_uri, rules, property_groups), f, indent=2)
+    with open(os.path.join(out_dir, PARTITIONS_FILE), 'w') as f:
+        json.dump({'gateways': gateways}, f, indent=2)
+
+
+# Returns (gateway name, NodeFilterRule list) pairs of a partitions.json file
+def read_partitions(file: str) -> list:
+    with open(file) as f:
+        gateways = json.load(f)['gateways']
+    return [(g['name'], [NodeFilterRule.from_rule(rule) for rule in g['nodeFilterRules']]) for g in gateways]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Partition the tags of one OPC UA server across gateways by estimated load')
+    parser.add_argument('--cache', default=DEFAULT_CACHE, help='Address space cached by node_filters.py browse')
+    parser.add_argument('--rules', help='nodeFilterRules emitted by node_filters.py limiting the tags to collect')
+    parser.add_argument('--gateways', default=DEFAULT_GATEWAY, help='Comma separated gateway names, default and the names of the fleet file')
+    parser.add_argument('--granularity', type=int, default=DEFAULT_GRANULARITY, help='Units per gateway to pack')
+    parser.add_argument('--default-rate', type=float, default=DEFAULT_RATE, help='Updates per second of tags without a sampling interval')
+    parser.add_argument('--max-rules', type=int, default=DEFAULT_MAX_RULES, help='Warn about gateways with more rules')
+    parser.add_argument('--endpoint', default=f'opc.tcp://{os.getenv("OPCUAIP")}:{os.getenv("OPCUAPort")}', help='OPC UA endpoint of the collector configurations')
+    parser.add_argument('--property-groups', help='propertyGroups JSON file added to every collector configuration')
+    parser.add_argument('--out-dir', default='partitions')
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.gateways.split(',') if name.strip()]
+    if len(set(names)) != len(names):
+        print(f'Duplicate gateway names in {args.gateways}')
+        sys.exit(1)
+    scope_rules = None
+    if args.rules:
+        with open(args.rules) as f:
+            scope_rules = [NodeFilterRule.from_rule(rule) for rule in json.load(f)]
+
+    planner = PartitionPlanner(AddressSpace.load(args.cache), scope_rules, args.default_rate)
+    partitions = planner.plan(names, args.granularity)
+    mean = sum(p.load for p in partitions) / len(partitions)
+    print(f"{'gateway':<24} {'rules':>6} {'tags':>10} {'updates/s':>12} {'share':>7}")
+    for partition in partitions:
+        share = partition.load / (mean * len(partitions)) if mean else 0
+        print(f'{partition.name:<24} {len(partition.units):>6} {partition.tags:>10} {partition.load:>12,.1f} {share:>7.1%}')
+        if len(partition.units) > args.max_rules:
+            print(f'{partition.name} needs {len(partition.units)} rules, lower --granularity or group tags in folders')
+        unsafe = [unit.path() for unit in partition.units if any(c in unit.name for c in '*?[')]
+        if unsafe:
+            print(f'{partition.name}: browse names with wildcard characters match more than the planned node: {unsafe}')
+    print(f'Imbalance (max / mean load): {max(p.load for p in partitions) / mean if mean else 1:.3f}')
+    property_groups = read_property_groups(args.property_groups) if args.property_groups else None
+    write_partitions(partitions, planner.excludes, args.out_dir, args.endpoint, property_groups)
+    print(f'Wrote {os.path.join(args.out_dir, PARTITIONS_FILE)} and one collector configuration per gateway')
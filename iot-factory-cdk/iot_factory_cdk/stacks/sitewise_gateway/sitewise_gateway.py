@@ -22,39 +22,37 @@ from aws_cdk import (
 )
 from constructs import Construct
 
+from iot_factory_cdk.stacks.sitewise_gateway.collector_configuration import collector_configuration, COLLECTOR_NAMESPACE
+
 
 class SitewiseGateway(Construct):
 
-    def __init__(self, scope: Construct, id: str, env: str, stack_name: str, thing_name: str, kepserver_ip: str, kepserver_port: str, app_name: str, cost_center: str, **kwargs) -> None:
+    # @param {list} node_filter_rules - NodeFilterRule list compiled with node_filters.py, None to collect the whole address space.
+    # @param {list} property_groups - PropertyGroup list with scan mode, sampling rate and deadband per browse path.
+    # @param {string} destination_stream - StreamManager stream the collector writes to, None for the publisher stream.
+    # @param {string} gateway_name - SiteWise gateway name, defaults to <stack>GreenGrassCore-Gateway-<env>.
+    def __init__(self, scope: Construct, id: str, env: str, stack_name: str, thing_name: str, kepserver_ip: str, kepserver_port: str, app_name: str, cost_center: str, node_filter_rules: list = None, property_groups: list = None, destination_stream: str = None, gateway_name: str = None, **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
         # print(f"Input IP and Port {kepserver_ip} and {kepserver_port} and env {env}")
         # ============================================================= #
         # =============  SiteWise Gateway Infrastructure  ============= #
         # ============================================================= #        
         sitewise.CfnGateway(self, 'SitewiseGateway',
-            gateway_name = f'{stack_name}GreenGrassCore-Gateway-{env}',
+            gateway_name = gateway_name or f'{stack_name}GreenGrassCore-Gateway-{env}',
 	        gateway_platform = sitewise.CfnGateway.GatewayPlatformProperty(
                 greengrass_v2 = sitewise.CfnGateway.GreengrassV2Property(
                     core_device_thing_name = thing_name
                 )
             ),
             gateway_capability_summaries=[sitewise.CfnGateway.GatewayCapabilitySummaryProperty(
-                capability_namespace = 'iotsitewise:opcuacollector:2',
+                capability_namespace = COLLECTOR_NAMESPACE,
                 capability_configuration = json.dumps(
-                        {
-                            'sources': [{
-                                'name': 'OPC-UA Server',
-                                'endpoint': {
-                                    'certificateTrust': { 'type': 'TrustAny' },
-                                    'endpointUri': 'opc.tcp://{}:{}'.format(kepserver_ip, kepserver_port),
-                                    'securityPolicy': 'BASIC256_SHA256',
-                                    'messageSecurityMode': 'SIGN_AND_ENCRYPT',
-                                    'identityProvider':{'type':'Anonymous'},
-                                    'nodeFilterRules':[]
-                                },
-                                'measurementDataStreamPrefix': ''
-                            }]
-                        }
+                        collector_configuration(
+                            'opc.tcp://{}:{}'.format(kepserver_ip, kepserver_port),
+                            node_filter_rules = node_filter_rules,
+                            property_groups = property_groups,
+                            destination_stream = destination_stream
+                        )
                     )
                 ),
                 sitewise.CfnGateway.GatewayCapabilitySummaryProperty(
@@ -0,0 +1,65 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Segment encoding of the outage buffer component (assets/outage_buffer.py).
+
+    python3 -m unittest discover -s tests
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "iot_factory_cdk/stacks/outage_buffer/assets"))
+from outage_buffer import Segment, decode  # noqa: E402
+
+
+def entry(alias: str, *values) -> dict:
+    return {
+        "entryId": alias,
+        "propertyAlias": alias,
+        "propertyValues": [
+            {"value": value, "timestamp": {"timeInSeconds": 1700000000 + i, "offsetInNanos": 0}, "quality": "GOOD"}
+            for i, value in enumerate(values)
+        ],
+    }
+
+
+class SegmentTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        segment = Segment()
+        malformed = segment.add([
+            entry("/line1/temperature", {"doubleValue": 21.5}, {"doubleValue": 22}),
+            entry("/line1/count", {"integerValue": 7}),
+            entry("/line1/running", {"booleanValue": True}),
+            entry("/line1/state", {"stringValue": "IDLE"}),
+        ])
+        self.assertEqual(malformed, 0)
+        self.assertEqual(segment.points, 5)
+        series = {alias: values for alias, _, _, values, _ in decode(segment.encode())}
+        self.assertEqual(series, {
+            "/line1/temperature": [21.5, 22.0],
+            "/line1/count": [7],
+            "/line1/running": [True],
+            "/line1/state": ["IDLE"],
+        })
+
+    def test_malformed_values_leave_the_segment_encodable(self):
+        segment = Segment()
+        malformed = segment.add([
+            entry("/line1/count", {"integerValue": 1}, {"integerValue": 2 ** 70}),
+            entry("/line1/temperature", {"doubleValue": "hot"}),
+            entry("/line1/state", {"stringValue": 3}),
+            {"propertyAlias": "/line1/late", "propertyValues": [{"value": {"doubleValue": 1.0}, "timestamp": {"timeInSeconds": 2 ** 62}}]},
+            entry("/line1/count", {"integerValue": 3}),
+        ])
+        self.assertEqual(malformed, 4)
+        self.assertEqual(segment.points, 2)
+        series = [(alias, timestamps, values) for alias, _, timestamps, values, _ in decode(segment.encode())]
+        self.assertEqual(series, [("/line1/count", [1700000000 * 10**9, 1700000000 * 10**9], [1, 3])])
+
+
+if __name__ == "__main__":
+    unittest.main()
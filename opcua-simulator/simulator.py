@@ -0,0 +1,226 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+OPC UA load simulator, a local replacement for the Ignition instance of
+OPCUAInstanceStack.
+
+The namespace is Simulation/Line<l>/Machine<m>/Tag<t>, sized with --lines,
+--machines and --tags (per machine), from a few tags to millions. Every tag
+gets an update rate tier and a value pattern from weighted mixes:
+
+    --rates 10:0.1,1:0.9                      10% of the tags change 10 times a second, 90% once a second
+    --patterns sine:0.5,random:0.3,ramp:0.1,step:0.05,counter:0.05
+
+The assignment is deterministic for a given --seed, so runs are comparable.
+The server offers None and Basic256Sha256 SignAndEncrypt security with a self
+signed certificate created on first start, and anonymous access, which
+matches the SitewiseGateway source configuration. The achieved updates per
+second and the scheduling lag are printed every --report-interval seconds.
+
+asyncua is only needed to serve, the namespace and patterns can be used
+without it:
+
+    pip3 install -r requirements.txt
+    python3 simulator.py --lines 10 --machines 10 --tags 100 --rates 1:1
+"""
+
+import sys
+import math
+import time
+import random
+import asyncio
+import argparse
+from pathlib import Path
+from datetime import datetime
+
+PATTERNS = ["sine", "random", "ramp", "step", "counter"]
+DEFAULT_PORT = 4840
+NAMESPACE_URI = "urn:sitewise:opcua-simulator"
+
+
+def parse_mix(mix: str, convert=str) -> list:
+    """Parse 'key:weight,key:weight' into [(key, weight)] with weights summing to 1"""
+    pairs = []
+    for item in mix.split(","):
+        key, _, weight = item.partition(":")
+        pairs.append((convert(key), float(weight or 1)))
+    total = sum(weight for _, weight in pairs)
+    if total <= 0:
+        raise ValueError(f"Weights of '{mix}' must be positive")
+    return [(key, weight / total) for key, weight in pairs]
+
+
+def assign(count: int, mix: list, rng: random.Random) -> list:
+    """Assign one key of the mix to each of count items in proportion to the weights"""
+    keys = []
+    for key, weight in mix:
+        keys += [key] * int(round(weight * count))
+    keys = (keys + [mix[-1][0]] * count)[:count]
+    rng.shuffle(keys)
+    return keys
+
+
+class Tag:
+    __slots__ = ("path", "pattern", "rate", "period", "phase", "amplitude", "offset", "value", "node")
+
+    def __init__(self, path: str, pattern: str, rate: float, rng: random.Random):
+        self.path = path
+        self.pattern = pattern
+        self.rate = rate
+        self.period = rng.uniform(10, 600)
+        self.phase = rng.uniform(0, 2 * math.pi)
+        self.amplitude = rng.uniform(1, 100)
+        self.offset = rng.uniform(0, 1000)
+        self.value = self.offset
+        self.node = None
+
+    def next_value(self, now: float, rng: random.Random) -> float:
+        if self.pattern == "sine":
+            self.value = self.offset + self.amplitude * math.sin(2 * math.pi * now / self.period + self.phase)
+        elif self.pattern == "random":
+            # Random walk, bounded around the offset
+            self.value += rng.gauss(0, self.amplitude / 50)
+            self.value = min(max(self.value, self.offset - self.amplitude), self.offset + self.amplitude)
+        elif self.pattern == "ramp":
+            self.value = self.offset + self.amplitude * ((now / self.period + self.phase) % 1.0)
+        elif self.pattern == "step":
+            self.value = self.offset + self.amplitude * (int(now / self.period * 4 + self.phase) % 2)
+        elif self.pattern == "counter":
+            self.value += 1
+        return self.value
+
+
+def build_namespace(lines: int, machines: int, tags: int, rates: list, patterns: list, seed: int) -> list:
+    rng = random.Random(seed)
+    count = lines * machines * tags
+    tag_rates = assign(count, rates, rng)
+    tag_patterns = assign(count, patterns, rng)
+    namespace = []
+    for index in range(count):
+        line, rest = divmod(index, machines * tags)
+        machine, tag = divmod(rest, tags)
+        path = f"Line{line + 1}/Machine{machine + 1}/Tag{tag + 1}"
+        namespace.append(Tag(path, tag_patterns[index], tag_rates[index], rng))
+    return namespace
+
+
+async def create_nodes(server, namespace: list, lines: int, machines: int):
+    from asyncua import ua
+
+    idx = await server.register_namespace(NAMESPACE_URI)
+    root = await server.nodes.objects.add_folder(idx, "Simulation")
+    folders = {}
+    for line in range(1, lines + 1):
+        line_folder = await root.add_folder(idx, f"Line{line}")
+        for machine in range(1, machines + 1):
+            folders[f"Line{line}/Machine{machine}"] = await line_folder.add_folder(idx, f"Machine{machine}")
+    for n, tag in enumerate(namespace):
+        folder, _, name = tag.path.rpartition("/")
+        # String node ids keep the tag path visible to the collector and in nodeFilterRules
+        tag.node = await folders[folder].add_variable(
+            ua.NodeId(f"Simulation/{tag.path}", idx), name, ua.Variant(tag.value, ua.VariantType.Double)
+        )
+        if n and n % 100000 == 0:
+            print(f"Created {n} of {len(namespace)} tags", flush=True)
+
+
+async def update_loop(server, namespace: list, seed: int, report_interval: float):
+    from asyncua import ua
+
+    rng = random.Random(seed)
+    tiers = {}
+    for tag in namespace:
+        tiers.setdefault(tag.rate, []).append(tag)
+    due = {rate: time.monotonic() for rate in tiers}
+    updates, max_lag, report_at = 0, 0.0, time.monotonic() + report_interval
+
+    while True:
+        rate = min(due, key=due.get)
+        delay = due[rate] - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        max_lag = max(max_lag, -delay)
+        now = time.time()
+        # Source timestamp of the pass, the benchmarks measure latency from it
+        stamp = datetime.utcnow()
+        for n, tag in enumerate(tiers[rate]):
+            # write_attribute_value skips the checks of a client write, much faster for large namespaces
+            await server.write_attribute_value(
+                tag.node.nodeid,
+                ua.DataValue(ua.Variant(tag.next_value(now, rng), ua.VariantType.Double), SourceTimestamp=stamp),
+            )
+            if n % 10000 == 9999:
+                # Let the server answer clients during long update passes
+                await asyncio.sleep(0)
+        updates += len(tiers[rate])
+        due[rate] += 1.0 / rate
+        if due[rate] < time.monotonic():
+            # Fell behind a full period, skip the missed updates rather than bursting
+            due[rate] = time.monotonic()
+
+        if time.monotonic() >= report_at:
+            print(f"{updates / report_interval:,.0f} updates/s, max lag {max_lag * 1000:.0f} ms", flush=True)
+            updates, max_lag, report_at = 0, 0.0, time.monotonic() + report_interval
+
+
+async def serve(args, namespace: list):
+    try:
+        from asyncua import Server, ua
+        from asyncua.crypto.cert_gen import setup_self_signed_certificate
+        from cryptography.x509.oid import ExtendedKeyUsageOID
+    except ImportError:
+        print("asyncua is required to run the simulator, pip3 install -r requirements.txt")
+        sys.exit(1)
+
+    server = Server()
+    await server.init()
+    server.set_endpoint(f"opc.tcp://0.0.0.0:{args.port}/")
+    server.set_server_name("SiteWise OPC UA Simulator")
+    await server.set_application_uri(NAMESPACE_URI)
+    server.set_security_policy([
+        ua.SecurityPolicyType.NoSecurity,
+        ua.SecurityPolicyType.Basic256Sha256_SignAndEncrypt,
+    ])
+    cert_dir = Path(args.cert_dir)
+    cert_dir.mkdir(parents=True, exist_ok=True)
+    certificate, private_key = cert_dir / "server-certificate.der", cert_dir / "server-private-key.pem"
+    await setup_self_signed_certificate(
+        private_key, certificate, NAMESPACE_URI, "opcua-simulator",
+        [ExtendedKeyUsageOID.CLIENT_AUTH, ExtendedKeyUsageOID.SERVER_AUTH], {"commonName": "opcua-simulator"},
+    )
+    await server.load_certificate(str(certificate))
+    await server.load_private_key(str(private_key))
+
+    started = time.monotonic()
+    await create_nodes(server, namespace, args.lines, args.machines)
+    print(f"Created {len(namespace)} tags in {time.monotonic() - started:.1f}s", flush=True)
+    async with server:
+        print(f"Serving opc.tcp://0.0.0.0:{args.port}/", flush=True)
+        await update_loop(server, namespace, args.seed, args.report_interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OPC UA server with a configurable simulated namespace")
+    parser.add_argument("--lines", type=int, default=2, help="Line folders")
+    parser.add_argument("--machines", type=int, default=2, help="Machine folders per line")
+    parser.add_argument("--tags", type=int, default=10, help="Tags per machine")
+    parser.add_argument("--rates", default="1:1", help="Update rate tiers in Hz with weights, e.g. 10:0.1,1:0.9")
+    parser.add_argument("--patterns", default="sine:1", help=f"Value patterns with weights, of {PATTERNS}")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the tag assignment and random values")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="OPC UA port")
+    parser.add_argument("--cert-dir", default="./certs", help="Directory of the server certificate and key")
+    parser.add_argument("--report-interval", type=float, default=10, help="Seconds between throughput reports")
+    args = parser.parse_args()
+
+    rates = parse_mix(args.rates, float)
+    patterns = parse_mix(args.patterns)
+    unknown = [p for p, _ in patterns if p not in PATTERNS]
+    if unknown or any(rate <= 0 for rate, _ in rates):
+        print(f"Unknown patterns {unknown} or non positive rates in {args.rates}")
+        sys.exit(1)
+
+    namespace = build_namespace(args.lines, args.machines, args.tags, rates, patterns, args.seed)
+    expected = sum(tag.rate for tag in namespace)
+    print(f"{len(namespace)} tags, {expected:,.0f} updates/s expected", flush=True)
+    asyncio.run(serve(args, namespace))
@@ -0,0 +1,237 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Local stand-in for the S3 object API, for the bulk import path of backfill.py.
+
+Serves path style requests (http://host:port/<bucket>/<key>) from a directory,
+one sub directory per bucket, without checking signatures. Enough of the API
+for boto3 upload_file (with multipart uploads) / put_object / get_object /
+head_object / delete_object / list_objects_v2 and create_bucket, and for the
+SiteWise stand-in reading bulk import files and writing error reports with plain
+GET and PUT. Bodies sent with aws-chunked content encoding are decoded.
+
+    python3 s3_standin.py --root /tmp/s3 --port 9000 --bucket backfill
+    aws --endpoint-url http://localhost:9000 s3 ls s3://backfill/
+"""
+
+import os
+import re
+import time
+import uuid
+import shutil
+import hashlib
+import argparse
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs, unquote
+from xml.sax.saxutils import escape
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+DEFAULT_PORT = 9000
+MAX_KEYS = 1000
+# Parts of multipart uploads in progress, outside the bucket directories
+UPLOADS_DIR = ".uploads"
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>'
+
+
+def decode_aws_chunked(body: bytes) -> bytes:
+    """Payload of an aws-chunked body: <hex size>[;chunk-signature=...]\\r\\n<data>\\r\\n ... 0\\r\\n<trailers>"""
+    data, offset = [], 0
+    while True:
+        end = body.index(b"\r\n", offset)
+        size = int(body[offset:end].split(b";")[0], 16)
+        if size == 0:
+            return b"".join(data)
+        data.append(body[end + 2:end + 2 + size])
+        offset = end + 2 + size + 2
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_handler(root: Path):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _target(self):
+            url = urlparse(self.path)
+            bucket, _, key = unquote(url.path).lstrip("/").partition("/")
+            path = (root / bucket / key).resolve() if key else None
+            if path is not None and root.resolve() / bucket not in path.parents:
+                return url, bucket, key, None
+            return url, bucket, key, path
+
+        def _body(self) -> bytes:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if "aws-chunked" in self.headers.get("Content-Encoding", "") or \
+                    self.headers.get("x-amz-content-sha256", "").startswith("STREAMING-"):
+                body = decode_aws_chunked(body)
+            return body
+
+        def _upload_dir(self, query: dict) -> Path:
+            upload_id = query.get("uploadId", [""])[0]
+            return root / UPLOADS_DIR / upload_id if re.fullmatch(r"[0-9a-f]{32}", upload_id) else None
+
+        def do_POST(self):
+            url, bucket, key, path = self._target()
+            query = parse_qs(url.query, keep_blank_values=True)
+            self._body()
+            if path is None:
+                self._error(400, "InvalidArgument", "Invalid key")
+            elif "uploads" in query:
+                upload_id = uuid.uuid4().hex
+                (root / UPLOADS_DIR / upload_id).mkdir(parents=True)
+                self._reply(200, (
+                    f"{XML_HEADER}<InitiateMultipartUploadResult><Bucket>{escape(bucket)}</Bucket>"
+                    f"<Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+                ).encode(), content_type="application/xml")
+            elif self._upload_dir(query) is not None and self._upload_dir(query).is_dir():
+                # Complete: the parts in part number order make the object
+                upload = self._upload_dir(query)
+                parts = sorted(upload.iterdir(), key=lambda p: int(p.name))
+                body = b"".join(p.read_bytes() for p in parts)
+                self._write(path, body)
+                shutil.rmtree(upload)
+                self._reply(200, (
+                    f"{XML_HEADER}<CompleteMultipartUploadResult><Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>"
+                    f"<ETag>\"{hashlib.md5(body).hexdigest()}-{len(parts)}\"</ETag></CompleteMultipartUploadResult>"
+                ).encode(), content_type="application/xml")
+            else:
+                self._error(404, "NoSuchUpload", "No such upload")
+
+        def _write(self, path: Path, body: bytes):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_bytes(body)
+            os.replace(tmp, path)
+
+        def do_PUT(self):
+            url, bucket, key, path = self._target()
+            query = parse_qs(url.query)
+            body = self._body()
+            if not key:
+                (root / bucket).mkdir(parents=True, exist_ok=True)
+                self._reply(200, b"")
+                return
+            if path is None:
+                self._error(400, "InvalidArgument", "Invalid key")
+                return
+            if not (root / bucket).is_dir():
+                self._error(404, "NoSuchBucket", f"Bucket {bucket} does not exist")
+                return
+            if "partNumber" in query:
+                upload = self._upload_dir(query)
+                if upload is None or not upload.is_dir():
+                    self._error(404, "NoSuchUpload", "No such upload")
+                    return
+                (upload / str(int(query["partNumber"][0]))).write_bytes(body)
+            else:
+                self._write(path, body)
+            self._reply(200, b"", {"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+
+        def do_GET(self):
+            url, bucket, key, path = self._target()
+            if not key:
+                self._list(bucket, parse_qs(url.query))
+            elif path is None or not path.is_file():
+                self._error(404, "NoSuchKey", f"No such key {key}")
+            else:
+                body = path.read_bytes()
+                self._reply(200, body, self._object_headers(path, body), "application/octet-stream")
+
+        def do_HEAD(self):
+            url, bucket, key, path = self._target()
+            if not key:
+                self._reply(200 if (root / bucket).is_dir() else 404, b"")
+            elif path is None or not path.is_file():
+                self._reply(404, b"")
+            else:
+                body = path.read_bytes()
+                self.send_response(200)
+                for name, value in self._object_headers(path, body).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+
+        def do_DELETE(self):
+            url, bucket, key, path = self._target()
+            upload = self._upload_dir(parse_qs(url.query))
+            if upload is not None and upload.is_dir():
+                shutil.rmtree(upload)
+            elif path is not None and path.is_file():
+                path.unlink()
+            self._reply(204, b"")
+
+        def _list(self, bucket: str, query: dict):
+            if not (root / bucket).is_dir():
+                self._error(404, "NoSuchBucket", f"Bucket {bucket} does not exist")
+                return
+            prefix = query.get("prefix", [""])[0]
+            start_after = query.get("continuation-token", query.get("start-after", [""]))[0]
+            max_keys = min(int(query.get("max-keys", [MAX_KEYS])[0]), MAX_KEYS)
+            keys = sorted(
+                str(p.relative_to(root / bucket)) for p in (root / bucket).rglob("*")
+                if p.is_file() and not p.name.endswith(".tmp")
+            )
+            keys = [k for k in keys if k.startswith(prefix) and k > start_after]
+            page, truncated = keys[:max_keys], len(keys) > max_keys
+            contents = "".join(
+                f"<Contents><Key>{escape(k)}</Key><Size>{(root / bucket / k).stat().st_size}</Size>"
+                f"<LastModified>{time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime((root / bucket / k).stat().st_mtime))}</LastModified>"
+                f"<StorageClass>STANDARD</StorageClass></Contents>"
+                for k in page
+            )
+            token = f"<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>" if truncated else ""
+            body = (
+                f"{XML_HEADER}"
+                '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+                f"<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix><KeyCount>{len(page)}</KeyCount>"
+                f"<MaxKeys>{max_keys}</MaxKeys><IsTruncated>{'true' if truncated else 'false'}</IsTruncated>"
+                f"{contents}{token}</ListBucketResult>"
+            ).encode()
+            self._reply(200, body, content_type="application/xml")
+
+        def _object_headers(self, path: Path, body: bytes) -> dict:
+            return {
+                "ETag": f'"{hashlib.md5(body).hexdigest()}"',
+                "Last-Modified": time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(path.stat().st_mtime)),
+            }
+
+        def _error(self, status: int, code: str, message: str):
+            body = (
+                f"{XML_HEADER}<Error><Code>{code}</Code>"
+                f"<Message>{escape(message)}</Message></Error>"
+            ).encode()
+            self._reply(status, body, content_type="application/xml")
+
+        def _reply(self, status: int, body: bytes, headers: dict = None, content_type: str = None):
+            self.send_response(status)
+            if content_type:
+                self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the S3 object API")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--root", default="s3-standin", help="Directory holding one sub directory per bucket")
+    parser.add_argument("--bucket", action="append", default=[], help="Bucket created at start, repeatable")
+    args = parser.parse_args()
+
+    root = Path(args.root)
+    for bucket in args.bucket:
+        (root / bucket).mkdir(parents=True, exist_ok=True)
+    server = ThreadingHTTPServer(("", args.port), make_handler(root))
+    print(f"S3 stand-in listening on port {args.port}, buckets in {root.resolve()}", flush=True)
+    server.serve_forever()
@@ -0,0 +1,557 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Local stand-in for the AWS IoT SiteWise data plane ingestion API.
+
+Answers BatchPutAssetPropertyValue (POST /properties) like the service, without
+checking the signature: at most 10 entries of at most 10 values per request,
+errors as the x-amzn-ErrorType header with a JSON message. Every received
+property value is stored with its arrival time and its latency from the value
+timestamp in SQLite, indexed by alias and timestamp and by arrival time.
+Requests are served over TLS with a certificate for the data endpoint host
+name, so a gateway on the same docker network resolves the endpoint to this
+server through a network alias and trusts it through EXTRA_CA_FILE.
+
+The service behaviour is configurable at start and at runtime, to tune the
+publisher batching and backlog drain offline:
+
+    latency_ms, jitter_ms    delay added to every response
+    max_requests_per_second  token bucket, requests above it get ThrottlingException (429)
+    error_rate               share of requests failing with InternalFailureException (500)
+    entry_error_rate         share of entries returned in errorEntries
+
+    GET  /stats?since=<epoch seconds>             points, points per second, latency percentiles and histograms
+    GET  /points?alias=<alias>&since=&until=      stored values of one property alias
+    POST /config                                  JSON with any of the settings above
+    POST /reset                                   forget stored points and histograms
+
+Bulk import jobs are answered too, for backfill.py: CreateBulkImportJob
+(POST /jobs) reads the CSV or Parquet files from the S3 stand-in at
+--s3-endpoint, stores the rows of the known time series and writes rejected
+rows as an error report next to them, DescribeBulkImportJob (GET /jobs/<id>)
+reports the job status. DescribeTimeSeries (GET /timeseries/describe/?alias=)
+knows the property aliases of the SiteWiseAsset stack, or those of --model.
+Bulk imported values have no latency, they are left out of the percentiles.
+
+    python3 standin.py --cert server.pem --key server.key --port 443 --latency-ms 50 --max-requests-per-second 20
+    python3 standin.py --port 8080 --s3-endpoint http://localhost:9000
+"""
+
+import io
+import ssl
+import csv
+import json
+import time
+import uuid
+import random
+import sqlite3
+import argparse
+import threading
+import urllib.request
+from urllib.parse import urlparse, parse_qs, quote
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+DEFAULT_PORT = 443
+MAX_ENTRIES = 10
+MAX_VALUES_PER_ENTRY = 10
+ENTRY_ERROR_CODES = ["InternalFailureException", "ThrottlingException", "TimestampOutOfRangeException"]
+
+# Upper bounds of the histogram buckets, the last bucket is open ended
+BATCH_ENTRIES_BUCKETS = list(range(1, MAX_ENTRIES + 1))
+BATCH_VALUES_BUCKETS = [1, 2, 5, 10, 20, 50, 100]
+REQUEST_RATE_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+# Property aliases of the SiteWiseAsset stack (iot-factory-cdk sitewise_asset_hierarchy.py) and their data types
+SITEWISE_ASSET_MODEL = {
+    f"line1/stampingpress{press}/{measurement}": "DOUBLE"
+    for press in (1, 2) for measurement in ("temperature", "pressure")
+}
+VALUE_FIELDS = {"DOUBLE": "doubleValue", "INTEGER": "integerValue", "BOOLEAN": "booleanValue", "STRING": "stringValue"}
+QUALITIES = ["GOOD", "BAD", "UNCERTAIN"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS points (
+    alias TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    arrival REAL NOT NULL,
+    -- NULL for bulk imported values
+    latency REAL,
+    value TEXT,
+    quality TEXT
+);
+CREATE INDEX IF NOT EXISTS points_alias ON points (alias, timestamp);
+CREATE INDEX IF NOT EXISTS points_arrival ON points (arrival);
+"""
+
+
+def value_timestamp(property_value: dict) -> float:
+    timestamp = property_value.get("timestamp", {})
+    return timestamp.get("timeInSeconds", 0) + timestamp.get("offsetInNanos", 0) / 1e9
+
+
+class Histogram:
+    def __init__(self, bounds: list):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+
+    def add(self, value: float):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def to_dict(self) -> dict:
+        labels = [f"<={bound}" for bound in self.bounds] + [f">{self.bounds[-1]}"]
+        return dict(zip(labels, self.counts))
+
+
+class Behaviour:
+    """Latency, throttling and error injection settings"""
+
+    FIELDS = {"latency_ms": 0.0, "jitter_ms": 0.0, "max_requests_per_second": 0.0, "error_rate": 0.0, "entry_error_rate": 0.0}
+
+    def __init__(self, seed: int = None, **settings):
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+        for field, default in self.FIELDS.items():
+            setattr(self, field, default)
+        self.tokens = 0.0
+        self.refilled = time.monotonic()
+        self.update(settings)
+
+    def update(self, settings: dict):
+        unknown = set(settings) - set(self.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown settings {sorted(unknown)}")
+        with self.lock:
+            for field, value in settings.items():
+                if value is not None:
+                    setattr(self, field, float(value))
+            self.tokens = self.max_requests_per_second
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def delay(self) -> float:
+        with self.lock:
+            return max(0.0, self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+    def throttled(self) -> bool:
+        """Take a token from the bucket, True when none is left"""
+        with self.lock:
+            if self.max_requests_per_second <= 0:
+                return False
+            now = time.monotonic()
+            self.tokens = min(self.max_requests_per_second, self.tokens + (now - self.refilled) * self.max_requests_per_second)
+            self.refilled = now
+            if self.tokens < 1:
+                return True
+            self.tokens -= 1
+            return False
+
+    def request_fails(self) -> bool:
+        with self.lock:
+            return self.rng.random() < self.error_rate
+
+    def entry_error(self) -> str:
+        with self.lock:
+            return self.rng.choice(ENTRY_ERROR_CODES) if self.rng.random() < self.entry_error_rate else None
+
+
+class Store:
+    """Received property values in SQLite plus request histograms"""
+
+    def __init__(self, path: str = ":memory:"):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self._reset_histograms()
+
+    def _reset_histograms(self):
+        self.batch_entries = Histogram(BATCH_ENTRIES_BUCKETS)
+        self.batch_values = Histogram(BATCH_VALUES_BUCKETS)
+        self.request_rate = Histogram(REQUEST_RATE_BUCKETS)
+        self.second, self.requests_in_second = None, 0
+        self.requests, self.throttled, self.failed = 0, 0, 0
+        self.bulk_imported = 0
+
+    def count_request(self, outcome: str = None):
+        with self.lock:
+            second = int(time.time())
+            if second != self.second:
+                if self.second is not None:
+                    self.request_rate.add(self.requests_in_second)
+                self.second, self.requests_in_second = second, 0
+            self.requests_in_second += 1
+            self.requests += 1
+            if outcome == "throttled":
+                self.throttled += 1
+            elif outcome == "failed":
+                self.failed += 1
+
+    def record(self, entries: list, accepted: list, arrival: float):
+        """Store the values of the accepted entries, count the request size from all entries"""
+        rows = []
+        for entry in accepted:
+            for property_value in entry.get("propertyValues", []):
+                timestamp = value_timestamp(property_value)
+                rows.append((
+                    entry.get("propertyAlias") or f"{entry.get('assetId')}/{entry.get('propertyId')}",
+                    timestamp, arrival, arrival - timestamp,
+                    json.dumps(property_value.get("value")), property_value.get("quality", "GOOD"),
+                ))
+        with self.lock:
+            self.db.executemany("INSERT INTO points VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.db.commit()
+            self.batch_entries.add(len(entries))
+            self.batch_values.add(sum(len(entry.get("propertyValues", [])) for entry in entries))
+
+    def import_values(self, rows: list, arrival: float):
+        """Store (alias, timestamp, value dict, quality) rows of a bulk import job"""
+        with self.lock:
+            self.db.executemany(
+                "INSERT INTO points VALUES (?, ?, ?, NULL, ?, ?)",
+                [(alias, timestamp, arrival, json.dumps(value), quality) for alias, timestamp, value, quality in rows],
+            )
+            self.db.commit()
+            self.bulk_imported += len(rows)
+
+    def reset(self):
+        with self.lock:
+            self.db.execute("DELETE FROM points")
+            self.db.commit()
+            self._reset_histograms()
+
+    def _percentile(self, since: float, count: int, q: float) -> float:
+        row = self.db.execute(
+            "SELECT latency FROM points WHERE arrival >= ? AND latency IS NOT NULL ORDER BY latency LIMIT 1 OFFSET ?",
+            (since, min(count - 1, int(q / 100 * count))),
+        ).fetchone()
+        return row[0] if row else None
+
+    def stats(self, since: float = 0) -> dict:
+        with self.lock:
+            request_rate = Histogram(REQUEST_RATE_BUCKETS)
+            request_rate.counts = list(self.request_rate.counts)
+            if self.second is not None:
+                # Include the second in progress, short runs would show nothing otherwise
+                request_rate.add(self.requests_in_second)
+            count, measured, first = self.db.execute(
+                "SELECT COUNT(*), COUNT(latency), MIN(arrival) FROM points WHERE arrival >= ?", (since,)
+            ).fetchone()
+            stats = {
+                "points": count,
+                "points_per_second": count / max(time.time() - max(since, first), 1e-9) if count else 0,
+                "latency_p50_s": self._percentile(since, measured, 50) if measured else None,
+                "latency_p99_s": self._percentile(since, measured, 99) if measured else None,
+                "aliases": self.db.execute("SELECT COUNT(DISTINCT alias) FROM points WHERE arrival >= ?", (since,)).fetchone()[0],
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "failed": self.failed,
+                "bulk_imported": self.bulk_imported,
+                "histograms": {
+                    "entries_per_request": self.batch_entries.to_dict(),
+                    "values_per_request": self.batch_values.to_dict(),
+                    "requests_per_second": request_rate.to_dict(),
+                },
+            }
+        return stats
+
+    def points(self, alias: str, since: float, until: float) -> list:
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT timestamp, arrival, value, quality FROM points WHERE alias = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp",
+                (alias, since, until),
+            ).fetchall()
+        return [{"timestamp": t, "arrival": a, "value": json.loads(v), "quality": q} for t, a, v, q in rows]
+
+
+def validation_error(entries) -> str:
+    if not isinstance(entries, list) or not entries:
+        return "entries must be a non empty list"
+    if len(entries) > MAX_ENTRIES:
+        return f"At most {MAX_ENTRIES} entries per request, got {len(entries)}"
+    for entry in entries:
+        if not entry.get("entryId"):
+            return "Every entry needs an entryId"
+        if not entry.get("propertyAlias") and not (entry.get("assetId") and entry.get("propertyId")):
+            return f"Entry {entry['entryId']} needs a propertyAlias or an assetId and propertyId"
+        values = entry.get("propertyValues", [])
+        if not values or len(values) > MAX_VALUES_PER_ENTRY:
+            return f"Entry {entry['entryId']} needs 1 to {MAX_VALUES_PER_ENTRY} propertyValues, got {len(values)}"
+    return None
+
+
+def parse_row(row: dict, model: dict) -> tuple:
+    """(alias, timestamp, value dict, quality) of a bulk import row, ValueError with the reason when rejected"""
+    alias = row.get("ALIAS")
+    if alias not in model:
+        raise ValueError(f"No time series with alias {alias}")
+    data_type = row.get("DATA_TYPE") or model[alias]
+    if data_type != model[alias]:
+        raise ValueError(f"Data type {data_type} does not match {model[alias]} of {alias}")
+    seconds = int(row["TIMESTAMP_SECONDS"])
+    nanos = int(row.get("TIMESTAMP_NANO_OFFSET") or 0)
+    if not 0 <= nanos < 1000000000:
+        raise ValueError(f"Nano offset {nanos} out of range")
+    quality = row.get("QUALITY") or "GOOD"
+    if quality not in QUALITIES:
+        raise ValueError(f"Unknown quality {quality}")
+    value = row["VALUE"]
+    if data_type == "DOUBLE":
+        value = float(value)
+    elif data_type == "INTEGER":
+        value = int(value)
+    elif data_type == "BOOLEAN":
+        if str(value).lower() not in ("true", "false"):
+            raise ValueError(f"Not a boolean: {value}")
+        value = str(value).lower() == "true"
+    return alias, seconds + nanos / 1e9, {VALUE_FIELDS[data_type]: value}, quality
+
+
+class BulkImports:
+    """Bulk import jobs reading their files from the S3 stand-in, run one thread per job"""
+
+    def __init__(self, store: Store, s3_endpoint: str = None, model: dict = None):
+        self.store = store
+        self.s3_endpoint = s3_endpoint.rstrip("/") if s3_endpoint else None
+        self.model = model if model is not None else SITEWISE_ASSET_MODEL
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    def describe_time_series(self, alias: str) -> dict:
+        if alias not in self.model:
+            return None
+        ids = {name: str(uuid.uuid5(uuid.NAMESPACE_URL, f"{name}/{alias}")) for name in ("asset", "property", "series")}
+        return {
+            "alias": alias, "assetId": ids["asset"], "propertyId": ids["property"], "timeSeriesId": ids["series"],
+            "dataType": self.model[alias],
+            "timeSeriesArn": f"arn:aws:iotsitewise:local:000000000000:time-series/{ids['series']}",
+            "timeSeriesCreationDate": 0, "timeSeriesLastUpdateDate": 0,
+        }
+
+    def create(self, request: dict) -> dict:
+        for field in ("jobName", "jobRoleArn", "files", "errorReportLocation"):
+            if not request.get(field):
+                raise ValueError(f"{field} is required")
+        file_format = request.get("jobConfiguration", {}).get("fileFormat", {})
+        if "csv" not in file_format and "parquet" not in file_format:
+            raise ValueError("jobConfiguration.fileFormat needs csv or parquet")
+        if not self.s3_endpoint:
+            raise ValueError("The stand-in was started without --s3-endpoint")
+        now = time.time()
+        job = dict(request, jobId=str(uuid.uuid4()), jobStatus="PENDING", jobCreationDate=now, jobLastUpdateDate=now)
+        with self.lock:
+            self.jobs[job["jobId"]] = job
+        threading.Thread(target=self._run, args=(job,), daemon=True).start()
+        return {"jobId": job["jobId"], "jobName": job["jobName"], "jobStatus": job["jobStatus"]}
+
+    def describe(self, job_id: str) -> dict:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _status(self, job: dict, status: str):
+        with self.lock:
+            job["jobStatus"], job["jobLastUpdateDate"] = status, time.time()
+
+    def _url(self, bucket: str, key: str) -> str:
+        return f"{self.s3_endpoint}/{bucket}/{quote(key)}"
+
+    def _rows(self, data: bytes, file_format: dict):
+        if "csv" in file_format:
+            columns = file_format["csv"]["columnNames"]
+            for values in csv.reader(io.StringIO(data.decode())):
+                yield values, dict(zip(columns, values))
+        else:
+            import pyarrow.parquet as pq
+            for row in pq.read_table(io.BytesIO(data)).to_pylist():
+                yield list(row.values()), {name: value for name, value in row.items()}
+
+    def _run(self, job: dict):
+        self._status(job, "RUNNING")
+        file_format = job.get("jobConfiguration", {}).get("fileFormat", {})
+        rejected = []
+        try:
+            for file in job["files"]:
+                with urllib.request.urlopen(self._url(file["bucket"], file["key"]), timeout=60) as response:
+                    data = response.read()
+                rows = []
+                for values, row in self._rows(data, file_format):
+                    try:
+                        rows.append(parse_row(row, self.model))
+                    except (KeyError, ValueError) as e:
+                        rejected.append(values + [str(e)])
+                self.store.import_values(rows, time.time())
+                if job.get("deleteFilesAfterImport"):
+                    urllib.request.urlopen(urllib.request.Request(self._url(file["bucket"], file["key"]), method="DELETE"), timeout=60)
+            if rejected:
+                report = io.StringIO()
+                csv.writer(report).writerows(rejected)
+                location = job["errorReportLocation"]
+                key = f"{location['prefix']}{job['jobId']}/errors.csv"
+                urllib.request.urlopen(urllib.request.Request(
+                    self._url(location["bucket"], key), data=report.getvalue().encode(), method="PUT"
+                ), timeout=60)
+        except Exception as e:
+            print(f"Bulk import job {job['jobId']} failed: {e}", flush=True)
+            self._status(job, "FAILED")
+            return
+        self._status(job, "COMPLETED_WITH_FAILURES" if rejected else "COMPLETED")
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_handler(store: Store, behaviour: Behaviour, bulk_imports: BulkImports):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes, Nagle would hold the body for the delayed ACK of the client
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            arrival = time.time()
+            url = urlparse(self.path)
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                request = json.loads(body) if body else {}
+            except ValueError:
+                self._error(400, "SerializationException", "Invalid JSON")
+                return
+            if url.path == "/properties":
+                self._put_values(request, arrival)
+            elif url.path == "/config":
+                try:
+                    behaviour.update(request)
+                except ValueError as e:
+                    self._error(400, "ValidationException", str(e))
+                    return
+                self._reply(200, behaviour.to_dict())
+            elif url.path == "/reset":
+                store.reset()
+                self._reply(200, {})
+            elif url.path == "/jobs":
+                try:
+                    self._reply(202, bulk_imports.create(request))
+                except ValueError as e:
+                    self._error(400, "InvalidRequestException", str(e))
+            else:
+                self._error(404, "ResourceNotFoundException", f"Unknown operation {url.path}")
+
+        def _put_values(self, request: dict, arrival: float):
+            time.sleep(behaviour.delay())
+            if behaviour.throttled():
+                store.count_request("throttled")
+                self._error(429, "ThrottlingException", "Rate exceeded")
+                return
+            if behaviour.request_fails():
+                store.count_request("failed")
+                self._error(500, "InternalFailureException", "Injected failure")
+                return
+            entries = request.get("entries")
+            error = validation_error(entries)
+            if error:
+                store.count_request("failed")
+                self._error(400, "InvalidRequestException", error)
+                return
+            store.count_request()
+
+            accepted, error_entries = [], []
+            for entry in entries:
+                code = behaviour.entry_error()
+                if code:
+                    error_entries.append({
+                        "entryId": entry["entryId"],
+                        "errors": [{"errorCode": code, "errorMessage": "Injected entry error",
+                                    "timestamps": [p.get("timestamp") for p in entry["propertyValues"]]}],
+                    })
+                else:
+                    accepted.append(entry)
+            store.record(entries, accepted, arrival)
+            self._reply(200, {"errorEntries": error_entries})
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            since = float(query.get("since", ["0"])[0])
+            if url.path == "/stats":
+                self._reply(200, dict(store.stats(since), config=behaviour.to_dict()))
+            elif url.path == "/points" and "alias" in query:
+                until = float(query.get("until", ["inf"])[0])
+                self._reply(200, {"points": store.points(query["alias"][0], since, until)})
+            elif url.path.startswith("/jobs/"):
+                job = bulk_imports.describe(url.path[len("/jobs/"):])
+                if job:
+                    self._reply(200, job)
+                else:
+                    self._error(404, "ResourceNotFoundException", "No such bulk import job")
+            elif url.path.rstrip("/") == "/timeseries/describe" and "alias" in query:
+                time_series = bulk_imports.describe_time_series(query["alias"][0])
+                if time_series:
+                    self._reply(200, time_series)
+                else:
+                    self._error(404, "ResourceNotFoundException", f"No time series with alias {query['alias'][0]}")
+            else:
+                self._error(404, "ResourceNotFoundException", f"Unknown operation {url.path}")
+
+        def _error(self, status: int, error_type: str, message: str):
+            self._reply(status, {"message": message}, {"x-amzn-ErrorType": error_type})
+
+        def _reply(self, status: int, body: dict, headers: dict = None):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for SiteWise BatchPutAssetPropertyValue")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--cert", help="PEM certificate for the data endpoint host name, plain HTTP without it")
+    parser.add_argument("--key", help="PEM private key of the certificate")
+    parser.add_argument("--db", default=":memory:", help="SQLite file for received points")
+    parser.add_argument("--latency-ms", type=float, help="Delay added to every response")
+    parser.add_argument("--jitter-ms", type=float, help="Random +/- variation of the delay")
+    parser.add_argument("--max-requests-per-second", type=float, help="Throttle above this request rate, 0 for none")
+    parser.add_argument("--error-rate", type=float, help="Share of requests failing with InternalFailureException")
+    parser.add_argument("--entry-error-rate", type=float, help="Share of entries returned as errorEntries")
+    parser.add_argument("--seed", type=int, help="Seed of the injected delays and errors for reproducible runs")
+    parser.add_argument("--s3-endpoint", help="S3 stand-in URL the bulk import jobs read their files from, e.g. http://localhost:9000")
+    parser.add_argument("--model", help="JSON file of {property alias: data type} known to DescribeTimeSeries and bulk import, "
+                                        "the SiteWiseAsset stack aliases without it")
+    args = parser.parse_args()
+    model = None
+    if args.model:
+        with open(args.model) as f:
+            model = json.load(f)
+
+    behaviour = Behaviour(
+        args.seed,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        max_requests_per_second=args.max_requests_per_second,
+        error_rate=args.error_rate,
+        entry_error_rate=args.entry_error_rate,
+    )
+    store = Store(args.db)
+    server = ThreadingHTTPServer(("", args.port), make_handler(store, behaviour, BulkImports(store, args.s3_endpoint, model)))
+    if args.cert:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(args.cert, args.key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    print(f"SiteWise stand-in listening on port {args.port}, {behaviour.to_dict()}", flush=True)
+    server.serve_forever()